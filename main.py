@@ -1,15 +1,39 @@
-from fastapi import FastAPI
+import time
+
+# Start of the import-to-ready clock printed once the engine has warmed up
+IMPORT_STARTED = time.perf_counter()
+
+from fastapi import FastAPI, Request
 from pydantic import BaseModel
-from fastapi import FastAPI, File, UploadFile
+from fastapi.responses import StreamingResponse, JSONResponse, PlainTextResponse
+from typing import List, Optional
+from datetime import date
+import asyncio
+import json
 import sys
 import os
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '.')))
 
-from scripts.rag_chain import get_rag_chain
+# Only light modules here: LangChain, the NVIDIA endpoints and FAISS are imported by the
+# warmup thread, so the process answers /healthz within a moment of starting
+from scripts.ingest_queue import IngestWorker, get_job
+from scripts import config
+from scripts.concurrency import OverloadedError, SlotTimeoutError
+from scripts.metrics import REGISTRY, status_metrics
+from scripts.warmup import Warmup, NotReadyError
 
 app = FastAPI()
 
+warmup = Warmup(started=IMPORT_STARTED)
+
+def reload_engine(version):
+    from scripts.rag_engine import get_engine
+    # Swap the new index in now rather than waiting for the watcher's next poll
+    get_engine().reload()
+
+ingest_worker = IngestWorker(on_index_updated=reload_engine)
+
 from fastapi.middleware.cors import CORSMiddleware
 
 app.add_middleware(
@@ -20,29 +44,189 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+def iso_date(value):
+    # SearchFilter holds dates as YYYY-MM-DD strings
+    return value.isoformat() if value else None
+
 class Query(BaseModel):
     text: str
+    # Optional search restrictions; when omitted, tickers and years named in the text are used
+    companies: Optional[List[str]] = None
+    start_date: Optional[date] = None  # YYYY-MM-DD, inclusive; anything else is a 422
+    end_date: Optional[date] = None
+    timings: bool = False  # Include per-stage timings (ms) in the response
+
+    def search_filter(self):
+        from scripts.retrieval import SearchFilter
+        companies = tuple(c.upper() for c in self.companies) if self.companies else None
+        return SearchFilter(companies, iso_date(self.start_date), iso_date(self.end_date))
+
+class BatchQuery(BaseModel):
+    questions: List[str]
+    companies: Optional[List[str]] = None  # Every question is asked once per company
+    start_date: Optional[date] = None
+    end_date: Optional[date] = None
+    max_concurrency: Optional[int] = None  # Capped at BATCH_MAX_CONCURRENCY
+
+@app.on_event("startup")
+def start_background_work():
+    print(f"API imported in {time.perf_counter() - IMPORT_STARTED:.2f}s")
+    # The engine loads in the background; until it is ready, query endpoints answer 503
+    warmup.start()
+    ingest_worker.start()
+
+@app.on_event("shutdown")
+def stop_background_work():
+    warmup.stop()
+    ingest_worker.stop()
+
+def busy_response(status_code, message):
+    # Fast rejection so clients back off instead of piling onto a saturated worker
+    return JSONResponse(status_code=status_code, content={"error": message}, headers={"Retry-After": "1"})
 
 @app.post("/query")
-def query_rag(query: Query):
+async def query_rag(query: Query):
     try:
-        rag_chain = get_rag_chain()
-        response = rag_chain.invoke(query.text)
-        return {"response": response['result']}
+        response = await warmup.engine().ainvoke(query.text, query.search_filter())
+        body = {
+            "response": response['result'],
+            "filter": response['filter']._asdict() if response['filter'] else None,
+            "cached": response['cached'],
+            # Prompt tokens before/after context packing; absent for cached answers
+            "context": response.get('context'),
+        }
+        if query.timings:
+            body["timings"] = response['timings']
+        return body
+    except OverloadedError as e:
+        return busy_response(429, str(e))
+    except (SlotTimeoutError, NotReadyError) as e:
+        return busy_response(503, str(e))
+    except asyncio.TimeoutError:
+        return JSONResponse(status_code=504, content={"error": "The query timed out."})
     except Exception as e:
         return {"error": str(e)}
 
-@app.post("/upload-document")
-async def upload_document(file: UploadFile = File(...)):
-    upload_dir = "./Call_Transcripts/Uploaded"
-    if not os.path.exists(upload_dir):
-        os.makedirs(upload_dir)
+def sse_event(event):
+    if event["type"] == "sources":
+        event = {
+            "type": "sources",
+            "sources": [{"page_content": d.page_content, "metadata": d.metadata} for d in event["source_documents"]],
+            "filter": event["filter"]._asdict() if event["filter"] else None,
+            "cached": event["cached"],
+            "context": event.get("context"),
+        }
+    return f"data: {json.dumps(event, default=str)}\n\n"
+
+@app.post("/query/stream")
+async def query_rag_stream(query: Query):
+    try:
+        engine = warmup.engine()
+    except NotReadyError as e:
+        return busy_response(503, str(e))
+    if engine.llm_limiter.is_full():
+        return busy_response(429, "Too many queued LLM requests, try again later.")
+
+    # Server-Sent Events: the retrieved sources first, then LLM tokens as they arrive
+    async def events():
+        stream = engine.astream(query.text, query.search_filter())
+        deadline = asyncio.get_running_loop().time() + config.QUERY_TIMEOUT_SECONDS
+        try:
+            while True:
+                remaining = deadline - asyncio.get_running_loop().time()
+                try:
+                    event = await asyncio.wait_for(stream.__anext__(), max(remaining, 0))
+                except StopAsyncIteration:
+                    break
+                if not query.timings:
+                    event.pop("timings", None)
+                yield sse_event(event)
+        except asyncio.TimeoutError:
+            yield sse_event({"type": "error", "error": "The query timed out."})
+        except Exception as e:
+            yield sse_event({"type": "error", "error": str(e)})
 
-    file_path = os.path.join(upload_dir, file.filename)
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+@app.post("/query/batch")
+async def query_batch(batch: BatchQuery):
     try:
-        with open(file_path, "wb") as buffer:
-            buffer.write(await file.read())
+        engine = warmup.engine()
+    except NotReadyError as e:
+        return busy_response(503, str(e))
+    from scripts.batch_qa import build_batch, run_batch
+    items = build_batch(batch.questions, batch.companies, iso_date(batch.start_date), iso_date(batch.end_date))
+    if len(items) > config.BATCH_MAX_QUESTIONS:
+        return JSONResponse(status_code=413, content={"error": f"{len(items)} questions exceed the batch limit of {config.BATCH_MAX_QUESTIONS}."})
+    concurrency = min(batch.max_concurrency or config.BATCH_MAX_CONCURRENCY, config.BATCH_MAX_CONCURRENCY)
+
+    # One JSON line per question, in the order they finish
+    async def lines():
+        async for record in run_batch(engine, items, concurrency):
+            yield json.dumps(record, default=str) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+@app.get("/healthz")
+def healthz():
+    # Liveness: the process is up and serving; says nothing about the engine
+    return {"status": "ok", "phase": warmup.phase}
 
-        return {"message": f"File '{file.filename}' uploaded successfully."}
+@app.get("/readyz")
+def readyz():
+    # Readiness: 503 until the index is loaded and the optional warmup query has run
+    status = warmup.status()
+    if not status["ready"]:
+        return JSONResponse(status_code=503, content=status)
+    return status
+
+@app.get("/index-status")
+def index_status():
+    try:
+        return warmup.engine().status()
+    except NotReadyError as e:
+        return busy_response(503, str(e))
     except Exception as e:
-        return {"detail": str(e), "message": "An error occurred during file processing"}
\ No newline at end of file
+        return {"error": str(e)}
+
+@app.get("/metrics")
+def metrics():
+    # Prometheus text format; cache and limiter figures are read from the engine at scrape time.
+    # Always 200, so a warming instance isn't marked down and its other metrics still get scraped.
+    try:
+        extra = status_metrics(warmup.engine().status())
+    except Exception:
+        extra = []
+    return PlainTextResponse(REGISTRY.render(extra), media_type="text/plain; version=0.0.4")
+
+@app.post("/upload-document")
+async def upload_document(request: Request):
+    # multipart/form-data with one or more .txt transcripts, or .zip/.tar(.gz) archives of transcript folders,
+    # under any field name. The body is streamed to disk; transcripts already indexed or queued are skipped.
+    from scripts.uploads import receive_uploads, UploadError
+    try:
+        results = await receive_uploads(request)
+    except UploadError as e:
+        return JSONResponse(status_code=e.status_code, content={"error": str(e)})
+    except Exception as e:
+        return {"detail": str(e), "message": "An error occurred during file processing"}
+
+    job_ids = [result["job_id"] for result in results if result["status"] == "queued"]
+    if job_ids:
+        ingest_worker.notify()
+    counts = {status: sum(result["status"] == status for result in results) for status in ("queued", "duplicate", "rejected")}
+    response = {
+        "message": f"{counts['queued']} file(s) queued for indexing, {counts['duplicate']} duplicate(s) skipped, {counts['rejected']} rejected.",
+        "files": results,
+        "job_ids": job_ids,
+    }
+    if len(job_ids) == 1:
+        response["job_id"] = job_ids[0]
+    return response
+
+@app.get("/upload-status/{job_id}")
+def upload_status(job_id: int):
+    job = get_job(job_id)
+    if job is None:
+        return {"error": f"Job {job_id} not found."}
+    return job
@@ -0,0 +1,162 @@
+import json
+import time
+import sqlite3
+import threading
+import numpy as np
+from langchain.docstore.document import Document
+from scripts import config
+
+
+class SemanticAnswerCache:
+    """Answers of earlier questions, looked up by query-embedding similarity and persisted in SQLite.
+
+    Entries are only reused for the same index version and search filter, expire after
+    ttl_seconds, and the least recently used ones are evicted beyond max_entries.
+    """
+
+    def __init__(self, db_path=None, threshold=None, max_entries=None, ttl_seconds=None):
+        self.db_path = db_path or config.ANSWER_CACHE_DB
+        self.threshold = config.ANSWER_CACHE_THRESHOLD if threshold is None else threshold
+        self.max_entries = max_entries or config.ANSWER_CACHE_MAX_ENTRIES
+        self.ttl_seconds = config.ANSWER_CACHE_TTL_SECONDS if ttl_seconds is None else ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.index_version = None
+        self._lock = threading.Lock()
+        self._ids = []
+        self._filter_keys = []
+        self._created = np.zeros(0)
+        self._vectors = np.zeros((0, 0), dtype=np.float32)
+        self._init_db()
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path)
+
+    def _init_db(self):
+        conn = self._connect()
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS answer_cache (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                query TEXT NOT NULL,
+                filter_key TEXT NOT NULL,
+                embedding BLOB NOT NULL,
+                answer TEXT NOT NULL,
+                sources TEXT NOT NULL,
+                index_version TEXT,
+                created_at REAL NOT NULL,
+                last_used REAL NOT NULL
+            )
+        ''')
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_answer_cache_last_used ON answer_cache (last_used)")
+        conn.commit()
+        conn.close()
+
+    def set_index_version(self, version):
+        """Drop answers produced against any other index version and load the rest into memory."""
+        with self._lock:
+            self.index_version = version
+            conn = self._connect()
+            conn.execute("DELETE FROM answer_cache WHERE index_version IS NOT ?", (version,))
+            if self.ttl_seconds:
+                conn.execute("DELETE FROM answer_cache WHERE created_at < ?", (time.time() - self.ttl_seconds,))
+            conn.commit()
+            rows = conn.execute("SELECT id, filter_key, embedding, created_at FROM answer_cache ORDER BY id").fetchall()
+            conn.close()
+            self._ids = [row[0] for row in rows]
+            self._filter_keys = [row[1] for row in rows]
+            self._created = np.array([row[3] for row in rows], dtype=np.float64)
+            vectors = [np.frombuffer(row[2], dtype=np.float32) for row in rows]
+            self._vectors = np.vstack(vectors) if vectors else np.zeros((0, 0), dtype=np.float32)
+
+    @staticmethod
+    def filter_key(search_filter):
+        return json.dumps(search_filter._asdict() if search_filter else None, sort_keys=True)
+
+    @staticmethod
+    def _normalize(query_vector):
+        vector = np.asarray(query_vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def get(self, query_vector, search_filter=None):
+        key = self.filter_key(search_filter)
+        vector = self._normalize(query_vector)
+        with self._lock:
+            entry_id = None
+            if len(self._ids) and self._vectors.shape[1] == len(vector):
+                similarities = self._vectors @ vector
+                valid = np.array([k == key for k in self._filter_keys])
+                if self.ttl_seconds:
+                    valid &= self._created >= time.time() - self.ttl_seconds
+                similarities[~valid] = -1
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.threshold:
+                    entry_id = self._ids[best]
+            if entry_id is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+
+        conn = self._connect()
+        conn.execute("UPDATE answer_cache SET last_used = ? WHERE id = ?", (time.time(), entry_id))
+        conn.commit()
+        row = conn.execute("SELECT query, answer, sources FROM answer_cache WHERE id = ?", (entry_id,)).fetchone()
+        conn.close()
+        if row is None:
+            return None
+        sources = [Document(page_content=s["page_content"], metadata=s["metadata"]) for s in json.loads(row[2])]
+        return {"cached_query": row[0], "result": row[1], "source_documents": sources}
+
+    def put(self, query, query_vector, search_filter, answer, source_documents):
+        key = self.filter_key(search_filter)
+        vector = self._normalize(query_vector)
+        sources = json.dumps([{"page_content": d.page_content, "metadata": d.metadata} for d in source_documents], default=str)
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            cursor = conn.execute(
+                "INSERT INTO answer_cache (query, filter_key, embedding, answer, sources, index_version, created_at, last_used) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (query, key, vector.tobytes(), answer, sources, self.index_version, now, now)
+            )
+            entry_id = cursor.lastrowid
+            # Evict least recently used entries beyond the size limit
+            evicted = conn.execute(
+                "SELECT id FROM answer_cache ORDER BY last_used DESC LIMIT -1 OFFSET ?", (self.max_entries,)
+            ).fetchall()
+            conn.executemany("DELETE FROM answer_cache WHERE id = ?", evicted)
+            conn.commit()
+            conn.close()
+
+            if self._vectors.size == 0 or self._vectors.shape[1] != len(vector):
+                self._ids, self._filter_keys, self._created = [], [], np.zeros(0)
+                self._vectors = np.zeros((0, len(vector)), dtype=np.float32)
+            self._ids.append(entry_id)
+            self._filter_keys.append(key)
+            self._created = np.append(self._created, now)
+            self._vectors = np.vstack([self._vectors, vector])
+            if evicted:
+                evicted_ids = {row[0] for row in evicted}
+                keep = [i for i, existing in enumerate(self._ids) if existing not in evicted_ids]
+                self._ids = [self._ids[i] for i in keep]
+                self._filter_keys = [self._filter_keys[i] for i in keep]
+                self._created = self._created[keep]
+                self._vectors = self._vectors[keep]
+
+    def clear(self):
+        with self._lock:
+            conn = self._connect()
+            conn.execute("DELETE FROM answer_cache")
+            conn.commit()
+            conn.close()
+            self._ids, self._filter_keys, self._created = [], [], np.zeros(0)
+            self._vectors = np.zeros((0, 0), dtype=np.float32)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._ids),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "threshold": self.threshold,
+        }
@@ -0,0 +1,65 @@
+import os
+import json
+import hashlib
+from scripts.retrieval import SearchFilter
+
+
+def build_batch(questions, companies=None, start_date=None, end_date=None):
+    """Unique (id, question, search_filter) items, asking every question once per company when companies are given.
+
+    Questions that differ only in case or whitespace are duplicates; the first spelling is kept.
+    Ids are derived from the question and filter, so they stay the same between runs.
+    """
+    unique = {}
+    for question in questions:
+        question = " ".join(question.split())
+        if question:
+            unique.setdefault(question.lower(), question)
+
+    items = []
+    for company in companies or [None]:
+        search_filter = SearchFilter((company.upper(),) if company else None, start_date, end_date)
+        for key, question in unique.items():
+            digest = hashlib.sha1(json.dumps([key, search_filter]).encode("utf-8")).hexdigest()[:16]
+            items.append((digest, question, search_filter))
+    return items
+
+
+def batch_record(item_id, question, search_filter, response):
+    record = {"id": item_id, "question": question, "companies": search_filter.companies,
+              "start_date": search_filter.start_date, "end_date": search_filter.end_date}
+    if "error" in response:
+        record["error"] = response["error"]
+        return record
+    record.update({
+        "answer": response["result"],
+        "cached": response["cached"],
+        "filter": response["filter"]._asdict() if response["filter"] else None,
+        "sources": [{key: doc.metadata.get(key) for key in ("company", "date", "source", "excerpt")} for doc in response["source_documents"]],
+        "timings": response.get("timings"),
+    })
+    return record
+
+
+async def run_batch(engine, items, max_concurrency=None, share_limits=False):
+    """Yield the record of each item as soon as it is answered."""
+    requests = [(question, search_filter) for _, question, search_filter in items]
+    async for i, response in engine.abatch(requests, max_concurrency, share_limits):
+        yield batch_record(*items[i], response)
+
+
+def completed_ids(output_path):
+    """Ids answered by earlier runs into output_path; questions that failed are not included, so they are retried."""
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # A line cut short when an earlier run was killed
+                continue
+            if "error" not in record:
+                done.add(record["id"])
+    return done
@@ -0,0 +1,92 @@
+"""Answer a list of questions in bulk, optionally once per company, and write the answers to JSONL.
+
+    python scripts/batch_query.py questions.txt --output answers.jsonl
+    python scripts/batch_query.py questions.txt --all-companies --concurrency 8 --output q3_answers.jsonl
+    python scripts/batch_query.py questions.txt --companies AAPL,MSFT --start-date 2020-01-01
+
+questions.txt has one question per line; blank lines and lines starting with # are skipped.
+Answers are appended as they finish. Re-running with the same output file skips questions that
+were already answered and retries the ones that failed.
+"""
+import sys
+import os
+import json
+import time
+import asyncio
+import argparse
+from datetime import date
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from scripts import config
+from scripts.rag_engine import RAGEngine
+from scripts.batch_qa import build_batch, run_batch, completed_ids
+
+
+def iso_date(value):
+    # Reject a malformed date up front rather than silently searching everything or nothing
+    try:
+        return date.fromisoformat(value).isoformat()
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"{value!r} is not a YYYY-MM-DD date")
+
+
+def read_questions(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip() and not line.lstrip().startswith("#")]
+
+
+async def batch_query(questions_path, output_path, companies=None, all_companies=False, start_date=None, end_date=None, concurrency=None):
+    engine = RAGEngine()
+    if all_companies:
+        companies = engine.companies
+    items = build_batch(read_questions(questions_path), companies, start_date, end_date)
+    done = completed_ids(output_path)
+    pending = [item for item in items if item[0] not in done]
+    print(f"{len(items)} unique questions, {len(items) - len(pending)} already answered, {len(pending)} to run "
+          f"with up to {concurrency or config.BATCH_MAX_CONCURRENCY} at a time.")
+    if not pending:
+        return
+
+    # Start on a fresh line if an earlier run was killed mid-write
+    torn_line = False
+    if os.path.exists(output_path) and os.path.getsize(output_path):
+        with open(output_path, "rb") as f:
+            f.seek(-1, os.SEEK_END)
+            torn_line = f.read(1) != b"\n"
+
+    answered = failed = 0
+    start = time.perf_counter()
+    with open(output_path, "a", encoding="utf-8") as f:
+        if torn_line:
+            f.write("\n")
+        # This process answers nothing else, so the batch may use the interactive LLM and rerank limits
+        async for record in run_batch(engine, pending, concurrency, share_limits=True):
+            f.write(json.dumps(record, default=str) + "\n")
+            f.flush()
+            if "error" in record:
+                failed += 1
+                print(f"Failed: {record['question']!r} ({record['companies']}): {record['error']}")
+            else:
+                answered += 1
+            if (answered + failed) % 20 == 0:
+                elapsed = time.perf_counter() - start
+                print(f"{answered + failed}/{len(pending)} done, {answered / elapsed * 60:.1f} questions/min")
+
+    elapsed = time.perf_counter() - start
+    print(f"Answered {answered} questions ({failed} failed) in {elapsed:.1f}s: {answered / elapsed * 60:.1f} questions/min. Results in {output_path}")
+    if failed:
+        print("Run the same command again to retry the failed questions.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Answer a list of questions in bulk and write the results to JSONL.")
+    parser.add_argument("questions", help="Text file with one question per line")
+    parser.add_argument("--output", default="batch_answers.jsonl", help="JSONL file to append answers to (default: batch_answers.jsonl)")
+    parser.add_argument("--companies", help="Comma-separated tickers; every question is asked once per ticker")
+    parser.add_argument("--all-companies", action="store_true", help="Ask every question once per ticker in the index")
+    parser.add_argument("--start-date", type=iso_date, help="Only use calls on or after this date (YYYY-MM-DD)")
+    parser.add_argument("--end-date", type=iso_date, help="Only use calls on or before this date (YYYY-MM-DD)")
+    parser.add_argument("--concurrency", type=int, help="Questions reranked and answered at once (default: BATCH_MAX_CONCURRENCY)")
+    args = parser.parse_args()
+
+    asyncio.run(batch_query(args.questions, args.output, args.companies.split(",") if args.companies else None,
+                            args.all_companies, args.start_date, args.end_date, args.concurrency))
@@ -0,0 +1,344 @@
+"""Offline benchmarks for chunking, index build/load, retrieval and end-to-end query latency.
+
+    python scripts/benchmark.py
+    python scripts/benchmark.py --companies AAPL,AMD --queries 300 --clients 16 --requests 400
+    python scripts/benchmark.py --index-type hnsw --llm-latency-ms 400 --baseline benchmarks/20261001-120000.json
+
+The embedding, rerank and chat models are served by scripts/stub_model_server.py, and the index,
+caches and queue database live in a temporary directory, so a run needs no network and leaves the
+working tree alone. Retrieval is measured with known-item queries (a run of words from a chunk,
+expected to find that chunk), and the load test runs clients against main.py under uvicorn.
+Results are saved as JSON in benchmarks/ together with the git commit and settings.
+"""
+import sys
+import os
+import json
+import time
+import random
+import socket
+import shutil
+import argparse
+import tempfile
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import requests
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(ROOT)
+
+RECALL_KS = (1, 5, 10)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for(url, timeout, process=None, is_ready=lambda body: "error" not in body):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError(f"{url}: process exited with code {process.returncode}")
+        try:
+            response = requests.get(url, timeout=2)
+            if response.ok and is_ready(response.json()):
+                return
+        except (requests.RequestException, ValueError):
+            pass
+        time.sleep(0.25)
+    raise TimeoutError(f"{url} not ready after {timeout}s")
+
+
+def configure_environment(work_dir, stub_port):
+    # scripts.config reads the environment once on import, so this runs before any scripts module is loaded
+    os.environ.update({
+        "NVIDIA_API_BASE": f"http://127.0.0.1:{stub_port}/v1",
+        "NVIDIA_API_KEY": "stub",
+        "FAISS_INDEX_PATH": os.path.join(work_dir, "faiss_index"),
+        "EMBED_CHECKPOINT_DIR": os.path.join(work_dir, "embedding_checkpoints"),
+        "EMBEDDING_CACHE_DIR": os.path.join(work_dir, "embedding_cache"),
+        "ANSWER_CACHE_DB": os.path.join(work_dir, "answer_cache.db"),
+        "INGEST_QUEUE_DB": os.path.join(work_dir, "ingest_jobs.db"),
+        # Every query should run the whole pipeline
+        "ANSWER_CACHE_ENABLED": "false",
+    })
+
+
+def latency_summary(samples_ms):
+    samples = np.asarray(samples_ms, dtype=np.float64)
+    if not len(samples):
+        return {"count": 0}
+    return {
+        "count": len(samples),
+        "mean_ms": round(float(samples.mean()), 2),
+        "p50_ms": round(float(np.percentile(samples, 50)), 2),
+        "p95_ms": round(float(np.percentile(samples, 95)), 2),
+        "p99_ms": round(float(np.percentile(samples, 99)), 2),
+        "max_ms": round(float(samples.max()), 2),
+    }
+
+
+def directory_size(path):
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, files in os.walk(path) for name in files)
+
+
+def benchmark_ingest(file_paths, index_params, workers, load_repeats=5):
+    from scripts import config
+    from scripts.preprocess import iter_chunked_files
+    from scripts.embed_and_index import embed_and_index, get_embedding_model
+    from scripts.rag_chain import load_vectorstore
+    from scripts.index_store import current_index_dir
+
+    input_bytes = sum(os.path.getsize(path) for path in file_paths)
+    start = time.perf_counter()
+    chunks = sum(len(documents) for _, documents in iter_chunked_files(file_paths, workers))
+    chunk_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    embed_and_index(file_paths=file_paths, workers=workers, index_params=index_params)
+    build_seconds = time.perf_counter() - start
+
+    embedding_model = get_embedding_model()
+    load_seconds = []
+    for _ in range(load_repeats):
+        start = time.perf_counter()
+        load_vectorstore(embedding_model, config.FAISS_INDEX_PATH)
+        load_seconds.append(time.perf_counter() - start)
+
+    return {
+        "files": len(file_paths),
+        "input_mb": round(input_bytes / 1e6, 2),
+        "chunks": chunks,
+        "chunking": {
+            "seconds": round(chunk_seconds, 3),
+            "chunks_per_second": round(chunks / chunk_seconds, 1),
+            "mb_per_second": round(input_bytes / 1e6 / chunk_seconds, 2),
+        },
+        "index_build": {
+            "seconds": round(build_seconds, 3),
+            "chunks_per_second": round(chunks / build_seconds, 1),
+            "index_mb": round(directory_size(current_index_dir(config.FAISS_INDEX_PATH)) / 1e6, 2),
+        },
+        "index_load": {
+            "median_seconds": round(float(np.median(load_seconds)), 4),
+            "min_seconds": round(min(load_seconds), 4),
+        },
+    }
+
+
+def make_queries(vectorstore, count, seed=0, words=12):
+    """Known-item queries: a run of words from the middle of random chunks, keyed by the chunk's chunk_id."""
+    from scripts.retrieval import load_documents
+
+    rng = random.Random(seed)
+    positions = rng.sample(range(vectorstore.index.ntotal), min(count, vectorstore.index.ntotal))
+    queries = []
+    for doc in load_documents(vectorstore, positions):
+        tokens = doc.page_content.split()
+        # The middle of a chunk is outside the overlap it shares with its neighbours
+        start = max(0, len(tokens) // 2 - words // 2)
+        queries.append((" ".join(tokens[start:start + words]), doc.metadata["chunk_id"]))
+    return queries
+
+
+def recall_at(found_ids, expected_id):
+    return {k: expected_id in found_ids[:k] for k in RECALL_KS}
+
+
+def benchmark_retrieval(query_count, seed):
+    from scripts import config
+    from scripts.rag_engine import RAGEngine
+
+    engine = RAGEngine()
+    state = engine.state
+    queries = make_queries(state.vectorstore, query_count, seed)
+
+    timings = {"embed_query": [], "search": [], "rerank": []}
+    hits = {"search": {k: 0 for k in RECALL_KS}, "reranked": {k: 0 for k in RECALL_KS}}
+    for query, expected_id in queries:
+        start = time.perf_counter()
+        query_vector = engine.embedding_model.embed_query(query)
+        embedded = time.perf_counter()
+        search_filter = engine.resolve_filter(query, None, state)
+        candidates = engine._search(query, query_vector, search_filter, state)
+        searched = time.perf_counter()
+        documents = engine.rerank(query, candidates, query_vector) if candidates else []
+        reranked = time.perf_counter()
+        timings["embed_query"].append((embedded - start) * 1000)
+        timings["search"].append((searched - embedded) * 1000)
+        timings["rerank"].append((reranked - searched) * 1000)
+
+        for name, results in (("search", candidates), ("reranked", documents)):
+            for k, hit in recall_at([doc.metadata.get("chunk_id") for doc in results], expected_id).items():
+                hits[name][k] += hit
+
+    return {
+        "queries": len(queries),
+        "latency": {name: latency_summary(samples) for name, samples in timings.items()},
+        "recall": {name: {f"at_{k}": round(count / len(queries), 3) for k, count in counts.items()} for name, counts in hits.items()},
+        "rerank_candidates": config.RERANK_CANDIDATES if state.bm25_index is not None else config.RETRIEVAL_K,
+        "rerank_cascade": engine.status()["rerank_cascade"],
+    }, [query for query, _ in queries]
+
+
+def benchmark_load(queries, clients, request_count, api_workers, timeout=120):
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--workers", str(api_workers), "--log-level", "warning"],
+        cwd=ROOT, env=os.environ.copy(),
+    )
+    try:
+        wait_for(f"{base_url}/readyz", timeout, server, is_ready=lambda body: body.get("ready"))
+
+        def send(query):
+            start = time.perf_counter()
+            try:
+                response = requests.post(f"{base_url}/query", json={"text": query}, timeout=timeout)
+                ok = response.ok and "error" not in response.json()
+                status = response.status_code
+            except requests.RequestException:
+                ok, status = False, None
+            return (time.perf_counter() - start) * 1000, ok, status
+
+        with ThreadPoolExecutor(max_workers=clients) as executor:
+            # Warm up connections, the engine and the workers' caches before measuring
+            list(executor.map(send, queries[:clients]))
+            workload = [queries[i % len(queries)] for i in range(request_count)]
+            start = time.perf_counter()
+            results = list(executor.map(send, workload))
+            elapsed = time.perf_counter() - start
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+    statuses = {}
+    for _, ok, status in results:
+        if not ok:
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+    return {
+        "clients": clients,
+        "api_workers": api_workers,
+        "requests": len(results),
+        "errors": sum(not ok for _, ok, _ in results),
+        "error_statuses": statuses,
+        "seconds": round(elapsed, 3),
+        "requests_per_second": round(len(results) / elapsed, 2),
+        "latency": latency_summary([ms for ms, ok, _ in results if ok]),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def flatten(results, prefix=""):
+    values = {}
+    for key, value in results.items():
+        if isinstance(value, dict):
+            values.update(flatten(value, f"{prefix}{key}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            values[f"{prefix}{key}"] = value
+    return values
+
+
+def compare(results, baseline):
+    """Print every numeric result that differs from the baseline run."""
+    current, previous = flatten(results), flatten(baseline)
+    print(f"\nChanges since {baseline.get('timestamp')} ({baseline.get('git_commit')}):")
+    for key in sorted(current.keys() & previous.keys()):
+        if key.startswith(("settings.", "stub_latency_ms.")) or current[key] == previous[key]:
+            continue
+        change = f"{(current[key] - previous[key]) / previous[key] * 100:+.1f}%" if previous[key] else "new"
+        print(f"  {key}: {previous[key]} -> {current[key]} ({change})")
+
+
+def run(args):
+    # Transcript and upload paths in config are relative to the repository root
+    os.chdir(ROOT)
+    work_dir = tempfile.mkdtemp(prefix="rag-benchmark-")
+    stub_port = free_port()
+    configure_environment(work_dir, stub_port)
+    stub = subprocess.Popen([
+        sys.executable, os.path.join(ROOT, "scripts", "stub_model_server.py"), "--port", str(stub_port),
+        "--embed-latency-ms", str(args.embed_latency_ms), "--rerank-latency-ms", str(args.rerank_latency_ms),
+        "--llm-latency-ms", str(args.llm_latency_ms),
+    ])
+    try:
+        wait_for(f"http://127.0.0.1:{stub_port}/v1/models", 30, stub)
+        from scripts import config
+        from scripts.preprocess import list_transcript_files
+        from scripts.faiss_index import default_index_params
+
+        file_paths = []
+        for company in (args.companies.split(",") if args.companies else [None]):
+            file_paths.extend(list_transcript_files(company))
+        if args.max_files:
+            file_paths = file_paths[:args.max_files]
+        index_params = default_index_params(args.index_type)
+
+        results = {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "git_commit": git_commit(),
+            "settings": {
+                "index_type": index_params["type"],
+                "chunk_size": config.CHUNK_SIZE,
+                "chunk_overlap": config.CHUNK_OVERLAP,
+                "retrieval_k": config.RETRIEVAL_K,
+                "rerank_top_n": config.RERANK_TOP_N,
+                "hybrid_search": config.HYBRID_SEARCH,
+                "micro_batching": config.MICRO_BATCHING,
+                "rerank_cascade": config.RERANK_CASCADE,
+                "context_packing": config.CONTEXT_PACKING,
+                "preprocess_workers": args.workers or config.PREPROCESS_WORKERS,
+            },
+            "stub_latency_ms": {"embeddings": args.embed_latency_ms, "ranking": args.rerank_latency_ms, "chat": args.llm_latency_ms},
+        }
+        print(f"Benchmarking {len(file_paths)} transcripts in {work_dir}")
+        results["ingest"] = benchmark_ingest(file_paths, index_params, args.workers)
+        results["retrieval"], queries = benchmark_retrieval(args.queries, args.seed)
+        if args.requests:
+            results["load"] = benchmark_load(queries, args.clients, args.requests, args.api_workers)
+    finally:
+        stub.terminate()
+        stub.wait(timeout=10)
+        if not args.keep:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark ingest, retrieval and end-to-end latency against stub models.")
+    parser.add_argument("--companies", help="Comma-separated tickers to index (default: all transcripts)")
+    parser.add_argument("--max-files", type=int, help="Index at most this many transcripts")
+    parser.add_argument("--workers", type=int, help="Chunking processes (default: PREPROCESS_WORKERS)")
+    parser.add_argument("--index-type", help="FAISS index type to build (default: FAISS_INDEX_TYPE)")
+    parser.add_argument("--queries", type=int, default=200, help="Known-item retrieval queries")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--clients", type=int, default=8, help="Concurrent clients in the load test")
+    parser.add_argument("--requests", type=int, default=200, help="Load test requests (0 skips the load test)")
+    parser.add_argument("--api-workers", type=int, default=1, help="uvicorn workers serving main.py")
+    parser.add_argument("--embed-latency-ms", type=float, default=0, help="Simulated embedding round trip")
+    parser.add_argument("--rerank-latency-ms", type=float, default=0, help="Simulated rerank round trip")
+    parser.add_argument("--llm-latency-ms", type=float, default=0, help="Simulated LLM round trip")
+    parser.add_argument("--output", help="Result file (default: benchmarks/<timestamp>.json)")
+    parser.add_argument("--baseline", help="Earlier result file to compare against")
+    parser.add_argument("--keep", action="store_true", help="Keep the temporary index and caches")
+    args = parser.parse_args()
+
+    results = run(args)
+    output = args.output or os.path.join(ROOT, "benchmarks", time.strftime("%Y%m%d-%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(json.dumps({key: results[key] for key in ("ingest", "retrieval", "load") if key in results}, indent=2))
+    print(f"Results saved to {output}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            compare(results, json.load(f))
@@ -0,0 +1,110 @@
+import re
+import math
+from collections import Counter, defaultdict
+import numpy as np
+
+BM25_INDEX_FILE = "bm25.npz"
+
+# Keeps tickers, figures and decimals ("q3", "2016", "42.5") as single tokens
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[.'][a-z0-9]+)*")
+STOPWORDS = frozenset(
+    "a an and are as at be but by for from has have in is it its of on or so that the this to was we were what which with you our".split()
+)
+
+
+def tokenize(text):
+    return [token for token in TOKEN_PATTERN.findall(text.lower()) if token not in STOPWORDS]
+
+
+class BM25Index:
+    """Compact inverted index over the chunks of a FAISS index; document ids are FAISS row positions."""
+
+    def __init__(self, terms, term_offsets, postings_docs, postings_tfs, doc_lengths, k1=1.5, b=0.75):
+        self.term_ids = {term: i for i, term in enumerate(terms)}
+        self.term_offsets = term_offsets
+        self.postings_docs = postings_docs
+        self.postings_tfs = postings_tfs
+        self.doc_lengths = doc_lengths
+        self.k1 = k1
+        self.b = b
+        self.num_docs = len(doc_lengths)
+        self.avg_doc_length = float(doc_lengths.mean()) if self.num_docs else 0.0
+        self._terms = terms
+
+    @classmethod
+    def build(cls, texts):
+        postings = defaultdict(list)
+        doc_lengths = []
+        for doc, text in enumerate(texts):
+            tokens = tokenize(text)
+            doc_lengths.append(len(tokens))
+            for term, tf in Counter(tokens).items():
+                postings[term].append((doc, tf))
+
+        terms = sorted(postings)
+        term_offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        for i, term in enumerate(terms):
+            term_offsets[i + 1] = term_offsets[i] + len(postings[term])
+        postings_docs = np.empty(term_offsets[-1], dtype=np.int32)
+        postings_tfs = np.empty(term_offsets[-1], dtype=np.uint16)
+        for i, term in enumerate(terms):
+            entries = postings[term]
+            postings_docs[term_offsets[i]:term_offsets[i + 1]] = [doc for doc, _ in entries]
+            postings_tfs[term_offsets[i]:term_offsets[i + 1]] = [min(tf, 65535) for _, tf in entries]
+        return cls(terms, term_offsets, postings_docs, postings_tfs, np.asarray(doc_lengths, dtype=np.int32))
+
+    @classmethod
+    def from_vectorstore(cls, vectorstore):
+        ids = [vectorstore.index_to_docstore_id[i] for i in range(vectorstore.index.ntotal)]
+        docstore = vectorstore.docstore
+        if hasattr(docstore, "mget"):
+            # Chunk store: read texts in batches rather than one query per chunk
+            texts = (doc.page_content for start in range(0, len(ids), 1000) for doc in docstore.mget(ids[start:start + 1000]))
+        else:
+            texts = (docstore.search(chunk_id).page_content for chunk_id in ids)
+        return cls.build(texts)
+
+    def save(self, path):
+        vocabulary = np.frombuffer("\n".join(self._terms).encode("utf-8"), dtype=np.uint8)
+        with open(path, "wb") as f:
+            np.savez(f, vocabulary=vocabulary, term_offsets=self.term_offsets, postings_docs=self.postings_docs,
+                     postings_tfs=self.postings_tfs, doc_lengths=self.doc_lengths)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            vocabulary = data["vocabulary"].tobytes().decode("utf-8")
+            terms = vocabulary.split("\n") if vocabulary else []
+            return cls(terms, data["term_offsets"], data["postings_docs"], data["postings_tfs"], data["doc_lengths"])
+
+    def search(self, query, k, mask=None):
+        """Top-k (row positions, scores) for the query, optionally restricted to rows where mask is True."""
+        scores = np.zeros(self.num_docs, dtype=np.float32)
+        for term in set(tokenize(query)):
+            term_id = self.term_ids.get(term)
+            if term_id is None:
+                continue
+            start, end = self.term_offsets[term_id], self.term_offsets[term_id + 1]
+            docs = self.postings_docs[start:end]
+            tfs = self.postings_tfs[start:end].astype(np.float32)
+            df = end - start
+            idf = math.log(1 + (self.num_docs - df + 0.5) / (df + 0.5))
+            norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[docs] / self.avg_doc_length)
+            scores[docs] += idf * tfs * (self.k1 + 1) / (tfs + norm)
+
+        if mask is not None:
+            scores[~mask] = 0
+        candidates = np.flatnonzero(scores)
+        if len(candidates) > k:
+            candidates = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+        order = candidates[np.argsort(-scores[candidates], kind="stable")]
+        return order, scores[order]
+
+
+def reciprocal_rank_fusion(rankings, k=60):
+    """Fuse several ranked lists of ids; an id's score is the sum of 1 / (k + rank) over the lists."""
+    fused = defaultdict(float)
+    for ranking in rankings:
+        for rank, item in enumerate(ranking):
+            fused[item] += 1.0 / (k + rank + 1)
+    return sorted(fused, key=fused.get, reverse=True)
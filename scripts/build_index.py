@@ -0,0 +1,88 @@
+"""Rebuild the FAISS index at FAISS_INDEX_PATH as another index type, without re-embedding.
+
+    python scripts/build_index.py --index-type ivf_pq --nlist 1024 --pq-m 64 --train-size 100000
+    python scripts/build_index.py --index-type hnsw --hnsw-m 32 --output ./faiss_index_hnsw
+
+Vectors are read back from the current index, so convert from an exact index (flat, hnsw,
+ivf_flat); converting from a PQ/SQ index would compound its quantization error. The docstore,
+manifest and BM25 index carry over, and a new index version is published for running servers.
+"""
+import sys
+import os
+import time
+import argparse
+import faiss
+import numpy as np
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from scripts.config import FAISS_INDEX_PATH
+from scripts.index_store import save_vectorstore, load_index, load_manifest, index_write_lock, current_index_dir
+from scripts.faiss_index import INDEX_TYPES, default_index_params, load_index_params, build_faiss_index, index_vectors, configure_search
+from scripts.embed_and_index import get_embedding_model
+
+LOSSY_INDEX_TYPES = ("flat_fp16", "ivf_pq", "ivf_sq8")
+
+
+def evaluate(vectors, index, sample_size=200, k=10):
+    """Recall@k of index against exact search, and mean search time, on vectors from the index itself."""
+    rows = np.random.default_rng(0).choice(len(vectors), min(sample_size, len(vectors)), replace=False)
+    queries = vectors[rows]
+    exact = faiss.IndexFlatL2(vectors.shape[1])
+    exact.add(vectors)
+    _, expected = exact.search(queries, k)
+
+    start = time.perf_counter()
+    _, found = index.search(queries, k)
+    elapsed_ms = (time.perf_counter() - start) * 1000 / len(queries)
+    recall = np.mean([len(set(e) & set(f)) / k for e, f in zip(expected, found)])
+    return recall, elapsed_ms
+
+
+def build_index(index_params, source_path=None, output_path=None, evaluate_recall=False):
+    source_path = source_path or FAISS_INDEX_PATH
+    output_path = output_path or source_path
+    source_type = load_index_params(current_index_dir(source_path))["type"]
+    if source_type in LOSSY_INDEX_TYPES:
+        print(f"Warning: {source_path} is a lossy {source_type} index; rebuild with embed_and_index.py --index-type for exact vectors.")
+
+    # Held from load to save, so index updates made meanwhile (e.g. by the upload worker) are not overwritten
+    with index_write_lock(output_path):
+        vectorstore = load_index(source_path, get_embedding_model())
+        print(f"Reading {vectorstore.index.ntotal} vectors from the {source_type} index at {source_path}...")
+        vectors = index_vectors(vectorstore.index)
+        vectorstore.index = build_faiss_index(vectors, index_params)
+
+        if evaluate_recall:
+            configure_search(vectorstore.index)
+            recall, elapsed_ms = evaluate(vectors, vectorstore.index)
+            print(f"Recall@10 vs exact search: {recall:.3f}, {elapsed_ms:.2f} ms per query")
+
+        print(f"Saving {index_params['type']} FAISS index to {output_path}...")
+        version = save_vectorstore(vectorstore, output_path, manifest=load_manifest(source_path), index_params=index_params)
+    print(f"FAISS index saved successfully (version {version}).")
+    return version
+
+
+if __name__ == "__main__":
+    defaults = default_index_params()
+    parser = argparse.ArgumentParser(description="Rebuild the FAISS index as another index type.")
+    parser.add_argument("--index-type", choices=INDEX_TYPES, default=defaults["type"])
+    parser.add_argument("--nlist", type=int, default=defaults["nlist"], help="IVF lists (0: ~4*sqrt(vectors))")
+    parser.add_argument("--pq-m", type=int, default=defaults["pq_m"], help="PQ sub-quantizers")
+    parser.add_argument("--pq-nbits", type=int, default=defaults["pq_nbits"])
+    parser.add_argument("--hnsw-m", type=int, default=defaults["hnsw_m"])
+    parser.add_argument("--ef-construction", type=int, default=defaults["ef_construction"])
+    parser.add_argument("--train-size", type=int, default=defaults["train_size"], help="Vectors sampled to train IVF/PQ")
+    parser.add_argument("--source", help="Index to convert (default: FAISS_INDEX_PATH)")
+    parser.add_argument("--output", help="Where to save the new index (default: replace the source)")
+    parser.add_argument("--evaluate", action="store_true", help="Report recall@10 and search time against exact search")
+    args = parser.parse_args()
+
+    build_index({
+        "type": args.index_type,
+        "nlist": args.nlist,
+        "pq_m": args.pq_m,
+        "pq_nbits": args.pq_nbits,
+        "hnsw_m": args.hnsw_m,
+        "ef_construction": args.ef_construction,
+        "train_size": args.train_size,
+    }, source_path=args.source, output_path=args.output, evaluate_recall=args.evaluate)
@@ -0,0 +1,131 @@
+import os
+import json
+import sqlite3
+import threading
+from langchain.docstore.document import Document
+from langchain_community.docstore.base import AddableMixin, Docstore
+
+CHUNK_STORE_FILE = "chunks.sqlite"
+
+
+class ChunkStore(Docstore, AddableMixin):
+    """LangChain docstore backed by an SQLite file next to the FAISS index.
+
+    Chunk text is read per lookup, so a loaded index only holds the texts of the hits it
+    returns. The file is opened read-only; add() and delete() are kept in memory and only
+    written out by save(), into a new file in the directory of the next index version.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self._conn = None
+        self._lock = threading.Lock()
+        self._added = {}
+        self._deleted = set()
+        if path is not None:
+            self._conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+
+    def _fetch(self, ids):
+        if self._conn is None or not ids:
+            return {}
+        rows = []
+        with self._lock:
+            # Stay under SQLite's bound-parameter limit
+            for start in range(0, len(ids), 500):
+                batch = ids[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows.extend(self._conn.execute(
+                    f"SELECT id, page_content, metadata FROM chunks WHERE id IN ({placeholders})", batch
+                ).fetchall())
+        return {row[0]: Document(id=row[0], page_content=row[1], metadata=json.loads(row[2])) for row in rows}
+
+    def mget(self, ids):
+        """Documents for ids in order, with None for unknown ids, in one query."""
+        ids = list(ids)
+        stored = self._fetch([i for i in ids if i not in self._added and i not in self._deleted])
+        return [self._added[i] if i in self._added else stored.get(i) for i in ids]
+
+    def search(self, search):
+        document = self.mget([search])[0]
+        return document if document is not None else f"ID {search} not found."
+
+    def add(self, texts):
+        overlapping = set(texts) & {i for i, document in zip(texts, self.mget(texts)) if document is not None}
+        if overlapping:
+            raise ValueError(f"Tried to add ids that already exist: {overlapping}")
+        for chunk_id, document in texts.items():
+            self._deleted.discard(chunk_id)
+            self._added[chunk_id] = document
+
+    def delete(self, ids):
+        for chunk_id in ids:
+            if self._added.pop(chunk_id, None) is None:
+                self._deleted.add(chunk_id)
+
+    def all_metadata(self):
+        """Metadata of every stored chunk by id, without reading any chunk text."""
+        metadata = {}
+        if self._conn is not None:
+            with self._lock:
+                for chunk_id, value in self._conn.execute("SELECT id, metadata FROM chunks"):
+                    if chunk_id not in self._deleted:
+                        metadata[chunk_id] = json.loads(value)
+        for chunk_id, document in self._added.items():
+            metadata[chunk_id] = document.metadata
+        return metadata
+
+    def load_positions(self):
+        """The FAISS row -> chunk id map saved with the store."""
+        with self._lock:
+            return dict(self._conn.execute("SELECT position, id FROM positions"))
+
+    def save(self, path, index_to_docstore_id):
+        """Write the store including pending changes to a new file at path."""
+        conn = _create_store(path)
+        if self._conn is not None:
+            with self._lock:
+                self._conn.backup(conn)
+        if self._deleted:
+            conn.executemany("DELETE FROM chunks WHERE id = ?", [(i,) for i in self._deleted])
+        _insert_documents(conn, self._added.items())
+        _write_positions(conn, index_to_docstore_id)
+        conn.commit()
+        conn.close()
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+def _create_store(path):
+    if os.path.exists(path):
+        os.remove(path)
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE IF NOT EXISTS chunks (id TEXT PRIMARY KEY, page_content TEXT NOT NULL, metadata TEXT NOT NULL)")
+    conn.execute("CREATE TABLE IF NOT EXISTS positions (position INTEGER PRIMARY KEY, id TEXT NOT NULL)")
+    return conn
+
+
+def _insert_documents(conn, items):
+    conn.executemany(
+        "INSERT OR REPLACE INTO chunks (id, page_content, metadata) VALUES (?, ?, ?)",
+        ((chunk_id, document.page_content, json.dumps(document.metadata, default=str)) for chunk_id, document in items)
+    )
+
+
+def _write_positions(conn, index_to_docstore_id):
+    conn.execute("DELETE FROM positions")
+    conn.executemany("INSERT INTO positions (position, id) VALUES (?, ?)", sorted(index_to_docstore_id.items()))
+
+
+def write_chunk_store(path, docstore, index_to_docstore_id):
+    """Save any LangChain docstore (e.g. the InMemoryDocstore of a fresh build) as a chunk store file."""
+    if isinstance(docstore, ChunkStore):
+        docstore.save(path, index_to_docstore_id)
+        return
+    conn = _create_store(path)
+    _insert_documents(conn, ((chunk_id, docstore.search(chunk_id)) for chunk_id in index_to_docstore_id.values()))
+    _write_positions(conn, index_to_docstore_id)
+    conn.commit()
+    conn.close()
@@ -0,0 +1,57 @@
+import asyncio
+from contextlib import asynccontextmanager
+
+
+class OverloadedError(Exception):
+    """A limiter's wait queue is full; the caller should retry later (HTTP 429)."""
+
+
+class SlotTimeoutError(Exception):
+    """No slot became free within the wait timeout (HTTP 503)."""
+
+
+class ConcurrencyLimiter:
+    """Caps in-flight calls to a backend and rejects callers fast once too many are queued."""
+
+    def __init__(self, name, max_concurrency, max_waiting, wait_timeout):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.max_waiting = max_waiting
+        self.wait_timeout = wait_timeout
+        self.in_flight = 0
+        self.waiting = 0
+        self.rejected = 0
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+    def is_full(self):
+        return self.in_flight >= self.max_concurrency and self.waiting >= self.max_waiting
+
+    @asynccontextmanager
+    async def slot(self):
+        if self.is_full():
+            self.rejected += 1
+            raise OverloadedError(f"Too many queued {self.name} requests, try again later.")
+
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.wait_timeout)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise SlotTimeoutError(f"Timed out waiting for a free {self.name} slot.") from None
+        finally:
+            self.waiting -= 1
+
+        self.in_flight += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            self._semaphore.release()
+
+    def stats(self):
+        return {
+            "max_concurrency": self.max_concurrency,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "rejected": self.rejected,
+        }
@@ -8,17 +8,123 @@ OPENAI_API_BASE = os.getenv("OPENAI_API_BASE")
 
 # Paths
 TRANSCRIPTS_DIR = "Call_Transcripts/Transcripts"
-FAISS_INDEX_PATH = "D:\\Navigate\\Enterprise_Rag\\models\\faiss_index"
+FAISS_INDEX_PATH = os.getenv("FAISS_INDEX_PATH", "D:\\Navigate\\Enterprise_Rag\\models\\faiss_index")
+EMBED_CHECKPOINT_DIR = os.getenv("EMBED_CHECKPOINT_DIR", "models/embedding_checkpoints")
+UPLOAD_DIR = "./Call_Transcripts/Uploaded"
+INGEST_QUEUE_DB = os.getenv("INGEST_QUEUE_DB", "ingest_jobs.db")
+ANSWER_CACHE_DB = os.getenv("ANSWER_CACHE_DB", "answer_cache.db")
+EMBEDDING_CACHE_DIR = os.getenv("EMBEDDING_CACHE_DIR", "models/embedding_cache")
 
 # RAG Parameters
-CHUNK_SIZE = 1000
-CHUNK_OVERLAP = 200
+CHUNK_SIZE = 1200
+CHUNK_OVERLAP = 250
+PREPROCESS_WORKERS = int(os.getenv("PREPROCESS_WORKERS", "1"))  # >1 chunks files in a process pool
+RETRIEVAL_K = 50  # FAISS candidates per query
+RERANK_TOP_N = 8  # Chunks kept for the prompt
+HYBRID_SEARCH = os.getenv("HYBRID_SEARCH", "true").lower() == "true"  # Fuse BM25 with dense results
+BM25_K = 50  # BM25 candidates per query
+RRF_K = 60  # Reciprocal rank fusion constant
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "24"))  # Fused candidates sent to the reranker
+# Score candidates locally first and only send the uncertain middle of the list to the remote reranker
+RERANK_CASCADE = os.getenv("RERANK_CASCADE", "false").lower() == "true"
+RERANK_CASCADE_SCORER = os.getenv("RERANK_CASCADE_SCORER", "dense")  # "dense" (scores from dense retrieval) or "cross_encoder"
+RERANK_CASCADE_MODEL = os.getenv("RERANK_CASCADE_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")  # CPU cross-encoder for the local pass
+RERANK_CASCADE_CANDIDATES = int(os.getenv("RERANK_CASCADE_CANDIDATES", "24"))  # Best local candidates kept for the cascade
+RERANK_CASCADE_SKIP_MARGIN = float(os.getenv("RERANK_CASCADE_SKIP_MARGIN", "0.75"))  # Std devs between ranks top_n and top_n+1 to skip the remote call
+RERANK_CASCADE_ACCEPT_Z = float(os.getenv("RERANK_CASCADE_ACCEPT_Z", "1.5"))  # Standardized local score kept without remote reranking
+RERANK_CASCADE_REJECT_Z = float(os.getenv("RERANK_CASCADE_REJECT_Z", "-0.25"))  # Standardized local score dropped without remote reranking
+CONTEXT_PACKING = os.getenv("CONTEXT_PACKING", "true").lower() == "true"  # Merge adjacent chunks and drop their overlap in the prompt
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "2500"))  # Prompt tokens available for excerpts
+CONTEXT_MIN_EXCERPT_TOKENS = 64  # Smaller leftovers of the budget are not worth an excerpt
+CONTEXT_CHARS_PER_TOKEN = 4  # For estimating token counts without a tokenizer
+QUERY_FILTER_PARSING = os.getenv("QUERY_FILTER_PARSING", "true").lower() == "true"  # Restrict search to tickers/years named in the question
 
 # LLM Parameters
 LLM_MODEL_NAME = "nvidia/llama-3.3-nemotron-super-49b-v1"
 NVIDIA_EMBEDDING_MODEL_NAME = "nvidia/llama-3.2-nv-embedqa-1b-v2"
 NVIDIA_RERANKING_MODEL_NAME = "nvidia/llama-3.2-nv-rerankqa-1b-v2"
 
+# FAISS Index
+FAISS_INDEX_TYPE = os.getenv("FAISS_INDEX_TYPE", "flat")  # flat, flat_fp16, hnsw, ivf_flat, ivf_pq or ivf_sq8, for new builds
+FAISS_NLIST = int(os.getenv("FAISS_NLIST", "0"))  # IVF lists; 0 picks ~4*sqrt(vectors)
+FAISS_PQ_M = int(os.getenv("FAISS_PQ_M", "64"))  # PQ sub-quantizers; must divide the embedding dimension
+FAISS_PQ_NBITS = int(os.getenv("FAISS_PQ_NBITS", "8"))
+FAISS_HNSW_M = int(os.getenv("FAISS_HNSW_M", "32"))
+FAISS_HNSW_EF_CONSTRUCTION = int(os.getenv("FAISS_HNSW_EF_CONSTRUCTION", "200"))
+FAISS_TRAIN_SIZE = int(os.getenv("FAISS_TRAIN_SIZE", "100000"))  # Vectors sampled to train IVF/PQ indexes
+FAISS_NPROBE = int(os.getenv("FAISS_NPROBE", "16"))  # IVF lists visited per search
+FAISS_EF_SEARCH = int(os.getenv("FAISS_EF_SEARCH", "128"))  # HNSW candidate list size per search
+# Open the served index read-only with mmap, so uvicorn workers share one copy through the OS page cache
+FAISS_MMAP = os.getenv("FAISS_MMAP", "false").lower() == "true"
+
+# Embedding Pipeline
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))  # Chunks per embedding request
+EMBED_MAX_WORKERS = int(os.getenv("EMBED_MAX_WORKERS", "4"))  # Concurrent embedding requests
+EMBED_MAX_RETRIES = int(os.getenv("EMBED_MAX_RETRIES", "5"))
+EMBED_RETRY_BACKOFF_SECONDS = float(os.getenv("EMBED_RETRY_BACKOFF_SECONDS", "1.0"))  # Doubled after each failed attempt
+INGEST_WINDOW_SIZE = int(os.getenv("INGEST_WINDOW_SIZE", "2048"))  # Chunks embedded and added to the index per step
+
+# Upload Ingestion Worker
+INGEST_POLL_INTERVAL_SECONDS = float(os.getenv("INGEST_POLL_INTERVAL_SECONDS", "5"))
+INGEST_BATCH_DELAY_SECONDS = float(os.getenv("INGEST_BATCH_DELAY_SECONDS", "2"))  # Wait for more uploads before indexing
+INGEST_MAX_BATCH_FILES = int(os.getenv("INGEST_MAX_BATCH_FILES", "20"))  # Uploads folded into one index update
+# A claimed job is renewed while its worker runs; one not renewed for this long is queued again
+INGEST_LEASE_SECONDS = float(os.getenv("INGEST_LEASE_SECONDS", "120"))
+
+# Uploads
+UPLOAD_CHUNK_BYTES = 1 << 20  # Block size for writing uploads and extracting archives
+UPLOAD_MAX_FILE_BYTES = int(os.getenv("UPLOAD_MAX_FILE_BYTES", str(50 << 20)))  # Largest single transcript
+UPLOAD_MAX_REQUEST_BYTES = int(os.getenv("UPLOAD_MAX_REQUEST_BYTES", str(500 << 20)))  # Largest upload request, archives included
+UPLOAD_MAX_EXTRACTED_BYTES = int(os.getenv("UPLOAD_MAX_EXTRACTED_BYTES", str(2 << 30)))  # Total unpacked from a request's archives
+UPLOAD_MAX_FILES = int(os.getenv("UPLOAD_MAX_FILES", "5000"))  # Transcripts per request, archive members included
+
+# Embedding Cache
+EMBEDDING_CACHE_ENABLED = os.getenv("EMBEDDING_CACHE_ENABLED", "true").lower() == "true"
+EMBEDDING_CACHE_DTYPE = os.getenv("EMBEDDING_CACHE_DTYPE", "float32")  # "float16" halves the store size
+
+# Semantic Answer Cache
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))  # Cosine similarity needed to reuse an answer
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "1000"))
+ANSWER_CACHE_TTL_SECONDS = int(os.getenv("ANSWER_CACHE_TTL_SECONDS", "86400"))
+
+# Async Query Path
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))  # In-flight ChatNVIDIA calls per worker
+RERANK_MAX_CONCURRENCY = int(os.getenv("RERANK_MAX_CONCURRENCY", "16"))  # In-flight NVIDIARerank calls per worker
+MAX_QUEUED_REQUESTS = int(os.getenv("MAX_QUEUED_REQUESTS", "32"))  # Waiting callers per limiter before 429s
+QUEUE_WAIT_TIMEOUT_SECONDS = float(os.getenv("QUEUE_WAIT_TIMEOUT_SECONDS", "10"))  # Longest wait for a slot before 503
+QUERY_TIMEOUT_SECONDS = float(os.getenv("QUERY_TIMEOUT_SECONDS", "120"))
+
+# Batch Questions (/query/batch and scripts/batch_query.py)
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "8"))  # Questions of one batch reranked and answered at once
+BATCH_MAX_QUESTIONS = int(os.getenv("BATCH_MAX_QUESTIONS", "5000"))  # Largest batch /query/batch accepts, after crossing with companies
+BATCH_MAX_RETRIES = int(os.getenv("BATCH_MAX_RETRIES", "3"))  # Retries of a question that found the LLM or rerank limiter full
+BATCH_LLM_MAX_CONCURRENCY = int(os.getenv("BATCH_LLM_MAX_CONCURRENCY", "4"))  # LLM calls for /query/batch, on top of LLM_MAX_CONCURRENCY
+BATCH_RERANK_MAX_CONCURRENCY = int(os.getenv("BATCH_RERANK_MAX_CONCURRENCY", "8"))  # Rerank calls for /query/batch, on top of RERANK_MAX_CONCURRENCY
+
+# Micro-batching
+MICRO_BATCHING = os.getenv("MICRO_BATCHING", "true").lower() == "true"  # Merge concurrent query embeddings and FAISS searches
+MICRO_BATCH_WAIT_MS = float(os.getenv("MICRO_BATCH_WAIT_MS", "5"))  # How long a batch stays open for more requests
+MICRO_BATCH_MAX_SIZE = int(os.getenv("MICRO_BATCH_MAX_SIZE", "32"))
+
+# Metrics
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"  # Stage histograms and counters on /metrics
+SLOW_QUERY_SECONDS = float(os.getenv("SLOW_QUERY_SECONDS", "10"))  # Queries at least this slow are counted and logged
+SLOW_QUERY_LOG_SAMPLE_RATE = float(os.getenv("SLOW_QUERY_LOG_SAMPLE_RATE", "1.0"))  # Fraction of slow queries logged with their timings
+
+# Chat History (Streamlit UI)
+CHAT_HISTORY_PAGE_SIZE = int(os.getenv("CHAT_HISTORY_PAGE_SIZE", "30"))  # Messages rendered per page of a session
+CHAT_SESSIONS_PAGE_SIZE = int(os.getenv("CHAT_SESSIONS_PAGE_SIZE", "20"))  # Sessions listed per page in the sidebar
+
+# RAG Engine
+# How often (seconds) the shared engine checks FAISS_INDEX_PATH for a new index version
+INDEX_WATCH_INTERVAL_SECONDS = int(os.getenv("INDEX_WATCH_INTERVAL_SECONDS", "10"))
+# Published index versions kept on disk, so processes still loading or serving an older one can finish with it
+INDEX_KEEP_VERSIONS = int(os.getenv("INDEX_KEEP_VERSIONS", "3"))
+# Asked once before /readyz passes, to open the embedding, rerank and LLM connections; empty skips it
+WARMUP_QUERY = os.getenv("WARMUP_QUERY", "")
+WARMUP_RETRY_SECONDS = float(os.getenv("WARMUP_RETRY_SECONDS", "10"))  # Wait between attempts to load a missing or broken index
+
 
 
 # Persona Prompt
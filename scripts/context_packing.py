@@ -0,0 +1,130 @@
+import re
+from collections import namedtuple
+from scripts import config
+
+# text: the prompt context; excerpts: the documents behind each [Excerpt N], in label order
+PackedContext = namedtuple("PackedContext", ["text", "excerpts", "raw_tokens", "packed_tokens"])
+
+
+def count_tokens(text):
+    # Rough count without loading a tokenizer; only used to compare and budget contexts
+    return -(-len(text) // config.CONTEXT_CHARS_PER_TOKEN)
+
+
+def chunk_index(document):
+    """Position of a chunk within its transcript, from the "<source>_<i>" chunk_id set at chunking time."""
+    _, _, index = str(document.metadata.get("chunk_id", "")).rpartition("_")
+    return int(index) if index.isdigit() else None
+
+
+def overlap_length(previous, following, max_overlap):
+    """Length of the longest suffix of previous that is also a prefix of following."""
+    for length in range(min(len(previous), len(following), max_overlap), 0, -1):
+        if previous.endswith(following[:length]):
+            return length
+    return 0
+
+
+def merge_adjacent_chunks(documents):
+    """Group reranked chunks into excerpts, joining consecutive chunks of one transcript without their overlap.
+
+    Excerpts keep the rank of their best chunk; chunks inside an excerpt are in transcript order.
+    Returns a list of (text, documents) pairs.
+    """
+    groups = {}
+    order = []
+    for rank, doc in enumerate(documents):
+        key = doc.metadata.get("source")
+        index = chunk_index(doc)
+        if key is None or index is None:
+            key = ("unmerged", rank)
+        if key not in groups:
+            groups[key] = []
+            order.append(key)
+        groups[key].append((index, rank, doc))
+
+    excerpts = []
+    for key in order:
+        members = sorted(groups[key], key=lambda member: (member[0] is None, member[0]))
+        runs = [[members[0]]]
+        for member in members[1:]:
+            if member[0] is not None and runs[-1][-1][0] is not None and member[0] == runs[-1][-1][0] + 1:
+                runs[-1].append(member)
+            else:
+                runs.append([member])
+        for run in runs:
+            text = run[0][2].page_content
+            for _, _, doc in run[1:]:
+                # The splitter repeats up to CHUNK_OVERLAP characters; allow some slack for whitespace
+                text += doc.page_content[overlap_length(text, doc.page_content, 2 * config.CHUNK_OVERLAP):]
+            excerpts.append((min(rank for _, rank, _ in run), text, [doc for _, _, doc in run]))
+
+    excerpts.sort(key=lambda excerpt: excerpt[0])
+    return [(text, docs) for _, text, docs in excerpts]
+
+
+def compact_text(text):
+    """Drop the transcripts' separator rules and repeated whitespace, which cost tokens but carry nothing."""
+    text = re.sub(r"[-=_*]{4,}", " ", text)
+    text = re.sub(r"[ \t]+", " ", text)
+    text = re.sub(r" ?\n ?", "\n", text)
+    return re.sub(r"\n{3,}", "\n\n", text).strip()
+
+
+def drop_seen_sentences(text, seen):
+    """Remove sentences already included in an earlier excerpt (e.g. safe-harbor boilerplate); updates seen."""
+    kept = []
+    # Odd items are the whitespace after each sentence, kept so speaker line breaks survive
+    pieces = re.split(r"(?<=[.!?])(\s+)", text)
+    for sentence, separator in zip(pieces[0::2], pieces[1::2] + [""]):
+        key = " ".join(sentence.split()).lower()
+        # Short sentences ("Thank you.") are left alone; repeating them is cheap and keeps the flow
+        if len(key) >= 40:
+            if key in seen:
+                continue
+            seen.add(key)
+        kept.append(sentence + separator)
+    return "".join(kept).strip()
+
+
+def excerpt_label(number, documents):
+    metadata = documents[0].metadata
+    details = [value for value in (metadata.get("company"), metadata.get("date")) if value and value != "unknown"]
+    return f"[Excerpt {number}]" + (f" ({', '.join(details)})" if details else "")
+
+
+def truncate_to_tokens(text, max_tokens):
+    # Cut at the last sentence end that fits, so excerpts don't stop mid-sentence
+    limit = max_tokens * config.CONTEXT_CHARS_PER_TOKEN
+    if len(text) <= limit:
+        return text
+    cut = text[:limit]
+    sentence_ends = [match.end() for match in re.finditer(r"[.!?](\s|$)", cut)]
+    return cut[:sentence_ends[-1]].rstrip() if sentence_ends else cut.rstrip()
+
+
+def pack_context(documents, token_budget=None):
+    """Merge, de-duplicate, label and budget the reranked chunks into the prompt's context."""
+    token_budget = token_budget or config.CONTEXT_TOKEN_BUDGET
+    raw_tokens = count_tokens("\n\n".join(doc.page_content for doc in documents))
+
+    parts = []
+    excerpts = []
+    seen = set()
+    remaining = token_budget
+    for text, excerpt_documents in merge_adjacent_chunks(documents):
+        text = drop_seen_sentences(compact_text(text), seen)
+        if not text:
+            continue
+        label = excerpt_label(len(excerpts) + 1, excerpt_documents)
+        available = remaining - count_tokens(label) - 1
+        if available < config.CONTEXT_MIN_EXCERPT_TOKENS:
+            break
+        text = truncate_to_tokens(text, available)
+        part = f"{label}\n{text}"
+        parts.append(part)
+        excerpts.append(excerpt_documents)
+        remaining -= count_tokens(part) + 1
+
+    context = "\n\n".join(parts)
+    return PackedContext(context, excerpts, raw_tokens, count_tokens(context))
@@ -1,105 +1,193 @@
 import sqlite3
+import threading
+from contextlib import contextmanager
 
 DATABASE_NAME = 'chat_history.db'
 
+# Schema changes after the initial tables, applied in order and tracked in PRAGMA user_version
+MIGRATIONS = [
+    # Sidebar session lists and chat history loads are filtered by owner and sorted by time
+    """
+    CREATE INDEX IF NOT EXISTS idx_chat_sessions_user_timestamp ON chat_sessions (user_id, timestamp);
+    CREATE INDEX IF NOT EXISTS idx_chat_messages_session_timestamp ON chat_messages (session_id, timestamp, id);
+    """,
+]
+
+_conn = None
+_database = None
+_lock = threading.RLock()
+
+def get_connection():
+    """The process-wide connection, opened on first use.
+
+    Streamlit runs every rerun of a session's script on a new thread, so a per-thread connection
+    would only last one rerun. One shared connection is kept instead; use it through connection().
+    """
+    global _conn, _database
+    with _lock:
+        if _conn is None or _database != DATABASE_NAME:
+            conn = sqlite3.connect(DATABASE_NAME, timeout=10, check_same_thread=False)
+            # WAL lets readers run while a message is being written; NORMAL sync is safe under WAL
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=5000")
+            conn.execute("PRAGMA temp_store=MEMORY")
+            conn.execute("PRAGMA cache_size=-16000")  # 16 MB page cache
+            _conn, _database = conn, DATABASE_NAME
+        return _conn
+
+@contextmanager
+def connection():
+    """The shared connection, held by one thread until its statements and commit are done."""
+    with _lock:
+        yield get_connection()
+
+def migrate_db(conn):
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    for number, script in enumerate(MIGRATIONS[version:], start=version + 1):
+        conn.executescript(script)
+        conn.execute(f"PRAGMA user_version = {number}")
+        conn.commit()
+
 def init_db():
-    conn = sqlite3.connect(DATABASE_NAME)
-    cursor = conn.cursor()
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            username TEXT UNIQUE NOT NULL,
-            password TEXT NOT NULL
-        )
-    ''')
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS chat_sessions (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            session_name TEXT,
-            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (user_id) REFERENCES users(id)
-        )
-    ''')
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS chat_messages (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            session_id INTEGER NOT NULL,
-            sender TEXT NOT NULL,
-            message TEXT NOT NULL,
-            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (session_id) REFERENCES chat_sessions(id)
-        )
-    ''')
-    conn.commit()
-    conn.close()
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS users (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                username TEXT UNIQUE NOT NULL,
+                password TEXT NOT NULL
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS chat_sessions (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL,
+                session_name TEXT,
+                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (user_id) REFERENCES users(id)
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS chat_messages (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                session_id INTEGER NOT NULL,
+                sender TEXT NOT NULL,
+                message TEXT NOT NULL,
+                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (session_id) REFERENCES chat_sessions(id)
+            )
+        ''')
+        conn.commit()
+        migrate_db(conn)
 
 def add_user(username, password):
-    conn = sqlite3.connect(DATABASE_NAME)
-    cursor = conn.cursor()
-    try:
-        cursor.execute("INSERT INTO users (username, password) VALUES (?, ?)", (username, password))
-        conn.commit()
-        return True
-    except sqlite3.IntegrityError:
-        return False # Username already exists
-    finally:
-        conn.close()
+    with connection() as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute("INSERT INTO users (username, password) VALUES (?, ?)", (username, password))
+            conn.commit()
+            return True
+        except sqlite3.IntegrityError:
+            conn.rollback()
+            return False # Username already exists
 
 def get_user(username, password):
-    conn = sqlite3.connect(DATABASE_NAME)
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM users WHERE username = ? AND password = ?", (username, password))
-    user = cursor.fetchone()
-    conn.close()
-    return user
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT * FROM users WHERE username = ? AND password = ?", (username, password))
+        user = cursor.fetchone()
+        return user
 
 def create_chat_session(user_id, session_name=None):
-    conn = sqlite3.connect(DATABASE_NAME)
-    cursor = conn.cursor()
-    cursor.execute("INSERT INTO chat_sessions (user_id, session_name) VALUES (?, ?)", (user_id, session_name))
-    session_id = cursor.lastrowid
-    conn.commit()
-    conn.close()
-    return session_id
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("INSERT INTO chat_sessions (user_id, session_name) VALUES (?, ?)", (user_id, session_name))
+        session_id = cursor.lastrowid
+        conn.commit()
+        return session_id
 
 def get_chat_sessions(user_id):
-    conn = sqlite3.connect(DATABASE_NAME)
-    cursor = conn.cursor()
-    cursor.execute("SELECT id, session_name, timestamp FROM chat_sessions WHERE user_id = ? ORDER BY timestamp DESC", (user_id,))
-    sessions = cursor.fetchall()
-    conn.close()
-    return sessions
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT id, session_name, timestamp FROM chat_sessions WHERE user_id = ? ORDER BY timestamp DESC, id DESC", (user_id,))
+        sessions = cursor.fetchall()
+        return sessions
+
+def get_chat_sessions_page(user_id, limit=20, before=None):
+    """Up to limit of the user's sessions, newest first, that come after the before cursor.
+
+    Returns (sessions, cursor); pass cursor as before to get the next page, it is None on the last page.
+    """
+    with connection() as conn:
+        cursor = conn.cursor()
+        if before is None:
+            cursor.execute("SELECT id, session_name, timestamp FROM chat_sessions WHERE user_id = ? ORDER BY timestamp DESC, id DESC LIMIT ?",
+                           (user_id, limit + 1))
+        else:
+            cursor.execute("SELECT id, session_name, timestamp FROM chat_sessions WHERE user_id = ? AND (timestamp, id) < (?, ?) ORDER BY timestamp DESC, id DESC LIMIT ?",
+                           (user_id, before[0], before[1], limit + 1))
+        sessions = cursor.fetchall()
+        if len(sessions) <= limit:
+            return sessions, None
+        sessions = sessions[:limit]
+        return sessions, (sessions[-1][2], sessions[-1][0])
 
 def add_chat_message(session_id, sender, message):
-    conn = sqlite3.connect(DATABASE_NAME)
-    cursor = conn.cursor()
-    cursor.execute("INSERT INTO chat_messages (session_id, sender, message) VALUES (?, ?, ?)", (session_id, sender, message))
-    conn.commit()
-    conn.close()
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("INSERT INTO chat_messages (session_id, sender, message) VALUES (?, ?, ?)", (session_id, sender, message))
+        conn.commit()
+
+def add_chat_messages(session_id, messages):
+    """Insert several (sender, message) pairs, e.g. a question and its answer, in one transaction."""
+    with connection() as conn:
+        with conn:
+            conn.executemany("INSERT INTO chat_messages (session_id, sender, message) VALUES (?, ?, ?)",
+                             [(session_id, sender, message) for sender, message in messages])
 
 def get_chat_messages(session_id):
-    conn = sqlite3.connect(DATABASE_NAME)
-    cursor = conn.cursor()
-    cursor.execute("SELECT sender, message, timestamp FROM chat_messages WHERE session_id = ? ORDER BY timestamp ASC", (session_id,))
-    messages = cursor.fetchall()
-    conn.close()
-    return messages
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT sender, message, timestamp FROM chat_messages WHERE session_id = ? ORDER BY timestamp ASC, id ASC", (session_id,))
+        messages = cursor.fetchall()
+        return messages
+
+def get_chat_messages_page(session_id, limit=50, before=None):
+    """The latest limit messages of a session older than the before cursor, oldest first.
+
+    Returns (messages, cursor); pass cursor as before to load the page before it, it is None
+    once the start of the session is reached.
+    """
+    with connection() as conn:
+        cursor = conn.cursor()
+        # Keyset pagination on (timestamp, id): every page is a range scan of the session index
+        if before is None:
+            cursor.execute("SELECT sender, message, timestamp, id FROM chat_messages WHERE session_id = ? ORDER BY timestamp DESC, id DESC LIMIT ?",
+                           (session_id, limit + 1))
+        else:
+            cursor.execute("SELECT sender, message, timestamp, id FROM chat_messages WHERE session_id = ? AND (timestamp, id) < (?, ?) ORDER BY timestamp DESC, id DESC LIMIT ?",
+                           (session_id, before[0], before[1], limit + 1))
+        rows = cursor.fetchall()
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = (rows[-1][2], rows[-1][3])
+        messages = [(sender, message, timestamp) for sender, message, timestamp, _ in reversed(rows)]
+        return messages, next_cursor
 
 def delete_chat_session(session_id):
-    conn = sqlite3.connect(DATABASE_NAME)
-    cursor = conn.cursor()
-    cursor.execute("DELETE FROM chat_messages WHERE session_id = ?", (session_id,))
-    cursor.execute("DELETE FROM chat_sessions WHERE id = ?", (session_id,))
-    conn.commit()
-    conn.close()
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("DELETE FROM chat_messages WHERE session_id = ?", (session_id,))
+        cursor.execute("DELETE FROM chat_sessions WHERE id = ?", (session_id,))
+        conn.commit()
 
 def clear_chat_messages(session_id):
-    conn = sqlite3.connect(DATABASE_NAME)
-    cursor = conn.cursor()
-    cursor.execute("DELETE FROM chat_messages WHERE session_id = ?", (session_id,))
-    conn.commit()
-    conn.close()
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("DELETE FROM chat_messages WHERE session_id = ?", (session_id,))
+        conn.commit()
 
 if __name__ == '__main__':
     init_db()
@@ -109,8 +197,7 @@ if __name__ == '__main__':
     # user = get_user("testuser", "testpass")
     # if user:
     #     session_id = create_chat_session(user[0], "First Chat")
-    #     add_chat_message(session_id, "user", "Hello!")
-    #     add_chat_message(session_id, "assistant", "Hi there!")
+    #     add_chat_messages(session_id, [("user", "Hello!"), ("assistant", "Hi there!")])
     #     messages = get_chat_messages(session_id)
     #     for msg in messages:
     #         print(msg)
\ No newline at end of file
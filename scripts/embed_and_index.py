@@ -1,34 +1,187 @@
 import sys
 import os
+import argparse
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 from dotenv import load_dotenv
 from langchain_nvidia_ai_endpoints import NVIDIAEmbeddings
 from langchain_community.vectorstores import FAISS
-from scripts.preprocess import load_and_chunk_transcripts
-from scripts.config import NVIDIA_EMBEDDING_MODEL_NAME
-from scripts.config import FAISS_INDEX_PATH
+from scripts.preprocess import list_transcript_files, list_uploaded_files, chunk_transcript_file, iter_chunked_files
+from scripts.config import NVIDIA_EMBEDDING_MODEL_NAME, NVIDIA_API_BASE
+from scripts.config import FAISS_INDEX_PATH, TRANSCRIPTS_DIR, UPLOAD_DIR, EMBED_CHECKPOINT_DIR, INGEST_WINDOW_SIZE
+from scripts.index_store import save_vectorstore, load_index, index_write_lock, load_manifest, current_index_dir, hash_file, assign_chunk_ids
+from scripts.ingest_pipeline import embed_documents_batched
+from scripts.embedding_cache import CachedEmbeddings
+from scripts.config import EMBEDDING_CACHE_ENABLED
+from scripts.faiss_index import INDEX_TYPES, REMOVABLE_INDEX_TYPES, default_index_params, load_index_params, build_faiss_index
+import shutil
 import os
 
 load_dotenv()
-def embed_and_index(documents=None, company_name=None):
+
+def get_embedding_model():
+    embedding_model = NVIDIAEmbeddings(model=NVIDIA_EMBEDDING_MODEL_NAME, api_key=os.getenv("NVIDIA_API_KEY"), base_url=NVIDIA_API_BASE, truncate="NONE")
+    # Chunks whose text was embedded before (e.g. after a CHUNK_SIZE change) come from disk
+    return CachedEmbeddings(embedding_model) if EMBEDDING_CACHE_ENABLED else embedding_model
+
+def embed_documents(documents, embedding_model):
+    # Batched, concurrent and checkpointed; a crashed run resumes from EMBED_CHECKPOINT_DIR
+    texts = [doc.page_content for doc in documents]
+    vectors = embed_documents_batched(texts, embedding_model)
+    return list(zip(texts, vectors.tolist())), [doc.metadata for doc in documents]
+
+def list_all_files(company_name=None):
+    # A full build replaces the manifest, so files uploaded through the API must be rebuilt too
+    uploaded = list_uploaded_files(company_name)
+    if uploaded:
+        print(f"Including {len(uploaded)} uploaded transcript(s) from {UPLOAD_DIR}.")
+    return list_transcript_files(company_name) + uploaded
+
+def iter_windows(file_paths, files, workers=None):
+    # Stream chunks file by file, recording each file's hash and chunk ids for the manifest,
+    # and group them into windows so only INGEST_WINDOW_SIZE chunks are pending at a time
+    documents, ids = [], []
+    for file_path, file_documents in iter_chunked_files(file_paths, workers):
+        file_ids = assign_chunk_ids(file_documents)
+        files[file_path] = {"hash": hash_file(file_path), "chunks": file_ids}
+        documents.extend(file_documents)
+        ids.extend(file_ids)
+        if len(documents) >= INGEST_WINDOW_SIZE:
+            yield documents, ids
+            documents, ids = [], []
+    if documents:
+        yield documents, ids
+
+def convert_index(vectorstore, index_params):
+    # Built flat window by window, then rebuilt as the requested type from all vectors at once
+    if index_params["type"] != "flat":
+        print(f"Building {index_params['type']} FAISS index...")
+        vectorstore.index = build_faiss_index(vectorstore.index.reconstruct_n(0, vectorstore.index.ntotal), index_params)
+
+def embed_and_index(documents=None, company_name=None, incremental=False, workers=None, file_paths=None, index_params=None):
+    if incremental and documents is None:
+        return update_index(company_name=company_name)
+
+    index_params = index_params or default_index_params()
+
+    manifest = None
     if documents is None:
         print("Loading and chunking transcripts...")
-        documents = load_and_chunk_transcripts(company_name)
-        if not documents:
-            print("No documents found to embed. Exiting.")
-            return
+        if file_paths is None:
+            file_paths = list_all_files(company_name)
+        files = {}
+        windows = iter_windows(file_paths, files, workers)
+        manifest = {"embedding_model": NVIDIA_EMBEDDING_MODEL_NAME, "files": files}
+    else:
+        windows = [(documents, assign_chunk_ids(documents))]
+
+    embedding_model = get_embedding_model()
+    vectorstore = None
+    total = 0
+    for window_documents, window_ids in windows:
+        print(f"Embedding {len(window_documents)} document chunks...")
+        text_embeddings, metadatas = embed_documents(window_documents, embedding_model)
+        if vectorstore is None:
+            vectorstore = FAISS.from_embeddings(text_embeddings, embedding_model, metadatas=metadatas, ids=window_ids)
+        else:
+            vectorstore.add_embeddings(text_embeddings, metadatas=metadatas, ids=window_ids)
+        total += len(window_documents)
+
+    if vectorstore is None:
+        print("No documents found to embed. Exiting.")
+        return
 
-    print(f"Embedding {len(documents)} document chunks...")
-    embedding_model = NVIDIAEmbeddings(model=NVIDIA_EMBEDDING_MODEL_NAME, api_key=os.getenv("NVIDIA_API_KEY"), truncate="NONE")
-    vectorstore = FAISS.from_documents(documents, embedding_model)
+    convert_index(vectorstore, index_params)
+    print(f"Saving FAISS index with {total} chunks to {FAISS_INDEX_PATH}...")
+    # Without a manifest (the caller's documents don't map to transcript files) the next incremental run rebuilds
+    version = save_vectorstore(vectorstore, FAISS_INDEX_PATH, manifest=manifest, index_params=index_params)
+    shutil.rmtree(EMBED_CHECKPOINT_DIR, ignore_errors=True)
+    print(f"FAISS index saved successfully (version {version}).")
+    return version
+
+def update_index(company_name=None, file_paths=None):
+    """Embed only new or changed transcript chunks and add them to the existing index.
+
+    With file_paths, only those files are (re)indexed. Otherwise the transcript tree
+    (or one company's folder) is scanned and files that disappeared are removed.
+    Returns the new index version, or None if nothing changed.
+    """
+    manifest = load_manifest(FAISS_INDEX_PATH)
+    index_params = load_index_params(current_index_dir(FAISS_INDEX_PATH))
+    if manifest is None or manifest.get("embedding_model") != NVIDIA_EMBEDDING_MODEL_NAME:
+        print("No compatible index manifest found, running a full rebuild...")
+        all_file_paths = list_all_files(company_name)
+        known = set(all_file_paths)
+        # Files outside the transcript tree (e.g. uploads) are built in as well
+        all_file_paths += [path for path in file_paths or [] if path not in known]
+        return embed_and_index(file_paths=all_file_paths, index_params=index_params)
+
+    indexed_files = manifest["files"]
+    if file_paths is None:
+        file_paths = list_transcript_files(company_name)
+        scope = os.path.join(TRANSCRIPTS_DIR, company_name) if company_name else TRANSCRIPTS_DIR
+        current = set(file_paths)
+        deleted_files = [path for path in indexed_files if path.startswith(scope) and path not in current]
+    else:
+        deleted_files = []
+
+    ids_to_delete = []
+    for path in deleted_files:
+        ids_to_delete.extend(indexed_files.pop(path)["chunks"])
+
+    new_documents, new_ids = [], []
+    for file_path in file_paths:
+        file_hash = hash_file(file_path)
+        entry = indexed_files.get(file_path)
+        if entry is not None and entry["hash"] == file_hash:
+            continue
+
+        file_documents = chunk_transcript_file(file_path)
+        file_ids = assign_chunk_ids(file_documents)
+        old_ids = set(entry["chunks"]) if entry else set()
+        kept_ids = set(file_ids)
+        ids_to_delete.extend(chunk_id for chunk_id in old_ids if chunk_id not in kept_ids)
+        for doc, chunk_id in zip(file_documents, file_ids):
+            if chunk_id not in old_ids:
+                new_documents.append(doc)
+                new_ids.append(chunk_id)
+        indexed_files[file_path] = {"hash": file_hash, "chunks": file_ids}
+
+    if not new_documents and not ids_to_delete:
+        print("Index is up to date.")
+        return
+
+    if ids_to_delete and index_params["type"] not in REMOVABLE_INDEX_TYPES:
+        # HNSW can't remove vectors and IVF keeps the old row ids, so rebuild; unchanged chunks come from the embedding cache
+        print(f"Rebuilding {index_params['type']} index to remove {len(ids_to_delete)} stale chunks...")
+        return embed_and_index(file_paths=[path for path in indexed_files if os.path.exists(path)], index_params=index_params)
+
+    embedding_model = get_embedding_model()
+    vectorstore = load_index(FAISS_INDEX_PATH, embedding_model)
+    if ids_to_delete:
+        print(f"Removing {len(ids_to_delete)} stale chunks...")
+        vectorstore.delete(ids_to_delete)
+    if new_documents:
+        print(f"Embedding {len(new_documents)} new or changed chunks...")
+        text_embeddings, metadatas = embed_documents(new_documents, embedding_model)
+        vectorstore.add_embeddings(text_embeddings, metadatas=metadatas, ids=new_ids)
 
     print(f"Saving FAISS index to {FAISS_INDEX_PATH}...")
-    os.makedirs(FAISS_INDEX_PATH, exist_ok=True)
-    vectorstore.save_local(FAISS_INDEX_PATH)
-    print("FAISS index saved successfully.")
+    version = save_vectorstore(vectorstore, FAISS_INDEX_PATH, manifest=manifest, index_params=index_params)
+    shutil.rmtree(EMBED_CHECKPOINT_DIR, ignore_errors=True)
+    print(f"FAISS index updated successfully (version {version}).")
+    return version
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Embed call transcripts into the FAISS index.")
+    parser.add_argument("--company", help="Only index transcripts for this ticker (e.g. AAPL)")
+    parser.add_argument("--incremental", action="store_true", help="Embed only new or changed files and update the existing index")
+    parser.add_argument("--workers", type=int, help="Chunk transcripts in this many processes (default: PREPROCESS_WORKERS)")
+    parser.add_argument("--index-type", choices=INDEX_TYPES, help="FAISS index type for a full build (default: FAISS_INDEX_TYPE)")
+    args = parser.parse_args()
+
     # Example usage: embed and index all transcripts
-    embed_and_index()
+    with index_write_lock(FAISS_INDEX_PATH):
+        embed_and_index(company_name=args.company, incremental=args.incremental, workers=args.workers,
+                        index_params=default_index_params(args.index_type))
     # Example usage: embed and index transcripts for a specific company (e.g., 'AAPL')
-    # embed_and_index(company_name='AAPL')
\ No newline at end of file
+    # embed_and_index(company_name='AAPL')
@@ -0,0 +1,202 @@
+import os
+import json
+import hashlib
+import threading
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from scripts import config
+from scripts.micro_batch import embed_queries
+from scripts.file_lock import file_lock
+
+
+class EmbeddingCache:
+    """Append-only, memory-mapped store of embeddings keyed by a hash of the text.
+
+    One store per namespace (model name and input type). Rows are written to the
+    vectors file before their key, so any key on disk always has its vector. A
+    write torn by a crash can leave vectors (or part of a key) past the last
+    complete key; the next writer cuts both files back before appending.
+    """
+
+    KEY_SIZE = 16
+
+    def __init__(self, directory, namespace, dtype="float32"):
+        os.makedirs(directory, exist_ok=True)
+        slug = hashlib.sha1(namespace.encode("utf-8")).hexdigest()[:16]
+        self.namespace = namespace
+        self.keys_path = os.path.join(directory, f"{slug}.keys")
+        self.vectors_path = os.path.join(directory, f"{slug}.vectors")
+        self.meta_path = os.path.join(directory, f"{slug}.json")
+        self.lock_path = os.path.join(directory, f"{slug}.lock")
+        self.dtype = np.dtype(dtype)
+        self.dim = None
+        self.hits = 0
+        self.misses = 0
+        self._rows = {}
+        self._count = 0
+        self._vectors = None
+        self._lock = threading.Lock()
+        self._refresh()
+
+    @classmethod
+    def key(cls, text):
+        return hashlib.blake2b(text.encode("utf-8"), digest_size=cls.KEY_SIZE).digest()
+
+    def __len__(self):
+        return self._count
+
+    def _load_meta(self):
+        # The first writer records dim and dtype; they are fixed for the life of the store
+        if not os.path.exists(self.meta_path):
+            return
+        with open(self.meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        self.dim = meta["dim"]
+        self.dtype = np.dtype(meta["dtype"])
+
+    def _refresh(self):
+        # Pick up rows appended since we last looked, by this or another process.
+        # A store created by another process after this one started also brings its meta.
+        if self.dim is None:
+            self._load_meta()
+        if self.dim is None or not os.path.exists(self.keys_path):
+            return
+        count = os.path.getsize(self.keys_path) // self.KEY_SIZE
+        if count <= self._count:
+            return
+        with open(self.keys_path, "rb") as f:
+            f.seek(self._count * self.KEY_SIZE)
+            data = f.read((count - self._count) * self.KEY_SIZE)
+        for i in range(count - self._count):
+            self._rows[data[i * self.KEY_SIZE:(i + 1) * self.KEY_SIZE]] = self._count + i
+        self._count = count
+        self._vectors = None
+
+    def _matrix(self):
+        if self._vectors is None and self._count:
+            self._vectors = np.memmap(self.vectors_path, dtype=self.dtype, mode="r", shape=(self._count, self.dim))
+        return self._vectors
+
+    def get_many(self, texts):
+        """Cached vectors (float32) for texts, with None for misses."""
+        keys = [self.key(text) for text in texts]
+        with self._lock:
+            if any(key not in self._rows for key in keys):
+                self._refresh()
+            matrix = self._matrix()
+            results = []
+            for key in keys:
+                row = self._rows.get(key)
+                results.append(None if row is None else np.asarray(matrix[row], dtype=np.float32))
+            hits = sum(result is not None for result in results)
+            self.hits += hits
+            self.misses += len(results) - hits
+            return results
+
+    def put_many(self, texts, vectors):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if not len(vectors):
+            return
+        with self._lock, file_lock(self.lock_path):
+            self._refresh()
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+                # Readers load the meta without the lock, so never let them see it half written
+                tmp_path = self.meta_path + ".tmp"
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump({"namespace": self.namespace, "dim": self.dim, "dtype": self.dtype.name}, f)
+                os.replace(tmp_path, self.meta_path)
+
+            new_keys, new_rows, seen = [], [], set()
+            for text, vector in zip(texts, vectors):
+                key = self.key(text)
+                if key in self._rows or key in seen:
+                    continue
+                seen.add(key)
+                new_keys.append(key)
+                new_rows.append(vector)
+            if not new_keys:
+                return
+
+            self._truncate_torn_write()
+            with open(self.vectors_path, "ab") as f:
+                f.write(np.asarray(new_rows, dtype=self.dtype).tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            with open(self.keys_path, "ab") as f:
+                f.write(b"".join(new_keys))
+            self._refresh()
+
+    def _truncate_torn_write(self):
+        # Row numbers come from the keys file, so anything beyond its last complete key must go
+        # or every key appended after it would point at the wrong vector
+        for path, size in ((self.keys_path, self._count * self.KEY_SIZE),
+                           (self.vectors_path, self._count * self.dim * self.dtype.itemsize)):
+            if os.path.exists(path) and os.path.getsize(path) > size:
+                print(f"Embedding cache {self.namespace}: dropping {os.path.getsize(path) - size} bytes of an interrupted write from {path}")
+                with open(path, "r+b") as f:
+                    f.truncate(size)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {"entries": self._count, "hits": self.hits, "misses": self.misses, "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0}
+
+
+class CachedEmbeddings(Embeddings):
+    """Wraps an embedding model so repeated chunk and query texts never go back over the network."""
+
+    def __init__(self, embedding_model, directory=None, dtype=None):
+        self.embedding_model = embedding_model
+        self.model = getattr(embedding_model, "model", None) or config.NVIDIA_EMBEDDING_MODEL_NAME
+        directory = directory or config.EMBEDDING_CACHE_DIR
+        dtype = dtype or config.EMBEDDING_CACHE_DTYPE
+        # Query and passage embeddings differ for asymmetric retrieval models, so cache them apart
+        self.document_cache = EmbeddingCache(directory, f"{self.model}:passage", dtype)
+        self.query_cache = EmbeddingCache(directory, f"{self.model}:query", dtype)
+
+    def embed_documents(self, texts):
+        cached = self.document_cache.get_many(texts)
+        missing = [i for i, vector in enumerate(cached) if vector is None]
+        if missing:
+            # Embed each distinct missing text once
+            unique_texts = list(dict.fromkeys(texts[i] for i in missing))
+            vectors = self.embedding_model.embed_documents(unique_texts)
+            self.document_cache.put_many(unique_texts, vectors)
+            by_text = dict(zip(unique_texts, vectors))
+            for i in missing:
+                cached[i] = by_text[texts[i]]
+        return [np.asarray(vector, dtype=np.float32).tolist() for vector in cached]
+
+    def embed_query(self, text):
+        cached = self.query_cache.get_many([text])[0]
+        if cached is not None:
+            return cached.tolist()
+        vector = self.embedding_model.embed_query(text)
+        self.query_cache.put_many([text], [vector])
+        return vector
+
+    def embed_queries(self, texts):
+        """Query embeddings for several texts, with one remote call for all the misses."""
+        cached = self.query_cache.get_many(texts)
+        missing = [i for i, vector in enumerate(cached) if vector is None]
+        if missing:
+            unique_texts = list(dict.fromkeys(texts[i] for i in missing))
+            vectors = embed_queries(self.embedding_model, unique_texts)
+            self.query_cache.put_many(unique_texts, vectors)
+            by_text = dict(zip(unique_texts, vectors))
+            for i in missing:
+                cached[i] = by_text[texts[i]]
+        return [np.asarray(vector, dtype=np.float32).tolist() for vector in cached]
+
+    def _truncate_torn_write(self):
+        # Row numbers come from the keys file, so anything beyond its last complete key must go
+        # or every key appended after it would point at the wrong vector
+        for path, size in ((self.keys_path, self._count * self.KEY_SIZE),
+                           (self.vectors_path, self._count * self.dim * self.dtype.itemsize)):
+            if os.path.exists(path) and os.path.getsize(path) > size:
+                print(f"Embedding cache {self.namespace}: dropping {os.path.getsize(path) - size} bytes of an interrupted write from {path}")
+                with open(path, "r+b") as f:
+                    f.truncate(size)
+
+    def stats(self):
+        return {"documents": self.document_cache.stats(), "queries": self.query_cache.stats()}
@@ -0,0 +1,130 @@
+import os
+import json
+import math
+import faiss
+import numpy as np
+from scripts import config
+
+INDEX_PARAMS_FILE = "index_params.json"
+INDEX_TYPES = ("flat", "flat_fp16", "hnsw", "ivf_flat", "ivf_pq", "ivf_sq8")
+# Types whose rows can be removed in place with FAISS row ids shifting down, as LangChain's delete() assumes
+REMOVABLE_INDEX_TYPES = ("flat", "flat_fp16")
+
+
+def default_index_params(index_type=None):
+    return {
+        "type": index_type or config.FAISS_INDEX_TYPE,
+        "nlist": config.FAISS_NLIST,
+        "pq_m": config.FAISS_PQ_M,
+        "pq_nbits": config.FAISS_PQ_NBITS,
+        "hnsw_m": config.FAISS_HNSW_M,
+        "ef_construction": config.FAISS_HNSW_EF_CONSTRUCTION,
+        "train_size": config.FAISS_TRAIN_SIZE,
+    }
+
+
+def load_index_params(index_path):
+    """Build parameters saved with the index; indexes built before they were recorded are flat."""
+    params_file = os.path.join(index_path, INDEX_PARAMS_FILE)
+    if not os.path.exists(params_file):
+        return {**default_index_params("flat")}
+    with open(params_file, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_index_params(index_path, params):
+    with open(os.path.join(index_path, INDEX_PARAMS_FILE), "w", encoding="utf-8") as f:
+        json.dump(params, f, indent=2)
+
+
+def choose_nlist(num_vectors):
+    # ~4*sqrt(n) lists, but never fewer than 39 training points per centroid
+    return max(1, min(int(4 * math.sqrt(num_vectors)), num_vectors // 39))
+
+
+def sample_training_vectors(vectors, train_size, seed=0):
+    if train_size <= 0 or len(vectors) <= train_size:
+        return vectors
+    rows = np.random.default_rng(seed).choice(len(vectors), train_size, replace=False)
+    return vectors[np.sort(rows)]
+
+
+def build_faiss_index(vectors, params):
+    """A trained FAISS index of params["type"] holding vectors in row order (L2, like LangChain's default)."""
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    index_type = params["type"]
+    num_vectors, dim = vectors.shape
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown FAISS index type {index_type!r}, expected one of {', '.join(INDEX_TYPES)}")
+
+    if index_type == "flat":
+        index = faiss.IndexFlatL2(dim)
+    elif index_type == "flat_fp16":
+        index = faiss.IndexScalarQuantizer(dim, faiss.ScalarQuantizer.QT_fp16)
+    elif index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, params["hnsw_m"])
+        index.hnsw.efConstruction = params["ef_construction"]
+    else:
+        nlist = params.get("nlist") or choose_nlist(num_vectors)
+        # Kept apart from "nlist" so a rebuild with nlist=0 re-picks the list count for the new size
+        params["ivf_lists"] = nlist
+        quantizer = faiss.IndexFlatL2(dim)
+        if index_type == "ivf_flat":
+            index = faiss.IndexIVFFlat(quantizer, dim, nlist)
+        elif index_type == "ivf_sq8":
+            index = faiss.IndexIVFScalarQuantizer(quantizer, dim, nlist, faiss.ScalarQuantizer.QT_8bit)
+        else:
+            if dim % params["pq_m"]:
+                raise ValueError(f"pq_m={params['pq_m']} must divide the embedding dimension {dim}")
+            index = faiss.IndexIVFPQ(quantizer, dim, nlist, params["pq_m"], params["pq_nbits"])
+
+    if not index.is_trained:
+        training = sample_training_vectors(vectors, params.get("train_size", 0))
+        print(f"Training {index_type} index on {len(training)} of {num_vectors} vectors...")
+        index.train(training)
+    index.add(vectors)
+    params["dim"] = dim
+    configure_search(index)
+    return index
+
+
+def read_faiss_index(path, mmap=False):
+    """Read an index file; with mmap the vectors stay in the page cache instead of process memory.
+
+    A memory-mapped index is read-only: adding or removing vectors aborts the process, so only
+    the serving path may open it this way.
+    """
+    if not mmap:
+        return faiss.read_index(path)
+    return faiss.read_index(path, faiss.IO_FLAG_MMAP_IFC | faiss.IO_FLAG_READ_ONLY)
+
+
+def index_vectors(index):
+    """All vectors stored in an index, in row order (approximate for PQ/SQ codes)."""
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf.make_direct_map()
+        try:
+            return index.reconstruct_n(0, index.ntotal)
+        finally:
+            ivf.set_direct_map_type(faiss.DirectMap.NoMap)
+    return index.reconstruct_n(0, index.ntotal)
+
+
+def configure_search(index, nprobe=None, ef_search=None):
+    """Apply the search-time knobs; LangChain's own search calls use them too."""
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf.nprobe = min(nprobe or config.FAISS_NPROBE, ivf.nlist)
+    if isinstance(index, faiss.IndexHNSW):
+        index.hnsw.efSearch = ef_search or config.FAISS_EF_SEARCH
+
+
+def search_parameters(index, selector):
+    """SearchParameters of the type the index expects, restricting the search to selector."""
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        return faiss.SearchParametersIVF(sel=selector, nprobe=ivf.nprobe)
+    if isinstance(index, faiss.IndexHNSW):
+        return faiss.SearchParametersHNSW(sel=selector, efSearch=index.hnsw.efSearch)
+    return faiss.SearchParameters(sel=selector)
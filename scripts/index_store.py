@@ -0,0 +1,191 @@
+import os
+import json
+import time
+import uuid
+import shutil
+import hashlib
+import faiss
+from datetime import datetime
+from contextlib import contextmanager
+from langchain_community.vectorstores import FAISS
+from scripts.bm25_index import BM25Index, BM25_INDEX_FILE
+from scripts.faiss_index import INDEX_PARAMS_FILE, save_index_params, read_faiss_index
+from scripts.chunk_store import ChunkStore, CHUNK_STORE_FILE, write_chunk_store
+from scripts import config
+from scripts.file_lock import file_lock
+
+# Points at the directory of the published version; replaced last on every save, so readers
+# only ever see a version once all of its files are in place
+INDEX_VERSION_FILE = "index_version.json"
+# Every saved version gets its own directory in here and is never modified afterwards
+INDEX_VERSIONS_DIR = "versions"
+# File and chunk content hashes of everything in the index, used for incremental updates
+INDEX_MANIFEST_FILE = "index_manifest.json"
+# Pickled docstore written by FAISS.save_local, replaced by CHUNK_STORE_FILE
+LEGACY_DOCSTORE_FILE = "index.pkl"
+# Files of an index saved straight into the index directory, before versions had directories
+LEGACY_INDEX_FILES = ("index.faiss", CHUNK_STORE_FILE, BM25_INDEX_FILE, INDEX_MANIFEST_FILE, INDEX_PARAMS_FILE, LEGACY_DOCSTORE_FILE)
+
+
+def hash_file(file_path):
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def assign_chunk_ids(documents):
+    """Content-addressed docstore ids: unchanged chunks keep their id across re-chunking."""
+    ids = []
+    seen = {}
+    for doc in documents:
+        key = (doc.metadata.get("source", ""), doc.page_content)
+        # Repeated text within one file still needs distinct ids
+        occurrence = seen.get(key, 0)
+        seen[key] = occurrence + 1
+        digest = hashlib.sha256(f"{key[0]}\n{occurrence}\n{key[1]}".encode("utf-8")).hexdigest()
+        ids.append(digest)
+    return ids
+
+
+def load_manifest(index_path):
+    manifest_file = os.path.join(current_index_dir(index_path), INDEX_MANIFEST_FILE)
+    if not os.path.exists(manifest_file):
+        return None
+    with open(manifest_file, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def read_published_index(index_path):
+    """(version, directory holding its files) of the index published at index_path.
+
+    Read both from one version file, so a reader never pairs one version's id with another's files.
+    """
+    version_file = os.path.join(index_path, INDEX_VERSION_FILE)
+    if os.path.exists(version_file):
+        with open(version_file, "r", encoding="utf-8") as f:
+            published = json.load(f)
+        # Version files written before versions had directories describe the files in index_path
+        directory = published.get("directory")
+        return published.get("version"), os.path.join(index_path, directory) if directory else index_path
+
+    # Indexes saved before version files existed: fall back to the index file's mtime
+    faiss_file = os.path.join(index_path, "index.faiss")
+    if os.path.exists(faiss_file):
+        return f"mtime-{int(os.path.getmtime(faiss_file))}", index_path
+    return None, index_path
+
+
+def read_index_version(index_path):
+    return read_published_index(index_path)[0]
+
+
+def current_index_dir(index_path):
+    return read_published_index(index_path)[1]
+
+
+def write_index_version(index_path, version, directory):
+    version_file = os.path.join(index_path, INDEX_VERSION_FILE)
+    tmp_file = version_file + ".tmp"
+    with open(tmp_file, "w", encoding="utf-8") as f:
+        json.dump({"version": version, "directory": directory, "created_at": time.time()}, f)
+    for attempt in range(10):
+        try:
+            os.replace(tmp_file, version_file)
+            return
+        except PermissionError:
+            # Windows refuses while a reader has the old file open for the moment it takes to read it
+            if attempt == 9:
+                raise
+            time.sleep(0.1)
+
+
+def load_index(index_path, embedding_model, mmap=False):
+    """Load a saved vectorstore; chunk text stays on disk in the chunk store until a search needs it.
+
+    index_path: the index directory (loads the published version) or one version's directory.
+    mmap: memory-map the FAISS index read-only (for serving; never for index updates).
+    """
+    index_dir = current_index_dir(index_path)
+    index_file = os.path.join(index_dir, "index.faiss")
+    chunk_store_file = os.path.join(index_dir, CHUNK_STORE_FILE)
+    if not os.path.exists(chunk_store_file):
+        # Not migrated yet: unpickle every chunk like FAISS.load_local always did
+        vectorstore = FAISS.load_local(index_dir, embedding_model, allow_dangerous_deserialization=True)
+        if mmap:
+            vectorstore.index = read_faiss_index(index_file, mmap=True)
+        return vectorstore
+
+    docstore = ChunkStore(chunk_store_file)
+    index = read_faiss_index(index_file, mmap)
+    positions = docstore.load_positions()
+    if index.ntotal != len(positions):
+        docstore.close()
+        raise ValueError(f"{index_file} has {index.ntotal} vectors but {chunk_store_file} maps {len(positions)}")
+    return FAISS(embedding_model, index, docstore, positions)
+
+
+@contextmanager
+def index_write_lock(index_path):
+    """Serialise index updates across processes, e.g. the upload workers of several uvicorn workers."""
+    os.makedirs(os.path.dirname(os.path.abspath(index_path)), exist_ok=True)
+    with file_lock(index_path.rstrip("\\/") + ".lock"):
+        yield
+
+
+def save_vectorstore(vectorstore, index_path, manifest=None, index_params=None):
+    """Save the vectorstore as a new version directory and publish it by rewriting the version file.
+
+    Published versions are never modified, so a reader always loads one version's files together
+    and no save replaces a file another process has open or memory-mapped.
+    """
+    # Microseconds, so versions saved within the same second still sort in save order
+    version = f"{datetime.now().strftime('%Y%m%dT%H%M%S%f')}-{uuid.uuid4().hex[:8]}"
+    versions_path = os.path.join(index_path, INDEX_VERSIONS_DIR)
+    staging_path = os.path.join(versions_path, version + ".staging")
+    os.makedirs(staging_path)
+    faiss.write_index(vectorstore.index, os.path.join(staging_path, "index.faiss"))
+    write_chunk_store(os.path.join(staging_path, CHUNK_STORE_FILE), vectorstore.docstore, vectorstore.index_to_docstore_id)
+    # Rebuilt from the docstore on every save so its rows always line up with the FAISS rows
+    BM25Index.from_vectorstore(vectorstore).save(os.path.join(staging_path, BM25_INDEX_FILE))
+    if manifest is not None:
+        with open(os.path.join(staging_path, INDEX_MANIFEST_FILE), "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+    if index_params is not None:
+        save_index_params(staging_path, index_params)
+
+    os.replace(staging_path, os.path.join(versions_path, version))
+    write_index_version(index_path, version, f"{INDEX_VERSIONS_DIR}/{version}")
+    remove_old_versions(index_path, version)
+    return version
+
+
+def remove_old_versions(index_path, current_version, keep=None):
+    """Delete all but the newest `keep` versions, plus files left by interrupted saves and the legacy layout.
+
+    Callers hold index_write_lock. On POSIX a process serving a deleted version keeps its open
+    and mapped files. On Windows a version some process still has open can't be renamed, so it
+    is left whole and retried on the next save.
+    """
+    keep = keep or config.INDEX_KEEP_VERSIONS
+    versions_path = os.path.join(index_path, INDEX_VERSIONS_DIR)
+    leftovers = [name for name in os.listdir(versions_path) if name.endswith((".staging", ".deleting"))]
+    # Version ids start with their save time, so newest sort last
+    versions = sorted(name for name in os.listdir(versions_path) if name not in leftovers and name != current_version)
+    for name in versions[:max(0, len(versions) - (keep - 1))]:
+        try:
+            os.rename(os.path.join(versions_path, name), os.path.join(versions_path, name + ".deleting"))
+        except OSError as e:
+            print(f"Index version {name} is still in use, keeping it for now: {e}")
+            continue
+        leftovers.append(name + ".deleting")
+    for name in leftovers:
+        shutil.rmtree(os.path.join(versions_path, name), ignore_errors=True)
+    for file_name in LEGACY_INDEX_FILES:
+        try:
+            os.remove(os.path.join(index_path, file_name))
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            print(f"Could not remove old index file {file_name} yet: {e}")
@@ -0,0 +1,115 @@
+import os
+import time
+import random
+import shutil
+import hashlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import numpy as np
+from scripts import config
+
+
+class EmbeddingCheckpoint:
+    """Finished embedding batches on disk, keyed by a hash of the model and batch texts.
+
+    Chunking is deterministic, so a re-run produces the same batches and picks up
+    every batch that completed before a crash.
+    """
+
+    def __init__(self, directory, model_name):
+        self.directory = directory
+        self.model_name = model_name
+        os.makedirs(directory, exist_ok=True)
+
+    def batch_key(self, texts):
+        digest = hashlib.sha256(self.model_name.encode("utf-8"))
+        for text in texts:
+            digest.update(b"\0")
+            digest.update(text.encode("utf-8"))
+        return digest.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"batch-{key}.npy")
+
+    def load(self, key):
+        path = self._path(key)
+        if not os.path.exists(path):
+            return None
+        return np.load(path)
+
+    def save(self, key, vectors):
+        path = self._path(key)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            np.save(f, np.asarray(vectors, dtype=np.float32))
+        os.replace(tmp_path, path)
+
+    def clear(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+def embed_with_retry(embedding_model, texts, max_retries=None, backoff_seconds=None):
+    max_retries = config.EMBED_MAX_RETRIES if max_retries is None else max_retries
+    backoff_seconds = config.EMBED_RETRY_BACKOFF_SECONDS if backoff_seconds is None else backoff_seconds
+
+    for attempt in range(max_retries + 1):
+        try:
+            return embedding_model.embed_documents(texts)
+        except Exception as e:
+            if attempt == max_retries:
+                raise
+            # Exponential backoff with jitter so parallel workers don't retry in lockstep
+            delay = backoff_seconds * (2 ** attempt) * (1 + random.random() * 0.25)
+            print(f"Embedding batch failed ({e}), retrying in {delay:.1f}s ({attempt + 1}/{max_retries})...")
+            time.sleep(delay)
+
+
+def embed_documents_batched(texts, embedding_model, batch_size=None, max_workers=None, checkpoint_dir=None, model_name=None):
+    """Embed texts in batches on a bounded thread pool, checkpointing each finished batch.
+
+    Returns a float32 array with one row per text, in input order.
+    """
+    batch_size = batch_size or config.EMBED_BATCH_SIZE
+    max_workers = max_workers or config.EMBED_MAX_WORKERS
+    checkpoint_dir = checkpoint_dir or config.EMBED_CHECKPOINT_DIR
+    model_name = model_name or getattr(embedding_model, "model", None) or config.NVIDIA_EMBEDDING_MODEL_NAME
+    checkpoint = EmbeddingCheckpoint(checkpoint_dir, model_name)
+
+    batches = [texts[i:i + batch_size] for i in range(0, len(texts), batch_size)]
+    results = [None] * len(batches)
+    pending = []
+    for batch_index, batch in enumerate(batches):
+        key = checkpoint.batch_key(batch)
+        vectors = checkpoint.load(key)
+        if vectors is not None:
+            results[batch_index] = vectors
+        else:
+            pending.append((batch_index, key, batch))
+
+    resumed = len(batches) - len(pending)
+    if resumed:
+        print(f"Resuming from checkpoint: {resumed}/{len(batches)} batches already embedded.")
+
+    def run_batch(batch_index, key, batch):
+        vectors = np.asarray(embed_with_retry(embedding_model, batch), dtype=np.float32)
+        checkpoint.save(key, vectors)
+        return batch_index, vectors
+
+    start = time.perf_counter()
+    embedded = 0
+    total = sum(len(batch) for _, _, batch in pending)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(run_batch, *item) for item in pending]
+        for future in as_completed(futures):
+            batch_index, vectors = future.result()
+            results[batch_index] = vectors
+            embedded += len(vectors)
+            elapsed = time.perf_counter() - start
+            print(f"Embedded {embedded}/{total} chunks ({embedded / elapsed:.1f} chunks/sec)")
+
+    elapsed = time.perf_counter() - start
+    if total:
+        print(f"Embedded {total} chunks in {elapsed:.1f}s ({total / elapsed:.1f} chunks/sec).")
+
+    if not results:
+        return np.zeros((0, 0), dtype=np.float32)
+    return np.vstack(results)
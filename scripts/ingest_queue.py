@@ -0,0 +1,183 @@
+import sqlite3
+import threading
+from scripts import config
+
+def init_queue():
+    conn = sqlite3.connect(config.INGEST_QUEUE_DB)
+    cursor = conn.cursor()
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS ingest_jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            file_path TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            error TEXT,
+            index_version TEXT,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_ingest_jobs_status ON ingest_jobs (status, id)")
+    # Queues created before uploads were de-duplicated have no content_hash column
+    if "content_hash" not in {row[1] for row in cursor.execute("PRAGMA table_info(ingest_jobs)")}:
+        cursor.execute("ALTER TABLE ingest_jobs ADD COLUMN content_hash TEXT")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_ingest_jobs_hash ON ingest_jobs (content_hash)")
+    requeue_expired_jobs(cursor)
+    conn.commit()
+    conn.close()
+
+def requeue_expired_jobs(cursor):
+    # Jobs left 'processing' by a crashed worker go back on the queue once their lease runs out;
+    # live workers, in this process or another, keep renewing theirs
+    cursor.execute(
+        "UPDATE ingest_jobs SET status = 'pending', updated_at = CURRENT_TIMESTAMP WHERE status = 'processing' AND updated_at < datetime('now', ?)",
+        (f"-{config.INGEST_LEASE_SECONDS} seconds",)
+    )
+
+def enqueue_file(file_path, content_hash=None):
+    conn = sqlite3.connect(config.INGEST_QUEUE_DB)
+    cursor = conn.cursor()
+    cursor.execute("INSERT INTO ingest_jobs (file_path, content_hash) VALUES (?, ?)", (file_path, content_hash))
+    job_id = cursor.lastrowid
+    conn.commit()
+    conn.close()
+    return job_id
+
+def find_queued_hashes(content_hashes):
+    """file_path of the pending or processing job for each of content_hashes that has one."""
+    content_hashes = list(set(content_hashes))
+    found = {}
+    conn = sqlite3.connect(config.INGEST_QUEUE_DB)
+    cursor = conn.cursor()
+    for start in range(0, len(content_hashes), 500):
+        batch = content_hashes[start:start + 500]
+        placeholders = ",".join("?" * len(batch))
+        cursor.execute(
+            f"SELECT content_hash, file_path FROM ingest_jobs WHERE status IN ('pending', 'processing') AND content_hash IN ({placeholders})",
+            batch
+        )
+        found.update(cursor.fetchall())
+    conn.close()
+    return found
+
+def get_job(job_id):
+    conn = sqlite3.connect(config.INGEST_QUEUE_DB)
+    conn.row_factory = sqlite3.Row
+    cursor = conn.cursor()
+    cursor.execute("SELECT id, file_path, status, error, index_version, created_at, updated_at FROM ingest_jobs WHERE id = ?", (job_id,))
+    job = cursor.fetchone()
+    conn.close()
+    return dict(job) if job else None
+
+def claim_pending_jobs(limit):
+    conn = sqlite3.connect(config.INGEST_QUEUE_DB, isolation_level=None)
+    cursor = conn.cursor()
+    # BEGIN IMMEDIATE so two workers can never claim the same job
+    cursor.execute("BEGIN IMMEDIATE")
+    requeue_expired_jobs(cursor)
+    cursor.execute("SELECT id, file_path FROM ingest_jobs WHERE status = 'pending' ORDER BY id LIMIT ?", (limit,))
+    jobs = cursor.fetchall()
+    cursor.executemany("UPDATE ingest_jobs SET status = 'processing', updated_at = CURRENT_TIMESTAMP WHERE id = ?", [(job_id,) for job_id, _ in jobs])
+    cursor.execute("COMMIT")
+    conn.close()
+    return jobs
+
+def renew_jobs(job_ids):
+    conn = sqlite3.connect(config.INGEST_QUEUE_DB)
+    cursor = conn.cursor()
+    cursor.executemany("UPDATE ingest_jobs SET updated_at = CURRENT_TIMESTAMP WHERE id = ? AND status = 'processing'", [(job_id,) for job_id in job_ids])
+    conn.commit()
+    conn.close()
+
+def finish_jobs(job_ids, status, index_version=None, error=None):
+    conn = sqlite3.connect(config.INGEST_QUEUE_DB)
+    cursor = conn.cursor()
+    cursor.executemany(
+        "UPDATE ingest_jobs SET status = ?, index_version = ?, error = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?",
+        [(status, index_version, error, job_id) for job_id in job_ids]
+    )
+    conn.commit()
+    conn.close()
+
+
+class IngestWorker:
+    """Background thread that folds queued uploads into the live index in batches."""
+
+    def __init__(self, on_index_updated=None):
+        self.on_index_updated = on_index_updated
+        self._wake_event = threading.Event()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        init_queue()
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="ingest-worker", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        self._wake_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def notify(self):
+        self._wake_event.set()
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            self._wake_event.wait(config.INGEST_POLL_INTERVAL_SECONDS)
+            if self._stop_event.is_set():
+                break
+            if self._wake_event.is_set():
+                # Give uploads that arrive together a moment to land in the same batch
+                self._stop_event.wait(config.INGEST_BATCH_DELAY_SECONDS)
+                self._wake_event.clear()
+            try:
+                while self.process_batch():
+                    pass
+            except Exception as e:
+                print(f"Ingest worker error: {e}")
+
+    def _renew_lease(self, job_ids, done):
+        # Waiting for the index lock or a full rebuild can outlast the lease many times over
+        while not done.wait(config.INGEST_LEASE_SECONDS / 3):
+            try:
+                renew_jobs(job_ids)
+            except sqlite3.Error as e:
+                print(f"Could not renew ingest jobs {job_ids}: {e}")
+
+    def process_batch(self):
+        """Index one batch of pending uploads. Returns False when the queue is empty."""
+        # Imported here so the API process only loads the embedding stack when there is work
+        from scripts.embed_and_index import update_index
+        from scripts.index_store import index_write_lock
+
+        jobs = claim_pending_jobs(config.INGEST_MAX_BATCH_FILES)
+        if not jobs:
+            return False
+
+        job_ids = [job_id for job_id, _ in jobs]
+        file_paths = [file_path for _, file_path in jobs]
+        print(f"Indexing {len(file_paths)} uploaded file(s)...")
+        done = threading.Event()
+        heartbeat = threading.Thread(target=self._renew_lease, args=(job_ids, done), name="ingest-lease", daemon=True)
+        heartbeat.start()
+        try:
+            # Every uvicorn worker runs an ingest worker; only one may update the index at a time
+            with index_write_lock(config.FAISS_INDEX_PATH):
+                version = update_index(file_paths=file_paths)
+        except Exception as e:
+            finish_jobs(job_ids, "failed", error=str(e))
+            print(f"Failed to index uploads {job_ids}: {e}")
+            return True
+        finally:
+            done.set()
+            heartbeat.join()
+
+        finish_jobs(job_ids, "done", index_version=version)
+        if version and self.on_index_updated is not None:
+            self.on_index_updated(version)
+        return True
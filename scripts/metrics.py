@@ -0,0 +1,201 @@
+import time
+import bisect
+import random
+import threading
+from contextlib import contextmanager
+from scripts import config
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+COUNT_BUCKETS = (0, 1, 2, 4, 8, 16, 32, 64, 128)
+
+
+def _format_value(value):
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for value in labels.values())
+    return "{" + ",".join(f'{name}="{value}"' for name, value in zip(labels, escaped)) + "}"
+
+
+class Counter:
+    type = "counter"
+
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, dict(key), value) for key, value in self._values.items()]
+
+
+class Histogram:
+    type = "histogram"
+
+    def __init__(self, name, help, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        # label key -> [per-bucket counts, sum, count]
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            if index < len(self.buckets):
+                series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def samples(self):
+        samples = []
+        with self._lock:
+            for key, (counts, total, count) in self._series.items():
+                labels = dict(key)
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    samples.append((f"{self.name}_bucket", {**labels, "le": _format_value(float(bound))}, cumulative))
+                samples.append((f"{self.name}_bucket", {**labels, "le": "+Inf"}, count))
+                samples.append((f"{self.name}_sum", labels, total))
+                samples.append((f"{self.name}_count", labels, count))
+        return samples
+
+
+class MetricsRegistry:
+    """Process-local metrics rendered in the Prometheus text format.
+
+    Each uvicorn worker keeps its own registry, so with several workers every scrape
+    reports the worker that answered it; scrape workers individually or run one per pod.
+    """
+
+    def __init__(self):
+        self._metrics = []
+
+    def counter(self, name, help):
+        metric = Counter(name, help)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help, buckets=LATENCY_BUCKETS):
+        metric = Histogram(name, help, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def render(self, extra=()):
+        """All metrics, plus extra (name, type, help, samples) families computed at scrape time."""
+        families = [(metric.name, metric.type, metric.help, metric.samples()) for metric in self._metrics]
+        lines = []
+        for name, metric_type, help, samples in families + list(extra):
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            for sample_name, labels, value in samples:
+                lines.append(f"{sample_name}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+STAGE_SECONDS = REGISTRY.histogram("rag_stage_seconds", "Time spent in each query pipeline stage.")
+QUERY_SECONDS = REGISTRY.histogram("rag_query_seconds", "End-to-end query time.")
+QUERIES = REGISTRY.counter("rag_queries_total", "Queries answered, by path and whether the answer cache was hit.")
+SLOW_QUERIES = REGISTRY.counter("rag_slow_queries_total", "Queries slower than SLOW_QUERY_SECONDS.")
+DOCUMENTS = REGISTRY.histogram("rag_documents", "Documents per query after each stage.", COUNT_BUCKETS)
+TOKENS = REGISTRY.counter("rag_tokens_total", "Prompt and completion tokens sent to and received from the LLM.")
+
+
+class QueryTimer:
+    """Stage timings of one query; each stage is also observed in rag_stage_seconds."""
+
+    def __init__(self, path):
+        self.path = path
+        self.started = time.perf_counter()
+        self.stages = {}
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def observe(self, name, seconds):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+        if config.METRICS_ENABLED:
+            STAGE_SECONDS.observe(seconds, stage=name)
+
+    def count_documents(self, stage, count):
+        if config.METRICS_ENABLED:
+            DOCUMENTS.observe(count, stage=stage)
+
+    def count_tokens(self, prompt_tokens, completion_tokens):
+        if config.METRICS_ENABLED:
+            TOKENS.inc(prompt_tokens, kind="prompt")
+            TOKENS.inc(completion_tokens, kind="completion")
+
+    def finish(self, query, cached=False):
+        """Record the whole query and return its timings in milliseconds."""
+        total = time.perf_counter() - self.started
+        if config.METRICS_ENABLED:
+            QUERY_SECONDS.observe(total, path=self.path)
+            QUERIES.inc(path=self.path, cached=str(cached).lower())
+        timings = {name: round(seconds * 1000, 2) for name, seconds in self.stages.items()}
+        timings["total"] = round(total * 1000, 2)
+        if total >= config.SLOW_QUERY_SECONDS:
+            SLOW_QUERIES.inc(path=self.path)
+            if random.random() < config.SLOW_QUERY_LOG_SAMPLE_RATE:
+                stages = ", ".join(f"{name}={ms:.0f}ms" for name, ms in timings.items())
+                print(f"Slow {self.path} query ({total:.2f}s): {query[:200]!r} [{stages}]")
+        return timings
+
+
+def status_metrics(status):
+    """Metric families derived from RAGEngine.status(): cache hit counts, limiter queues and index size."""
+    caches = []
+    if status.get("answer_cache"):
+        caches.append(("answer", status["answer_cache"]))
+    for kind, stats in (status.get("embedding_cache") or {}).items():
+        caches.append((f"embedding_{kind}", stats))
+    limits = status.get("limits", {})
+    families = [
+        ("rag_cache_hits_total", "counter", "Cache lookups that found an entry.",
+         [("rag_cache_hits_total", {"cache": name}, stats["hits"]) for name, stats in caches]),
+        ("rag_cache_misses_total", "counter", "Cache lookups that found nothing.",
+         [("rag_cache_misses_total", {"cache": name}, stats["misses"]) for name, stats in caches]),
+        ("rag_limiter_in_flight", "gauge", "Calls holding a backend concurrency slot.",
+         [("rag_limiter_in_flight", {"backend": name}, stats["in_flight"]) for name, stats in limits.items()]),
+        ("rag_limiter_waiting", "gauge", "Calls queued for a backend concurrency slot.",
+         [("rag_limiter_waiting", {"backend": name}, stats["waiting"]) for name, stats in limits.items()]),
+        ("rag_limiter_rejected_total", "counter", "Calls rejected by a backend limiter.",
+         [("rag_limiter_rejected_total", {"backend": name}, stats["rejected"]) for name, stats in limits.items()]),
+        ("rag_index_vectors", "gauge", "Vectors in the loaded FAISS index.",
+         [("rag_index_vectors", {}, status["vectors"])]),
+        ("rag_index_reloads_total", "counter", "Index versions loaded by this process.",
+         [("rag_index_reloads_total", {}, status["reload_count"])]),
+    ]
+    cascade = status.get("rerank_cascade")
+    if cascade:
+        families.append(("rag_rerank_remote_skipped_total", "counter", "Queries whose remote rerank call the cascade skipped.",
+                         [("rag_rerank_remote_skipped_total", {}, cascade["remote_skipped"])]))
+    packing = status.get("context_packing")
+    if packing:
+        families.append(("rag_prompt_tokens_saved_total", "counter", "Prompt tokens removed by context packing.",
+                         [("rag_prompt_tokens_saved_total", {}, packing["prompt_tokens_saved"])]))
+    return families
@@ -0,0 +1,74 @@
+import asyncio
+
+
+def embed_queries(embedding_model, texts):
+    """Query embeddings for several texts in as few remote calls as the model allows."""
+    if hasattr(embedding_model, "embed_queries"):
+        return embedding_model.embed_queries(texts)
+    if hasattr(embedding_model, "_embed"):
+        # NVIDIAEmbeddings only exposes single-text query embedding, but its request takes a list
+        return embedding_model._embed(list(texts), model_type="query")
+    return [embedding_model.embed_query(text) for text in texts]
+
+
+class MicroBatcher:
+    """Collects items submitted within max_wait_ms of each other and handles them with one call.
+
+    handler takes a list of items and returns a list of results in the same order; it
+    runs on a worker thread, so it may block on the network or on FAISS.
+    """
+
+    def __init__(self, name, handler, max_batch_size, max_wait_ms):
+        self.name = name
+        self.handler = handler
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.batches = 0
+        self.items = 0
+        self._pending = []
+        self._timer = None
+        # The event loop only holds weak references to tasks; without these a running flush
+        # could be garbage-collected and leave its callers waiting forever
+        self._tasks = set()
+
+    async def submit(self, item):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((item, future))
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.get_running_loop().create_task(self._run(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch):
+        self.batches += 1
+        self.items += len(batch)
+        try:
+            results = await asyncio.to_thread(self.handler, [item for item, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), result in zip(batch, results):
+            # The caller may have timed out and cancelled its wait
+            if not future.done():
+                future.set_result(result)
+
+    def stats(self):
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "avg_batch_size": round(self.items / self.batches, 2) if self.batches else 0.0,
+        }
@@ -0,0 +1,50 @@
+"""Move the pickled docstore (index.pkl) of an existing index into the SQLite chunk store.
+
+    python scripts/migrate_docstore.py
+    python scripts/migrate_docstore.py --index-path ./models/faiss_index
+
+The FAISS vectors, manifest and index parameters are kept as they are. A new index version is
+published, so running servers switch over on their next reload.
+"""
+import sys
+import os
+import time
+import argparse
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from scripts.config import FAISS_INDEX_PATH
+from scripts.index_store import load_index, save_vectorstore, load_manifest, index_write_lock, current_index_dir, LEGACY_DOCSTORE_FILE
+from scripts.faiss_index import load_index_params
+from scripts.chunk_store import CHUNK_STORE_FILE
+from scripts.embed_and_index import get_embedding_model
+
+
+def migrate_docstore(index_path=None):
+    index_path = index_path or FAISS_INDEX_PATH
+    legacy_file = os.path.join(current_index_dir(index_path), LEGACY_DOCSTORE_FILE)
+    if not os.path.exists(legacy_file):
+        print(f"No {LEGACY_DOCSTORE_FILE} in {index_path}; nothing to migrate.")
+        return
+    legacy_size = os.path.getsize(legacy_file)
+    embedding_model = get_embedding_model()
+
+    # Held from load to save, so index updates made meanwhile (e.g. by the upload worker) are not overwritten
+    with index_write_lock(index_path):
+        start = time.perf_counter()
+        vectorstore = load_index(index_path, embedding_model)
+        print(f"Unpickled {vectorstore.index.ntotal} chunks in {time.perf_counter() - start:.2f}s")
+        index_params = load_index_params(current_index_dir(index_path))
+        version = save_vectorstore(vectorstore, index_path, manifest=load_manifest(index_path), index_params=index_params)
+    chunk_store_size = os.path.getsize(os.path.join(current_index_dir(index_path), CHUNK_STORE_FILE))
+    print(f"Wrote {CHUNK_STORE_FILE} ({chunk_store_size / 1e6:.1f} MB, was {legacy_size / 1e6:.1f} MB pickled), version {version}")
+
+    start = time.perf_counter()
+    load_index(index_path, embedding_model)
+    print(f"Index now loads in {time.perf_counter() - start:.2f}s")
+    return version
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Migrate a FAISS index from index.pkl to the SQLite chunk store.")
+    parser.add_argument("--index-path", help="Index directory (default: FAISS_INDEX_PATH)")
+    args = parser.parse_args()
+    migrate_docstore(args.index_path)
@@ -1,8 +1,25 @@
 import os
 import re
+from datetime import datetime
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain.docstore.document import Document
-from scripts.config import TRANSCRIPTS_DIR, CHUNK_SIZE, CHUNK_OVERLAP
+from scripts.config import TRANSCRIPTS_DIR, UPLOAD_DIR, CHUNK_SIZE, CHUNK_OVERLAP, PREPROCESS_WORKERS
+
+# One splitter per process, built on first use
+_splitter = None
+
+def get_splitter():
+    global _splitter
+    if _splitter is None:
+        _splitter = RecursiveCharacterTextSplitter(
+            chunk_size=CHUNK_SIZE,
+            chunk_overlap=CHUNK_OVERLAP,
+            length_function=len,
+            is_separator_regex=False,
+        )
+    return _splitter
 
 def preprocess_transcript(text):
     # Remove boilerplate (e.g., headers, footers, disclaimers)
@@ -10,47 +27,93 @@ def preprocess_transcript(text):
     text = re.sub(r"\n{2,}", "\n", text) # Reduce multiple newlines to single
     return text.strip()
 
-def load_and_chunk_transcripts(company_name=None):
-    all_documents = []
-    target_dir = os.path.join(TRANSCRIPTS_DIR, company_name) if company_name else TRANSCRIPTS_DIR
+def parse_transcript_metadata(file_path):
+    # Assuming path format: .../Transcripts/COMPANY/YYYY-Mon-DD-COMPANY.txt
+    parts = file_path.replace("\\", "/").split("/")
+    file = parts[-1]
+    company = parts[-2] if len(parts) >= 2 else "unknown"
+
+    date = "unknown"
+    match = re.match(r"(\d{4}-[A-Za-z]{3}-\d{2})(?:-(.+?))?\.txt$", file) # YYYY-Mon-DD-COMPANY.txt
+    if match:
+        try:
+            date = datetime.strptime(match.group(1), "%Y-%b-%d").date().isoformat()
+        except ValueError:
+            pass
+        # Uploads don't sit in a company folder; take the ticker from the file name instead
+        if match.group(2) and company.upper() != company:
+            company = match.group(2).upper()
+    return company, date
+
+def list_transcript_files(company_name=None, base_dir=TRANSCRIPTS_DIR):
+    target_dir = os.path.join(base_dir, company_name) if company_name else base_dir
 
-    for root, _, files in os.walk(target_dir):
-        for file in files:
+    # Sorted walk so chunk order (and therefore embedding batches) is the same on every run
+    file_paths = []
+    for root, dirs, files in os.walk(target_dir):
+        # Skip hidden folders such as the uploads' .incoming staging area
+        dirs[:] = sorted(d for d in dirs if not d.startswith("."))
+        for file in sorted(files):
             if file.endswith(".txt"):
-                file_path = os.path.join(root, file)
-                with open(file_path, "r", encoding="utf-8") as f:
-                    content = f.read()
-
-                preprocessed_content = preprocess_transcript(content)
-
-                # Extract metadata from file path (e.g., company, date)
-                # Assuming path format: .../Transcripts/COMPANY/YYYY-Mon-DD-COMPANY.txt
-                parts = file_path.split(os.sep)
-                company = parts[-2] if len(parts) >= 2 else "unknown"
-                date_match = re.search(r"\\d{4}-\\w{3}-\\d{2}", file) # YYYY-Mon-DD
-                date = date_match.group(0) if date_match else "unknown"
-
-                splitter = RecursiveCharacterTextSplitter(
-                    chunk_size=1200,
-                    chunk_overlap=250,
-                    length_function=len,
-                    is_separator_regex=False,
-                )
-                
-                # LangChain's splitter expects a list of strings for create_documents
-                # and applies metadata to all documents created from that string.
-                # If you want per-chunk metadata, you might need to iterate and create Document objects manually.
-                chunks = splitter.split_text(preprocessed_content)
-                
-                for i, chunk in enumerate(chunks):
-                    metadata = {
-                        "company": company,
-                        "date": date,
-                        "source": file_path,
-                        "chunk_id": f"{file_path}_{i}"
-                    }
-                    all_documents.append(Document(page_content=chunk, metadata=metadata))
-    return all_documents
+                file_paths.append(os.path.join(root, file))
+    return file_paths
+
+def list_uploaded_files(company_name=None):
+    # With company_name, only uploads kept in a <TICKER>/ folder match
+    return list_transcript_files(company_name, UPLOAD_DIR)
+
+def chunk_transcript_file(file_path):
+    with open(file_path, "r", encoding="utf-8") as f:
+        content = f.read()
+
+    preprocessed_content = preprocess_transcript(content)
+
+    # Extract metadata from file path (company ticker, ISO call date)
+    company, date = parse_transcript_metadata(file_path)
+
+    # LangChain's splitter expects a list of strings for create_documents
+    # and applies metadata to all documents created from that string.
+    # If you want per-chunk metadata, you might need to iterate and create Document objects manually.
+    chunks = get_splitter().split_text(preprocessed_content)
+
+    documents = []
+    for i, chunk in enumerate(chunks):
+        metadata = {
+            "company": company,
+            "date": date,
+            "source": file_path,
+            "chunk_id": f"{file_path}_{i}"
+        }
+        documents.append(Document(page_content=chunk, metadata=metadata))
+    return documents
+
+def iter_chunked_files(file_paths, workers=None):
+    """Yield (file_path, documents) in input order, chunking files in a process pool when workers > 1."""
+    workers = PREPROCESS_WORKERS if workers is None else workers
+    if workers <= 1:
+        for file_path in file_paths:
+            yield file_path, chunk_transcript_file(file_path)
+        return
+
+    # Only a bounded window of files is in flight, so memory stays flat however large the corpus
+    max_pending = workers * 4
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for file_path in file_paths:
+            pending.append((file_path, executor.submit(chunk_transcript_file, file_path)))
+            if len(pending) >= max_pending:
+                done_path, future = pending.popleft()
+                yield done_path, future.result()
+        while pending:
+            done_path, future = pending.popleft()
+            yield done_path, future.result()
+
+def iter_transcript_chunks(company_name=None, workers=None):
+    for _, documents in iter_chunked_files(list_transcript_files(company_name), workers):
+        yield from documents
+
+def load_and_chunk_transcripts(company_name=None, workers=None):
+    return list(iter_transcript_chunks(company_name, workers))
 
 if __name__ == "__main__":
     print(f"Loading and chunking transcripts from: {TRANSCRIPTS_DIR}")
@@ -60,4 +123,4 @@ if __name__ == "__main__":
     if documents:
         print("\n--- Example Chunk ---")
         print(f"Content: {documents[0].page_content[:200]}...")
-        print(f"Metadata: {documents[0].metadata}")
\ No newline at end of file
+        print(f"Metadata: {documents[0].metadata}")
@@ -11,39 +11,25 @@ from langchain_nvidia_ai_endpoints import NVIDIAEmbeddings, NVIDIARerank, ChatNV
 
 import os
 from scripts import config
+from scripts.embedding_cache import CachedEmbeddings
+from scripts.faiss_index import configure_search
+from scripts.index_store import load_index
 
 load_dotenv()
 
-def get_rag_chain():
-    # Load the FAISS index
-    if not os.path.exists(config.FAISS_INDEX_PATH):
-        raise FileNotFoundError(f"FAISS index not found at {config.FAISS_INDEX_PATH}. Please run embed_and_index.py first.")
-    
+def create_models():
+    # The remote clients are stateless and safe to share across chains and index reloads
     embedding_model = NVIDIAEmbeddings(model=config.NVIDIA_EMBEDDING_MODEL_NAME, api_key=config.NVIDIA_API_KEY, base_url=config.NVIDIA_API_BASE, truncate="NONE")
-    vectorstore = FAISS.load_local(config.FAISS_INDEX_PATH, embedding_model, allow_dangerous_deserialization=True)
+    if config.EMBEDDING_CACHE_ENABLED:
+        embedding_model = CachedEmbeddings(embedding_model)
 
-    # Initialize the reranker
-    retriever = vectorstore.as_retriever(search_kwargs={"k": 50}) # Retrieve more documents for reranking
-    
-    compressor = NVIDIARerank(
+    reranker = NVIDIARerank(
         model=config.NVIDIA_RERANKING_MODEL_NAME,
         api_key=config.NVIDIA_API_KEY,
         base_url=config.NVIDIA_API_BASE,
-        top_n=8
-    )
-    
-    compression_retriever = ContextualCompressionRetriever(
-        base_compressor=compressor,
-        base_retriever=retriever
-    )
-
-    # Define the prompt template
-    prompt = PromptTemplate(
-        template=config.PERSONA_PROMPT_TEMPLATE,
-        input_variables=["context", "question"]
+        top_n=config.RERANK_TOP_N
     )
 
-    # Initialize the LLM
     llm = ChatNVIDIA(
          model=config.LLM_MODEL_NAME,
          nvidia_api_key=config.NVIDIA_API_KEY,
@@ -51,6 +37,40 @@ def get_rag_chain():
          temperature=0.3
      )
 
+    return embedding_model, reranker, llm
+
+def load_vectorstore(embedding_model, index_path=None):
+    index_path = index_path or config.FAISS_INDEX_PATH
+    if not os.path.exists(index_path):
+        raise FileNotFoundError(f"FAISS index not found at {index_path}. Please run embed_and_index.py first.")
+
+    # Any FAISS index type loads here; index_params.json records how it was built
+    vectorstore = load_index(index_path, embedding_model, mmap=config.FAISS_MMAP)
+    configure_search(vectorstore.index)
+    return vectorstore
+
+def create_prompt():
+    return PromptTemplate(
+        template=config.PERSONA_PROMPT_TEMPLATE,
+        input_variables=["context", "question"]
+    )
+
+def format_context(documents):
+    # Same layout as the "stuff" chain RetrievalQA uses
+    return "\n\n".join(doc.page_content for doc in documents)
+
+def build_rag_chain(vectorstore, reranker, llm):
+    # Initialize the reranker
+    retriever = vectorstore.as_retriever(search_kwargs={"k": config.RETRIEVAL_K}) # Retrieve more documents for reranking
+
+    compression_retriever = ContextualCompressionRetriever(
+        base_compressor=reranker,
+        base_retriever=retriever
+    )
+
+    # Define the prompt template
+    prompt = create_prompt()
+
     # Create the RAG chain
     rag_chain = RetrievalQA.from_chain_type(
         llm=llm,
@@ -58,9 +78,15 @@ def get_rag_chain():
         chain_type_kwargs={"prompt": prompt},
         return_source_documents=True
     )
-    
+
     return rag_chain
 
+def get_rag_chain():
+    # Load the FAISS index
+    embedding_model, reranker, llm = create_models()
+    vectorstore = load_vectorstore(embedding_model)
+    return build_rag_chain(vectorstore, reranker, llm)
+
 if __name__ == "__main__":
     # Example usage
     try:
@@ -0,0 +1,479 @@
+import time
+import asyncio
+import threading
+from collections import namedtuple
+from scripts import config
+from scripts.index_store import read_published_index
+from scripts.answer_cache import SemanticAnswerCache
+from scripts.concurrency import ConcurrencyLimiter, OverloadedError, SlotTimeoutError
+from scripts.micro_batch import MicroBatcher, embed_queries
+from scripts.rag_chain import create_models, load_vectorstore, create_prompt, format_context
+from scripts.context_packing import pack_context, count_tokens
+from scripts.rerank_cascade import RerankCascade
+from scripts.metrics import QueryTimer
+from scripts.retrieval import MetadataIndex, parse_query_filters, search_documents, hybrid_search, load_bm25_index, is_empty_filter, search_vectors_batch
+
+# Everything that belongs to one index version is swapped as a single object, so a
+# request either sees the old index or the new one, never a mix.
+EngineState = namedtuple("EngineState", ["version", "vectorstore", "metadata_index", "bm25_index", "loaded_at", "load_seconds"])
+
+
+class RAGEngine:
+    """Process-wide RAG pipeline that is built once and hot-swapped when the index version changes."""
+
+    def __init__(self, index_path=None, watch_interval=None):
+        self.index_path = index_path or config.FAISS_INDEX_PATH
+        self.watch_interval = watch_interval or config.INDEX_WATCH_INTERVAL_SECONDS
+        self.embedding_model, self.reranker, self.llm = create_models()
+        self.prompt = create_prompt()
+        self.answer_cache = SemanticAnswerCache() if config.ANSWER_CACHE_ENABLED else None
+        self.llm_limiter = ConcurrencyLimiter("LLM", config.LLM_MAX_CONCURRENCY, config.MAX_QUEUED_REQUESTS, config.QUEUE_WAIT_TIMEOUT_SECONDS)
+        self.rerank_limiter = ConcurrencyLimiter("rerank", config.RERANK_MAX_CONCURRENCY, config.MAX_QUEUED_REQUESTS, config.QUEUE_WAIT_TIMEOUT_SECONDS)
+        # Batch questions get slots of their own, so a large batch never takes the interactive ones;
+        # they wait up to the query timeout for a slot instead of being turned away
+        self.batch_llm_limiter = ConcurrencyLimiter("batch LLM", config.BATCH_LLM_MAX_CONCURRENCY, config.MAX_QUEUED_REQUESTS, config.QUERY_TIMEOUT_SECONDS)
+        self.batch_rerank_limiter = ConcurrencyLimiter("batch rerank", config.BATCH_RERANK_MAX_CONCURRENCY, config.MAX_QUEUED_REQUESTS, config.QUERY_TIMEOUT_SECONDS)
+        self.query_batcher = None
+        self.search_batcher = None
+        if config.MICRO_BATCHING:
+            self.query_batcher = MicroBatcher("embed_query", self._embed_query_batch, config.MICRO_BATCH_MAX_SIZE, config.MICRO_BATCH_WAIT_MS)
+            self.search_batcher = MicroBatcher("faiss_search", self._search_batch, config.MICRO_BATCH_MAX_SIZE, config.MICRO_BATCH_WAIT_MS)
+        self.rerank_cascade = RerankCascade() if config.RERANK_CASCADE else None
+        self.rerank_coalesced = 0
+        self.packed_queries = 0
+        self.prompt_tokens_saved = 0
+        self._reranks = {}
+        self.reload_count = 0
+        self._state = None
+        self._reload_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._watcher = None
+        self.reload(force=True)
+
+    @property
+    def state(self):
+        return self._state
+
+    @property
+    def companies(self):
+        return self._state.metadata_index.companies
+
+    def reload(self, force=False):
+        """Load the index if its version changed. Returns True when a new version was swapped in."""
+        with self._reload_lock:
+            version, index_dir = read_published_index(self.index_path)
+            if not force and self._state is not None and self._state.version == version:
+                return False
+
+            start = time.perf_counter()
+            # Loaded from the version's own directory, so a save published meanwhile can't mix in its files
+            vectorstore = load_vectorstore(self.embedding_model, index_dir)
+            metadata_index = MetadataIndex(vectorstore)
+            bm25_index = load_bm25_index(vectorstore, index_dir) if config.HYBRID_SEARCH else None
+            load_seconds = time.perf_counter() - start
+
+            # In-flight queries keep a reference to the previous state and finish on it
+            self._state = EngineState(version, vectorstore, metadata_index, bm25_index, time.time(), load_seconds)
+            if self.answer_cache is not None:
+                self.answer_cache.set_index_version(version)
+            self.reload_count += 1
+            print(f"Loaded FAISS index version {version} in {load_seconds:.2f}s")
+            return True
+
+    def resolve_filter(self, query, search_filter=None, state=None):
+        state = state or self._state
+        if not is_empty_filter(search_filter):
+            return search_filter
+        if not config.QUERY_FILTER_PARSING:
+            return None
+        parsed = parse_query_filters(query, state.metadata_index.companies)
+        # A filter guessed from the wording must never leave the reranker with nothing
+        if parsed is not None and len(state.metadata_index.select(parsed)) == 0:
+            return None
+        return parsed
+
+    def _search(self, query, query_vector, search_filter, state, dense=None):
+        if state.bm25_index is not None:
+            # The cascade's dense scorer needs a FAISS score for every candidate
+            return hybrid_search(state.vectorstore, state.metadata_index, state.bm25_index, query, query_vector, config.RERANK_CANDIDATES, search_filter, dense,
+                                 score_all=self.rerank_cascade is not None)
+        return search_documents(state.vectorstore, state.metadata_index, query_vector, config.RETRIEVAL_K, search_filter, dense)
+
+    def _embed_query_batch(self, queries):
+        return embed_queries(self.embedding_model, queries)
+
+    def _search_batch(self, items):
+        """Dense results for (state, query_vector, search_filter) items, one FAISS call per index and filter."""
+        groups = {}
+        for i, (state, _, search_filter) in enumerate(items):
+            groups.setdefault((id(state), search_filter), []).append(i)
+        results = [None] * len(items)
+        for rows in groups.values():
+            state, _, search_filter = items[rows[0]]
+            vectors = [items[i][1] for i in rows]
+            for i, dense in zip(rows, search_vectors_batch(state.vectorstore, state.metadata_index, vectors, config.RETRIEVAL_K, search_filter)):
+                results[i] = dense
+        return results
+
+    def retrieve(self, query, search_filter=None, state=None, query_vector=None, timer=None):
+        state = state or self._state
+        timer = timer or QueryTimer("retrieve")
+        if query_vector is None:
+            with timer.stage("embed_query"):
+                query_vector = self.embedding_model.embed_query(query)
+        with timer.stage("search"):
+            candidates = self._search(query, query_vector, search_filter, state)
+        timer.count_documents("candidates", len(candidates))
+        if not candidates:
+            return []
+        with timer.stage("rerank"):
+            documents = self.rerank(query, candidates, query_vector)
+        timer.count_documents("reranked", len(documents))
+        return documents
+
+    def rerank(self, query, candidates, query_vector=None):
+        if self.rerank_cascade is None:
+            return list(self.reranker.compress_documents(candidates, query))
+        plan = self.rerank_cascade.plan(query, candidates, query_vector)
+        reranked = self.reranker.compress_documents(plan.uncertain, query) if plan.uncertain else []
+        return self.rerank_cascade.merge(plan, reranked)
+
+    def invoke(self, query, search_filter=None):
+        if isinstance(query, dict):
+            query = query["query"]
+        timer = QueryTimer("invoke")
+        state = self._state
+        search_filter = self.resolve_filter(query, search_filter, state)
+        with timer.stage("embed_query"):
+            query_vector = self.embedding_model.embed_query(query)
+
+        if self.answer_cache is not None:
+            with timer.stage("answer_cache"):
+                cached = self.answer_cache.get(query_vector, search_filter)
+            if cached is not None:
+                return {"query": query, "filter": search_filter, "cached": True, **cached, "timings": timer.finish(query, cached=True)}
+
+        documents = self.retrieve(query, search_filter, state, query_vector, timer)
+        context, context_report = self.build_context(documents, timer)
+        prompt = self.prompt.format(context=context, question=query)
+        with timer.stage("llm"):
+            message = self.llm.invoke(prompt)
+        self._count_tokens(timer, prompt, message.content, message)
+        self._cache_answer(state, query, query_vector, search_filter, message.content, documents)
+        return {"query": query, "result": message.content, "source_documents": documents, "filter": search_filter, "cached": False,
+                "context": context_report, "timings": timer.finish(query)}
+
+    def stream(self, query, search_filter=None):
+        """Yield a "sources" event once retrieval is done, then "token" events, then "done" with the full answer."""
+        timer = QueryTimer("stream")
+        state = self._state
+        search_filter = self.resolve_filter(query, search_filter, state)
+        with timer.stage("embed_query"):
+            query_vector = self.embedding_model.embed_query(query)
+
+        cached = None
+        if self.answer_cache is not None:
+            with timer.stage("answer_cache"):
+                cached = self.answer_cache.get(query_vector, search_filter)
+        if cached is not None:
+            yield {"type": "sources", "source_documents": cached["source_documents"], "filter": search_filter, "cached": True}
+            yield {"type": "token", "text": cached["result"]}
+            yield {"type": "done", "result": cached["result"], "timings": timer.finish(query, cached=True)}
+            return
+
+        documents = self.retrieve(query, search_filter, state, query_vector, timer)
+        context, context_report = self.build_context(documents, timer)
+        yield {"type": "sources", "source_documents": documents, "filter": search_filter, "cached": False, "context": context_report}
+
+        parts = []
+        prompt = self.prompt.format(context=context, question=query)
+        with timer.stage("llm"):
+            llm_started = time.perf_counter()
+            for chunk in self.llm.stream(prompt):
+                if chunk.content:
+                    if not parts:
+                        timer.observe("llm_first_token", time.perf_counter() - llm_started)
+                    parts.append(chunk.content)
+                    yield {"type": "token", "text": chunk.content}
+        answer = "".join(parts)
+        self._count_tokens(timer, prompt, answer)
+        self._cache_answer(state, query, query_vector, search_filter, answer, documents)
+        yield {"type": "done", "result": answer, "timings": timer.finish(query)}
+
+    async def aembed_query(self, query):
+        if self.query_batcher is not None:
+            return await self.query_batcher.submit(query)
+        return await self.embedding_model.aembed_query(query)
+
+    async def aretrieve(self, query, search_filter=None, state=None, query_vector=None, timer=None, dense=None, rerank_limiter=None):
+        state = state or self._state
+        timer = timer or QueryTimer("retrieve")
+        if query_vector is None:
+            with timer.stage("embed_query"):
+                query_vector = await self.aembed_query(query)
+        with timer.stage("search"):
+            if dense is None and self.search_batcher is not None:
+                dense = await self.search_batcher.submit((state, query_vector, search_filter))
+            # FAISS releases the GIL, so local search runs on a thread without blocking the event loop
+            candidates = await asyncio.to_thread(self._search, query, query_vector, search_filter, state, dense)
+        timer.count_documents("candidates", len(candidates))
+        if not candidates:
+            return []
+        with timer.stage("rerank"):
+            if self.rerank_cascade is None:
+                documents = await self._arerank(query, candidates, rerank_limiter)
+            else:
+                plan = await asyncio.to_thread(self.rerank_cascade.plan, query, candidates, query_vector)
+                reranked = await self._arerank(query, plan.uncertain, rerank_limiter) if plan.uncertain else []
+                documents = self.rerank_cascade.merge(plan, reranked)
+        timer.count_documents("reranked", len(documents))
+        return documents
+
+    async def _arerank(self, query, candidates, limiter=None):
+        # The rerank API scores one query per call, so the only batching available is
+        # sharing one call between concurrent requests for the same query and candidates
+        limiter = limiter or self.rerank_limiter
+        key = (limiter.name, query, tuple(doc.page_content for doc in candidates))
+        task = self._reranks.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._arerank_call(query, candidates, limiter))
+            self._reranks[key] = task
+            task.add_done_callback(lambda _: self._reranks.pop(key, None))
+        else:
+            self.rerank_coalesced += 1
+        # Shielded so one caller timing out does not cancel the call for the others
+        return list(await asyncio.shield(task))
+
+    async def _arerank_call(self, query, candidates, limiter):
+        async with limiter.slot():
+            return await self.reranker.acompress_documents(candidates, query)
+
+    async def _aprepare(self, query, search_filter, state, timer):
+        search_filter = self.resolve_filter(query, search_filter, state)
+        with timer.stage("embed_query"):
+            query_vector = await self.aembed_query(query)
+        cached = None
+        if self.answer_cache is not None:
+            with timer.stage("answer_cache"):
+                cached = await asyncio.to_thread(self.answer_cache.get, query_vector, search_filter)
+        return search_filter, query_vector, cached
+
+    async def ainvoke(self, query, search_filter=None, timeout=None):
+        """Async invoke with bounded LLM/rerank concurrency and a per-request timeout."""
+        return await asyncio.wait_for(self._ainvoke(query, search_filter), timeout or config.QUERY_TIMEOUT_SECONDS)
+
+    async def _ainvoke(self, query, search_filter):
+        timer = QueryTimer("ainvoke")
+        state = self._state
+        search_filter, query_vector, cached = await self._aprepare(query, search_filter, state, timer)
+        if cached is not None:
+            return {"query": query, "filter": search_filter, "cached": True, **cached, "timings": timer.finish(query, cached=True)}
+        return await self._agenerate(query, search_filter, state, query_vector, timer)
+
+    async def _agenerate(self, query, search_filter, state, query_vector, timer, dense=None, llm_limiter=None, rerank_limiter=None):
+        documents = await self.aretrieve(query, search_filter, state, query_vector, timer, dense, rerank_limiter)
+        context, context_report = self.build_context(documents, timer)
+        prompt = self.prompt.format(context=context, question=query)
+        queued = time.perf_counter()
+        async with (llm_limiter or self.llm_limiter).slot():
+            timer.observe("llm_queue", time.perf_counter() - queued)
+            with timer.stage("llm"):
+                message = await self.llm.ainvoke(prompt)
+        self._count_tokens(timer, prompt, message.content, message)
+        await asyncio.to_thread(self._cache_answer, state, query, query_vector, search_filter, message.content, documents)
+        return {"query": query, "result": message.content, "source_documents": documents, "filter": search_filter, "cached": False,
+                "context": context_report, "timings": timer.finish(query)}
+
+    async def abatch(self, requests, max_concurrency=None, share_limits=False):
+        """Answer (query, search_filter) pairs, yielding (i, response) in completion order.
+
+        Query embeddings are fetched together and dense search runs once per filter; reranking and
+        generation then run for at most max_concurrency questions at a time, on the batch limiters.
+        share_limits uses the interactive limiters instead, for a process that serves nothing else
+        (batch_query.py). A failed question yields a response with an "error" instead of stopping the batch.
+        """
+        if share_limits:
+            llm_limiter, rerank_limiter = self.llm_limiter, self.rerank_limiter
+        else:
+            llm_limiter, rerank_limiter = self.batch_llm_limiter, self.batch_rerank_limiter
+        state = self._state
+        requests = [(query, self.resolve_filter(query, search_filter, state)) for query, search_filter in requests]
+        texts = list(dict.fromkeys(query for query, _ in requests))
+        vectors = []
+        for start in range(0, len(texts), config.EMBED_BATCH_SIZE):
+            vectors.extend(await asyncio.to_thread(embed_queries, self.embedding_model, texts[start:start + config.EMBED_BATCH_SIZE]))
+        query_vectors = dict(zip(texts, vectors))
+        dense = await asyncio.to_thread(self._search_batch, [(state, query_vectors[query], search_filter) for query, search_filter in requests])
+        semaphore = asyncio.Semaphore(max_concurrency or config.BATCH_MAX_CONCURRENCY)
+
+        async def answer(i):
+            query, search_filter = requests[i]
+            async with semaphore:
+                timer = QueryTimer("batch")
+                try:
+                    cached = None
+                    if self.answer_cache is not None:
+                        with timer.stage("answer_cache"):
+                            cached = await asyncio.to_thread(self.answer_cache.get, query_vectors[query], search_filter)
+                    if cached is not None:
+                        return i, {"query": query, "filter": search_filter, "cached": True, **cached, "timings": timer.finish(query, cached=True)}
+                    for attempt in range(config.BATCH_MAX_RETRIES + 1):
+                        try:
+                            response = self._agenerate(query, search_filter, state, query_vectors[query], timer, dense[i], llm_limiter, rerank_limiter)
+                            return i, await asyncio.wait_for(response, config.QUERY_TIMEOUT_SECONDS)
+                        except (OverloadedError, SlotTimeoutError):
+                            # The limiters are saturated, e.g. by several batches at once; back off rather than fail the question
+                            if attempt == config.BATCH_MAX_RETRIES:
+                                raise
+                            await asyncio.sleep(2 ** attempt)
+                except Exception as e:
+                    return i, {"query": query, "filter": search_filter, "error": str(e) or type(e).__name__}
+
+        for task in asyncio.as_completed([answer(i) for i in range(len(requests))]):
+            yield await task
+
+    async def astream(self, query, search_filter=None):
+        """Async counterpart of stream(); the LLM slot is held until the last token."""
+        timer = QueryTimer("astream")
+        state = self._state
+        search_filter, query_vector, cached = await self._aprepare(query, search_filter, state, timer)
+        if cached is not None:
+            yield {"type": "sources", "source_documents": cached["source_documents"], "filter": search_filter, "cached": True}
+            yield {"type": "token", "text": cached["result"]}
+            yield {"type": "done", "result": cached["result"], "timings": timer.finish(query, cached=True)}
+            return
+
+        documents = await self.aretrieve(query, search_filter, state, query_vector, timer)
+        context, context_report = self.build_context(documents, timer)
+        yield {"type": "sources", "source_documents": documents, "filter": search_filter, "cached": False, "context": context_report}
+
+        parts = []
+        prompt = self.prompt.format(context=context, question=query)
+        queued = time.perf_counter()
+        async with self.llm_limiter.slot():
+            timer.observe("llm_queue", time.perf_counter() - queued)
+            with timer.stage("llm"):
+                llm_started = time.perf_counter()
+                async for chunk in self.llm.astream(prompt):
+                    if chunk.content:
+                        if not parts:
+                            timer.observe("llm_first_token", time.perf_counter() - llm_started)
+                        parts.append(chunk.content)
+                        yield {"type": "token", "text": chunk.content}
+        answer = "".join(parts)
+        self._count_tokens(timer, prompt, answer)
+        await asyncio.to_thread(self._cache_answer, state, query, query_vector, search_filter, answer, documents)
+        yield {"type": "done", "result": answer, "timings": timer.finish(query)}
+
+    def build_context(self, documents, timer=None):
+        """Prompt context for the reranked documents, and a report of the prompt tokens packing saved."""
+        timer = timer or QueryTimer("context")
+        with timer.stage("context"):
+            if not config.CONTEXT_PACKING:
+                context = format_context(documents)
+                tokens = count_tokens(context)
+                report = {"excerpts": len(documents), "raw_tokens": tokens, "packed_tokens": tokens, "tokens_saved": 0}
+            else:
+                packed = pack_context(documents)
+                # Let callers map the answer's [Excerpt N] citations back to source chunks
+                for number, excerpt_documents in enumerate(packed.excerpts, start=1):
+                    for doc in excerpt_documents:
+                        doc.metadata["excerpt"] = number
+                tokens_saved = packed.raw_tokens - packed.packed_tokens
+                self.packed_queries += 1
+                self.prompt_tokens_saved += tokens_saved
+                context = packed.text
+                report = {"excerpts": len(packed.excerpts), "raw_tokens": packed.raw_tokens, "packed_tokens": packed.packed_tokens, "tokens_saved": tokens_saved}
+        timer.count_documents("excerpts", report["excerpts"])
+        return context, report
+
+    def _count_tokens(self, timer, prompt, answer, message=None):
+        usage = getattr(message, "usage_metadata", None)
+        if usage:
+            timer.count_tokens(usage.get("input_tokens", 0), usage.get("output_tokens", 0))
+        else:
+            # Streamed chunks carry no usage totals; estimate them the way context packing does
+            timer.count_tokens(count_tokens(prompt), count_tokens(answer))
+
+    def _cache_answer(self, state, query, query_vector, search_filter, answer, documents):
+        # Skip answers computed against an index that was swapped out mid-query
+        if self.answer_cache is not None and self._state is state:
+            self.answer_cache.put(query, query_vector, search_filter, answer, documents)
+
+    def warmup(self, query):
+        """Send query through embedding, search and rerank, plus one short LLM call, without caching anything.
+
+        Opens the model connections and pages in the index before real traffic arrives.
+        """
+        documents = self.retrieve(query)
+        self.llm.bind(max_tokens=1).invoke(query)
+        return len(documents)
+
+    def status(self):
+        state = self._state
+        return {
+            "index_path": self.index_path,
+            "index_version": state.version,
+            "loaded_at": state.loaded_at,
+            "load_seconds": round(state.load_seconds, 3),
+            "reload_count": self.reload_count,
+            "watching": self._watcher is not None and self._watcher.is_alive(),
+            "vectors": state.vectorstore.index.ntotal,
+            "companies": state.metadata_index.companies,
+            "answer_cache": self.answer_cache.stats() if self.answer_cache is not None else None,
+            "embedding_cache": self.embedding_model.stats() if hasattr(self.embedding_model, "stats") else None,
+            "limits": {
+                "llm": self.llm_limiter.stats(),
+                "rerank": self.rerank_limiter.stats(),
+                "batch_llm": self.batch_llm_limiter.stats(),
+                "batch_rerank": self.batch_rerank_limiter.stats(),
+            },
+            "rerank_cascade": self.rerank_cascade.stats() if self.rerank_cascade is not None else None,
+            "micro_batching": {
+                "embed_query": self.query_batcher.stats() if self.query_batcher is not None else None,
+                "faiss_search": self.search_batcher.stats() if self.search_batcher is not None else None,
+                "rerank_coalesced": self.rerank_coalesced,
+            },
+            "context_packing": {
+                "queries": self.packed_queries,
+                "prompt_tokens_saved": self.prompt_tokens_saved,
+                "avg_tokens_saved": round(self.prompt_tokens_saved / self.packed_queries, 1) if self.packed_queries else 0.0,
+            },
+        }
+
+    def start_watching(self):
+        if self._watcher is not None and self._watcher.is_alive():
+            return
+        self._stop_event.clear()
+        self._watcher = threading.Thread(target=self._watch, name="rag-index-watcher", daemon=True)
+        self._watcher.start()
+
+    def stop_watching(self):
+        self._stop_event.set()
+        if self._watcher is not None:
+            self._watcher.join(timeout=self.watch_interval)
+            self._watcher = None
+
+    def _watch(self):
+        while not self._stop_event.wait(self.watch_interval):
+            try:
+                self.reload()
+            except Exception as e:
+                # Keep serving the current version; the next poll retries
+                print(f"Failed to reload FAISS index: {e}")
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_engine():
+    """Return the shared engine, building it on first use."""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                engine = RAGEngine()
+                engine.start_watching()
+                _engine = engine
+    return _engine
@@ -0,0 +1,114 @@
+import threading
+from collections import namedtuple
+import numpy as np
+from scripts import config
+
+# accepted: kept on their local score alone; uncertain: sent to the remote reranker to fill the
+# remaining slots. A plan with no uncertain candidates needs no remote call.
+CascadePlan = namedtuple("CascadePlan", ["accepted", "uncertain", "slots"])
+
+
+class DenseScorer:
+    """The candidates' own dense retrieval scores, so scoring makes no remote calls.
+
+    Retrieval leaves each candidate's FAISS L2 distance in metadata["score"]; it is negated so
+    higher is better. A candidate without one (a lexical hit the index could not reach) ranks last.
+    """
+
+    name = "dense"
+
+    def score(self, query, documents, query_vector=None):
+        distances = [doc.metadata.get("score") for doc in documents]
+        known = [distance for distance in distances if distance is not None]
+        worst = max(known) if known else 0.0
+        return -np.asarray([worst if distance is None else distance for distance in distances], dtype=np.float64)
+
+
+class CrossEncoderScorer:
+    """A small sentence-transformers cross-encoder run on the CPU."""
+
+    name = "cross_encoder"
+
+    def __init__(self, model_name=None):
+        # Imported here so the dense scorer works without torch installed
+        from sentence_transformers import CrossEncoder
+        self.model = CrossEncoder(model_name or config.RERANK_CASCADE_MODEL, device="cpu")
+
+    def score(self, query, documents, query_vector=None):
+        return np.asarray(self.model.predict([(query, doc.page_content) for doc in documents]), dtype=np.float32)
+
+
+class RerankCascade:
+    """Cheap local scoring that decides how much of the candidate list the remote reranker sees.
+
+    Local scores are standardized over the candidates. If the top_n-th candidate is at least
+    skip_margin standard deviations ahead of the next one, the local order is final and the
+    remote call is skipped. Otherwise candidates scoring accept_z or more keep their place,
+    those under reject_z are dropped, and only the rest goes to the remote reranker.
+    """
+
+    def __init__(self, scorer=None, top_n=None, max_candidates=None, skip_margin=None, accept_z=None, reject_z=None):
+        scorer = scorer or config.RERANK_CASCADE_SCORER
+        self.scorer = CrossEncoderScorer() if scorer == "cross_encoder" else DenseScorer()
+        self.top_n = top_n or config.RERANK_TOP_N
+        self.max_candidates = max_candidates or config.RERANK_CASCADE_CANDIDATES
+        self.skip_margin = config.RERANK_CASCADE_SKIP_MARGIN if skip_margin is None else skip_margin
+        self.accept_z = config.RERANK_CASCADE_ACCEPT_Z if accept_z is None else accept_z
+        self.reject_z = config.RERANK_CASCADE_REJECT_Z if reject_z is None else reject_z
+        self.queries = 0
+        self.remote_calls = 0
+        self.remote_skipped = 0
+        self.documents_sent = 0
+        self._lock = threading.Lock()
+
+    def plan(self, query, candidates, query_vector=None):
+        scores = np.asarray(self.scorer.score(query, candidates, query_vector), dtype=np.float64)
+        order = np.argsort(-scores, kind="stable")[:self.max_candidates]
+        ranked = []
+        for i in order:
+            doc = candidates[i]
+            doc.metadata["cascade_score"] = round(float(scores[i]), 4)
+            ranked.append(doc)
+        scores = scores[order]
+        spread = scores.std()
+        z = (scores - scores.mean()) / spread if spread > 0 else np.zeros(len(scores))
+
+        top_n = self.top_n
+        if len(ranked) <= top_n or z[top_n - 1] - z[top_n] >= self.skip_margin:
+            accepted, uncertain = ranked[:top_n], []
+        else:
+            accepted = []
+            while len(accepted) < top_n and z[len(accepted)] >= self.accept_z:
+                accepted.append(ranked[len(accepted)])
+            uncertain = [doc for doc, score in zip(ranked[len(accepted):], z[len(accepted):]) if score >= self.reject_z]
+            # Nothing left to choose between
+            if len(uncertain) <= top_n - len(accepted):
+                accepted, uncertain = accepted + uncertain, []
+        for doc in accepted:
+            doc.metadata["rerank_stage"] = "local"
+
+        with self._lock:
+            self.queries += 1
+            if uncertain:
+                self.remote_calls += 1
+                self.documents_sent += len(uncertain)
+            else:
+                self.remote_skipped += 1
+        return CascadePlan(accepted, uncertain, top_n - len(accepted))
+
+    def merge(self, plan, reranked):
+        """Final documents: the accepted ones in local order, then the reranker's picks for the open slots."""
+        reranked = list(reranked)[:plan.slots]
+        for doc in reranked:
+            doc.metadata["rerank_stage"] = "remote"
+        return plan.accepted + reranked
+
+    def stats(self):
+        return {
+            "scorer": self.scorer.name,
+            "queries": self.queries,
+            "remote_calls": self.remote_calls,
+            "remote_skipped": self.remote_skipped,
+            "skip_rate": round(self.remote_skipped / self.queries, 3) if self.queries else 0.0,
+            "avg_documents_sent": round(self.documents_sent / self.remote_calls, 1) if self.remote_calls else 0.0,
+        }
@@ -0,0 +1,172 @@
+import os
+import re
+from collections import namedtuple
+from datetime import date
+import faiss
+import numpy as np
+from langchain.docstore.document import Document
+from scripts import config
+from scripts.preprocess import parse_transcript_metadata
+from scripts.bm25_index import BM25Index, BM25_INDEX_FILE, reciprocal_rank_fusion
+from scripts.faiss_index import search_parameters
+
+# Restricts a search to some companies and/or a call-date range (ISO strings, inclusive)
+SearchFilter = namedtuple("SearchFilter", ["companies", "start_date", "end_date"], defaults=(None, None, None))
+
+
+def _date_ordinal(value):
+    try:
+        return date.fromisoformat(value).toordinal()
+    except (TypeError, ValueError):
+        return 0
+
+
+class MetadataIndex:
+    """Company and call date of every vector in a FAISS index, by row, for ID-filtered search."""
+
+    def __init__(self, vectorstore):
+        companies = []
+        dates = []
+        docstore = vectorstore.docstore
+        # A chunk store hands over all metadata in one query, without loading chunk text
+        all_metadata = docstore.all_metadata() if hasattr(docstore, "all_metadata") else None
+        for position in range(vectorstore.index.ntotal):
+            chunk_id = vectorstore.index_to_docstore_id[position]
+            if all_metadata is not None:
+                metadata = all_metadata.get(chunk_id, {})
+            else:
+                doc = docstore.search(chunk_id)
+                metadata = doc.metadata if isinstance(doc, Document) else {}
+            company = metadata.get("company", "unknown")
+            call_date = metadata.get("date", "unknown")
+            if call_date == "unknown" and metadata.get("source"):
+                # Indexes built before the date fix stored "unknown"; recover it from the file name
+                company, call_date = parse_transcript_metadata(metadata["source"])
+            companies.append(company)
+            dates.append(_date_ordinal(call_date))
+
+        self.companies = sorted(set(companies))
+        self._company_codes = {company: code for code, company in enumerate(self.companies)}
+        self._row_companies = np.array([self._company_codes[c] for c in companies], dtype=np.int32)
+        self._row_dates = np.array(dates, dtype=np.int64)
+
+    def select(self, search_filter):
+        """Row ids matching the filter."""
+        return np.flatnonzero(self.mask(search_filter)).astype(np.int64)
+
+    def mask(self, search_filter):
+        mask = np.ones(len(self._row_companies), dtype=bool)
+        if search_filter.companies:
+            codes = [self._company_codes[c] for c in search_filter.companies if c in self._company_codes]
+            mask &= np.isin(self._row_companies, codes)
+        if search_filter.start_date:
+            mask &= self._row_dates >= _date_ordinal(search_filter.start_date)
+        if search_filter.end_date:
+            mask &= self._row_dates <= _date_ordinal(search_filter.end_date)
+        return mask
+
+
+def is_empty_filter(search_filter):
+    return search_filter is None or not (search_filter.companies or search_filter.start_date or search_filter.end_date)
+
+
+def parse_query_filters(query, known_companies):
+    """Derive a SearchFilter from tickers and years named in the question, e.g. "NVDA guidance in 2019"."""
+    known = set(known_companies)
+    companies = tuple(sorted({token for token in re.findall(r"\b[A-Z]{2,5}\b", query) if token in known}))
+    years = sorted({int(year) for year in re.findall(r"\b(?:19|20)\d{2}\b", query)})
+
+    start_date = f"{years[0]}-01-01" if years else None
+    end_date = f"{years[-1]}-12-31" if years else None
+    search_filter = SearchFilter(companies or None, start_date, end_date)
+    return None if is_empty_filter(search_filter) else search_filter
+
+
+def load_bm25_index(vectorstore, index_path):
+    path = os.path.join(index_path, BM25_INDEX_FILE)
+    if os.path.exists(path):
+        bm25_index = BM25Index.load(path)
+        if bm25_index.num_docs == vectorstore.index.ntotal:
+            return bm25_index
+    # Indexes saved before BM25 support (or out of sync): build it in memory
+    return BM25Index.from_vectorstore(vectorstore)
+
+
+def search_vectors(vectorstore, metadata_index, query_vector, k, search_filter=None):
+    """Nearest FAISS rows to query_vector as (positions, scores), searching only rows that pass the filter."""
+    return search_vectors_batch(vectorstore, metadata_index, [query_vector], k, search_filter)[0]
+
+
+def search_vectors_batch(vectorstore, metadata_index, query_vectors, k, search_filter=None):
+    """search_vectors for several query vectors sharing one filter, with a single FAISS call."""
+    vectors = np.asarray(query_vectors, dtype=np.float32)
+    if vectorstore._normalize_L2:
+        faiss.normalize_L2(vectors)
+
+    params = None
+    if not is_empty_filter(search_filter):
+        row_ids = metadata_index.select(search_filter)
+        if len(row_ids) == 0:
+            return [([], []) for _ in range(len(vectors))]
+        params = search_parameters(vectorstore.index, faiss.IDSelectorBatch(row_ids))
+
+    scores, positions = vectorstore.index.search(vectors, k, params=params)
+    results = []
+    for row_scores, row_positions in zip(scores, positions):
+        found = row_positions != -1
+        results.append((row_positions[found].tolist(), row_scores[found].tolist()))
+    return results
+
+
+def load_documents(vectorstore, positions, scores=None):
+    chunk_ids = [vectorstore.index_to_docstore_id[position] for position in positions]
+    docstore = vectorstore.docstore
+    # Only the hits' text is read from the chunk store, in a single query
+    docs = docstore.mget(chunk_ids) if hasattr(docstore, "mget") else [docstore.search(chunk_id) for chunk_id in chunk_ids]
+    documents = []
+    for i, doc in enumerate(docs):
+        metadata = dict(doc.metadata)
+        if scores is not None and scores[i] is not None:
+            metadata["score"] = float(scores[i])
+        # Copy, since the reranker writes its score into the metadata
+        documents.append(Document(page_content=doc.page_content, metadata=metadata))
+    return documents
+
+
+def search_documents(vectorstore, metadata_index, query_vector, k, search_filter=None, dense=None):
+    """Nearest chunks to query_vector, searching only rows that pass the filter.
+
+    dense: (positions, scores) already found for query_vector, e.g. by a batched search.
+    """
+    positions, scores = dense or search_vectors(vectorstore, metadata_index, query_vector, k, search_filter)
+    return load_documents(vectorstore, positions, scores)
+
+
+def score_rows(vectorstore, query_vector, rows):
+    """FAISS scores of query_vector against just the given rows, as {row: score}.
+
+    Rows an approximate index does not reach (e.g. IVF lists outside nprobe) are left out.
+    """
+    vectors = np.asarray([query_vector], dtype=np.float32)
+    if vectorstore._normalize_L2:
+        faiss.normalize_L2(vectors)
+    params = search_parameters(vectorstore.index, faiss.IDSelectorBatch(rows))
+    scores, positions = vectorstore.index.search(vectors, len(rows), params=params)
+    return {int(position): float(score) for position, score in zip(positions[0], scores[0]) if position != -1}
+
+
+def hybrid_search(vectorstore, metadata_index, bm25_index, query, query_vector, k, search_filter=None, dense=None, score_all=False):
+    """Dense and BM25 candidates fused by reciprocal rank; returns the top-k chunks.
+
+    Dense hits keep their FAISS score in metadata["score"]. With score_all, BM25-only hits are
+    scored against query_vector too, in one more FAISS call restricted to their rows.
+    """
+    dense_positions, dense_scores = dense or search_vectors(vectorstore, metadata_index, query_vector, config.RETRIEVAL_K, search_filter)
+    mask = None if is_empty_filter(search_filter) else metadata_index.mask(search_filter)
+    lexical_positions, _ = bm25_index.search(query, config.BM25_K, mask)
+    positions = reciprocal_rank_fusion([dense_positions, lexical_positions.tolist()], config.RRF_K)[:k]
+    scores = dict(zip(dense_positions, dense_scores))
+    missing = [position for position in positions if position not in scores]
+    if score_all and missing:
+        scores.update(score_rows(vectorstore, query_vector, missing))
+    return load_documents(vectorstore, positions, [scores.get(position) for position in positions])
@@ -0,0 +1,159 @@
+"""Local stand-in for the NVIDIA embedding, reranking and chat endpoints, for running the pipeline offline.
+
+    python scripts/stub_model_server.py --port 8008 --fail-rate 0.1
+    python scripts/stub_model_server.py --rerank-latency-ms 80 --llm-latency-ms 400
+    NVIDIA_API_BASE=http://localhost:8008/v1 NVIDIA_API_KEY=stub python scripts/embed_and_index.py
+
+Embeddings are derived from a hash of the text, so they are deterministic across runs. Rankings
+score passages by the similarity of those embeddings, and chat completions return a fixed answer.
+"""
+import sys
+import os
+import json
+import time
+import random
+import hashlib
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from scripts.config import NVIDIA_EMBEDDING_MODEL_NAME, NVIDIA_RERANKING_MODEL_NAME, LLM_MODEL_NAME
+
+EMBEDDING_DIM = 256
+
+
+def hash_embedding(text, dim=EMBEDDING_DIM):
+    # Bag of hashed words, L2-normalised, so texts sharing words land close together
+    vector = [0.0] * dim
+    for word in text.lower().split():
+        digest = hashlib.md5(word.encode("utf-8")).digest()
+        index = int.from_bytes(digest[:4], "little") % dim
+        vector[index] += 1.0 if digest[4] & 1 else -1.0
+    norm = sum(v * v for v in vector) ** 0.5 or 1.0
+    return [v / norm for v in vector]
+
+
+def stub_answer(messages):
+    prompt = " ".join(str(message.get("content", "")) for message in messages)
+    excerpts = prompt.count("[Excerpt ")
+    return f"Stub answer based on {excerpts} excerpts and {len(prompt.split())} prompt words [Excerpt 1]."
+
+
+class StubModelHandler(BaseHTTPRequestHandler):
+    server_version = "StubModelServer/1.0"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length", 0))
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def _send_stream(self, model, text):
+        # OpenAI-style Server-Sent Events, one chunk per word
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+        words = text.split(" ")
+        for i, word in enumerate(words):
+            delta = {"role": "assistant", "content": word if i == 0 else " " + word}
+            chunk = {"object": "chat.completion.chunk", "model": model, "choices": [{"index": 0, "delta": delta, "finish_reason": None}]}
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+        final = {"object": "chat.completion.chunk", "model": model, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+        self.wfile.write(f"data: {json.dumps(final)}\n\ndata: [DONE]\n\n".encode("utf-8"))
+        self.wfile.flush()
+        self.close_connection = True
+
+    def do_GET(self):
+        if self.path.rstrip("/").endswith("/models"):
+            models = [NVIDIA_EMBEDDING_MODEL_NAME, NVIDIA_RERANKING_MODEL_NAME, LLM_MODEL_NAME]
+            self._send_json(200, {"object": "list", "data": [{"id": model, "object": "model"} for model in models]})
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        payload = self._read_json()
+        with self.server.stats_lock:
+            self.server.request_count += 1
+
+        if random.random() < self.server.fail_rate:
+            self._send_json(503, {"error": "stub server: injected failure"})
+            return
+
+        path = self.path.rstrip("/")
+        endpoint = path.rsplit("/", 1)[-1]
+        latency = self.server.latency_ms.get(endpoint, 0)
+        if latency:
+            time.sleep(latency / 1000)
+
+        if path.endswith("/embeddings"):
+            texts = payload.get("input", [])
+            if isinstance(texts, str):
+                texts = [texts]
+            with self.server.stats_lock:
+                self.server.embedding_batches.append(len(texts))
+            data = [{"object": "embedding", "index": i, "embedding": hash_embedding(text)} for i, text in enumerate(texts)]
+            tokens = sum(len(text.split()) for text in texts)
+            self._send_json(200, {
+                "object": "list",
+                "model": payload.get("model", NVIDIA_EMBEDDING_MODEL_NAME),
+                "data": data,
+                "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+            })
+        elif path.endswith("/ranking"):
+            query = hash_embedding(payload.get("query", {}).get("text", ""))
+            scores = [sum(q * p for q, p in zip(query, hash_embedding(passage.get("text", "")))) for passage in payload.get("passages", [])]
+            rankings = sorted(({"index": i, "logit": score} for i, score in enumerate(scores)), key=lambda ranking: -ranking["logit"])
+            self._send_json(200, {"rankings": rankings})
+        elif path.endswith("/chat/completions"):
+            model = payload.get("model", LLM_MODEL_NAME)
+            answer = stub_answer(payload.get("messages", []))
+            if payload.get("stream"):
+                self._send_stream(model, answer)
+                return
+            tokens = len(answer.split())
+            self._send_json(200, {
+                "object": "chat.completion",
+                "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": answer}, "finish_reason": "stop"}],
+                "usage": {"completion_tokens": tokens, "total_tokens": tokens},
+            })
+        else:
+            self._send_json(404, {"error": "not found"})
+
+
+def create_server(host="127.0.0.1", port=8008, fail_rate=0.0, embed_latency_ms=0, rerank_latency_ms=0, llm_latency_ms=0):
+    server = ThreadingHTTPServer((host, port), StubModelHandler)
+    server.fail_rate = fail_rate
+    # Simulated round-trip time per endpoint
+    server.latency_ms = {"embeddings": embed_latency_ms, "ranking": rerank_latency_ms, "completions": llm_latency_ms}
+    server.request_count = 0
+    server.embedding_batches = []  # Inputs per /embeddings request that got past fail_rate
+    server.stats_lock = threading.Lock()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve deterministic stub embeddings, rankings and answers over an OpenAI-compatible API.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8008)
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="Fraction of requests answered with HTTP 503")
+    parser.add_argument("--embed-latency-ms", type=float, default=0, help="Added delay per embedding request")
+    parser.add_argument("--rerank-latency-ms", type=float, default=0, help="Added delay per ranking request")
+    parser.add_argument("--llm-latency-ms", type=float, default=0, help="Added delay per chat completion")
+    args = parser.parse_args()
+
+    server = create_server(args.host, args.port, args.fail_rate, args.embed_latency_ms, args.rerank_latency_ms, args.llm_latency_ms)
+    print(f"Stub model server listening on http://{args.host}:{args.port}/v1")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,250 @@
+import os
+import re
+import uuid
+import shutil
+import asyncio
+import hashlib
+import tarfile
+import zipfile
+from collections import namedtuple
+from python_multipart.multipart import MultipartParser, parse_options_header
+from python_multipart.exceptions import MultipartParseError
+from scripts import config
+from scripts.index_store import load_manifest
+from scripts.ingest_queue import enqueue_file, find_queued_hashes
+
+ARCHIVE_SUFFIXES = (".zip", ".tar", ".tar.gz", ".tgz")
+
+# name: the uploaded (or archive member) name; path: where it is staged
+StagedFile = namedtuple("StagedFile", ["name", "path", "sha256", "size"])
+
+
+class UploadError(Exception):
+    """The whole upload is refused with status_code; nothing from it is kept."""
+
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def safe_relative_path(name):
+    """Where an uploaded name is stored under UPLOAD_DIR: the file name and at most one folder above it.
+
+    Keeping the folder lets archives of Transcripts/<TICKER>/ folders keep their ticker; anything
+    that could escape UPLOAD_DIR ("..", absolute paths, odd characters) is dropped or replaced.
+    """
+    parts = [re.sub(r"[^A-Za-z0-9._-]", "_", part) for part in re.split(r"[\\/]+", name)]
+    parts = [part for part in parts if part.strip(".")]
+    return os.path.join(*parts[-2:]) if parts else None
+
+
+class UploadStager:
+    """Writes the transcripts of one upload request into a private staging directory.
+
+    Content is hashed and size-checked block by block as it arrives, so nothing is held in
+    memory and oversized files are refused before they are written out in full.
+    """
+
+    def __init__(self):
+        self.directory = os.path.join(config.UPLOAD_DIR, ".incoming", uuid.uuid4().hex)
+        os.makedirs(self.directory)
+        self.files = []
+        self.archives = []
+        self.rejected = []
+        self.extracted_bytes = 0
+        self._name = None
+        self._file = None
+        self._digest = None
+        self._size = 0
+        self._max_size = 0
+        self._header_field = b""
+        self._header_value = b""
+        self._disposition = b""
+
+    def begin(self, name, max_size):
+        if len(self.files) + len(self.archives) >= config.UPLOAD_MAX_FILES:
+            raise UploadError(f"Too many files; at most {config.UPLOAD_MAX_FILES} per upload.", 413)
+        self._name = name
+        self._file = open(os.path.join(self.directory, uuid.uuid4().hex), "wb")
+        self._digest = hashlib.sha256()
+        self._size = 0
+        self._max_size = max_size
+
+    def write(self, data):
+        if self._file is None:
+            return
+        self._size += len(data)
+        if self._size > self._max_size:
+            self._discard(f"larger than the {self._max_size >> 20} MB limit")
+            return
+        self._digest.update(data)
+        self._file.write(data)
+
+    def end(self):
+        if self._file is None:
+            return None
+        self._file.close()
+        staged = StagedFile(self._name, self._file.name, self._digest.hexdigest(), self._size)
+        self._file = None
+        return staged
+
+    def _discard(self, reason):
+        self._file.close()
+        os.remove(self._file.name)
+        self._file = None
+        self.rejected.append({"filename": self._name, "status": "rejected", "reason": reason})
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    # Multipart parser callbacks
+
+    def on_part_begin(self):
+        self._disposition = b""
+
+    def on_header_field(self, data, start, end):
+        self._header_field += data[start:end]
+
+    def on_header_value(self, data, start, end):
+        self._header_value += data[start:end]
+
+    def on_header_end(self):
+        if self._header_field.lower() == b"content-disposition":
+            self._disposition = self._header_value
+        self._header_field = b""
+        self._header_value = b""
+
+    def on_headers_finished(self):
+        _, options = parse_options_header(self._disposition)
+        name = options.get(b"filename")
+        if name is None:
+            # A plain form field; its value is not needed
+            return
+        name = name.decode("utf-8", "replace")
+        lower_name = name.lower()
+        if lower_name.endswith(".txt"):
+            self.begin(name, config.UPLOAD_MAX_FILE_BYTES)
+        elif lower_name.endswith(ARCHIVE_SUFFIXES):
+            self.begin(name, config.UPLOAD_MAX_REQUEST_BYTES)
+        else:
+            self.rejected.append({"filename": name, "status": "rejected", "reason": "only .txt transcripts and .zip/.tar archives are accepted"})
+
+    def on_part_data(self, data, start, end):
+        self.write(data[start:end])
+
+    def on_part_end(self):
+        staged = self.end()
+        if staged is None:
+            return
+        if staged.name.lower().endswith(".txt"):
+            self.files.append(staged)
+        else:
+            self.archives.append(staged)
+
+    def callbacks(self):
+        return {
+            "on_part_begin": self.on_part_begin,
+            "on_header_field": self.on_header_field,
+            "on_header_value": self.on_header_value,
+            "on_header_end": self.on_header_end,
+            "on_headers_finished": self.on_headers_finished,
+            "on_part_data": self.on_part_data,
+            "on_part_end": self.on_part_end,
+        }
+
+    # Archives
+
+    def _extract_member(self, source, name, declared_size):
+        if declared_size > config.UPLOAD_MAX_FILE_BYTES:
+            self.rejected.append({"filename": name, "status": "rejected", "reason": f"larger than the {config.UPLOAD_MAX_FILE_BYTES >> 20} MB limit"})
+            return
+        self.begin(name, config.UPLOAD_MAX_FILE_BYTES)
+        # Sizes in archive headers can lie, so the unpacked bytes are counted as they are written
+        for block in iter(lambda: source.read(config.UPLOAD_CHUNK_BYTES), b""):
+            self.extracted_bytes += len(block)
+            if self.extracted_bytes > config.UPLOAD_MAX_EXTRACTED_BYTES:
+                raise UploadError(f"Archives unpack to more than {config.UPLOAD_MAX_EXTRACTED_BYTES >> 20} MB.", 413)
+            self.write(block)
+            if self._file is None:
+                return
+        self.files.append(self.end())
+
+    def extract_archives(self):
+        """Stage the .txt members of every uploaded archive, then drop the archives."""
+        for archive in self.archives:
+            try:
+                if archive.name.lower().endswith(".zip"):
+                    with zipfile.ZipFile(archive.path) as zip_file:
+                        for info in zip_file.infolist():
+                            if not info.is_dir() and info.filename.lower().endswith(".txt"):
+                                with zip_file.open(info) as source:
+                                    self._extract_member(source, f"{archive.name}/{info.filename}", info.file_size)
+                else:
+                    with tarfile.open(archive.path, "r:*") as tar_file:
+                        for member in tar_file:
+                            # Regular files only; links could point outside the archive
+                            if member.isfile() and member.name.lower().endswith(".txt"):
+                                self._extract_member(tar_file.extractfile(member), f"{archive.name}/{member.name}", member.size)
+            except (zipfile.BadZipFile, tarfile.TarError, EOFError, OSError) as e:
+                self.rejected.append({"filename": archive.name, "status": "rejected", "reason": f"unreadable archive: {e}"})
+            os.remove(archive.path)
+        self.archives = []
+
+
+def queue_staged_files(stager):
+    """Move new transcripts into UPLOAD_DIR and queue them; content already indexed or queued is skipped."""
+    manifest = load_manifest(config.FAISS_INDEX_PATH) or {"files": {}}
+    known = {entry["hash"]: path for path, entry in manifest["files"].items()}
+    known.update(find_queued_hashes([staged.sha256 for staged in stager.files]))
+
+    results = list(stager.rejected)
+    for staged in stager.files:
+        relative_path = safe_relative_path(staged.name)
+        if staged.sha256 in known:
+            results.append({"filename": staged.name, "status": "duplicate", "duplicate_of": known[staged.sha256]})
+            continue
+        if relative_path is None:
+            results.append({"filename": staged.name, "status": "rejected", "reason": "invalid file name"})
+            continue
+        file_path = os.path.join(config.UPLOAD_DIR, relative_path)
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        os.replace(staged.path, file_path)
+        job_id = enqueue_file(file_path, staged.sha256)
+        known[staged.sha256] = file_path
+        results.append({"filename": staged.name, "status": "queued", "job_id": job_id, "path": file_path, "bytes": staged.size})
+    return results
+
+
+async def receive_uploads(request):
+    """Stream a multipart upload of transcripts and archives to disk and queue the new transcripts.
+
+    Returns one result per file. Limits are checked while the body streams in; if the request
+    breaks one, UploadError is raised and nothing from the request is kept.
+    """
+    content_length = request.headers.get("content-length")
+    if content_length and int(content_length) > config.UPLOAD_MAX_REQUEST_BYTES:
+        raise UploadError(f"Upload larger than the {config.UPLOAD_MAX_REQUEST_BYTES >> 20} MB limit.", 413)
+    _, params = parse_options_header(request.headers.get("content-type", ""))
+    if b"boundary" not in params:
+        raise UploadError("Expected a multipart/form-data upload.")
+
+    stager = UploadStager()
+    try:
+        parser = MultipartParser(params[b"boundary"], stager.callbacks())
+        received = 0
+        async for chunk in request.stream():
+            received += len(chunk)
+            if received > config.UPLOAD_MAX_REQUEST_BYTES:
+                raise UploadError(f"Upload larger than the {config.UPLOAD_MAX_REQUEST_BYTES >> 20} MB limit.", 413)
+            # File writes happen in the parser callbacks; keep them off the event loop
+            await asyncio.to_thread(parser.write, chunk)
+        parser.finalize()
+        await asyncio.to_thread(stager.extract_archives)
+        return await asyncio.to_thread(queue_staged_files, stager)
+    except MultipartParseError as e:
+        raise UploadError(f"Invalid multipart upload: {e}") from None
+    finally:
+        stager.close()
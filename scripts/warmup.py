@@ -0,0 +1,113 @@
+import time
+import threading
+from contextlib import contextmanager
+from scripts import config
+
+
+class NotReadyError(Exception):
+    """The shared engine is still loading, or could not be loaded yet."""
+
+
+class Warmup:
+    """Builds the shared RAG engine on a background thread so the process can answer probes at once.
+
+    The LangChain, NVIDIA endpoint and FAISS imports, the index load and the optional
+    WARMUP_QUERY all happen here rather than at import time or on the first request.
+    If the engine cannot be built (usually because there is no index yet), it is retried
+    every WARMUP_RETRY_SECONDS until it can.
+    """
+
+    def __init__(self, started=None):
+        # perf_counter() at the moment the importing module started loading
+        self.started = started if started is not None else time.perf_counter()
+        self.phase = "pending"
+        self.steps = {}
+        self.error = None
+        self.attempts = 0
+        self.ready_seconds = None
+        self._engine = None
+        self._ready = threading.Event()
+        self._attempted = threading.Event()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    @property
+    def ready(self):
+        return self._ready.is_set()
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="rag-warmup", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def wait(self, timeout=None):
+        """Block until the engine is ready or the first attempt to build it failed. Returns whether it is ready."""
+        self._attempted.wait(timeout)
+        return self.ready
+
+    def engine(self):
+        if not self.ready:
+            if self.error is not None:
+                raise NotReadyError(f"The RAG engine is not loaded: {self.error}")
+            raise NotReadyError("The RAG engine is still warming up, try again shortly.")
+        return self._engine
+
+    @contextmanager
+    def _step(self, name):
+        self.phase = name
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.steps[name] = round(time.perf_counter() - start, 3)
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            self.attempts += 1
+            try:
+                with self._step("import"):
+                    from scripts.rag_engine import get_engine
+                with self._step("load_engine"):
+                    engine = get_engine()
+                break
+            except Exception as e:
+                self.error = e
+                self.phase = "waiting"
+                print(f"RAG engine not loaded (attempt {self.attempts}), retrying in {config.WARMUP_RETRY_SECONDS:.0f}s: {e}")
+                self._attempted.set()
+                self._stop_event.wait(config.WARMUP_RETRY_SECONDS)
+        else:
+            return
+
+        if config.WARMUP_QUERY:
+            try:
+                with self._step("warmup_query"):
+                    engine.warmup(config.WARMUP_QUERY)
+            except Exception as e:
+                # The index is loaded; a model endpoint that is down shows up on real queries too
+                print(f"Warmup query failed: {e}")
+
+        self._engine = engine
+        self.error = None
+        self.ready_seconds = time.perf_counter() - self.started
+        self.phase = "ready"
+        self._ready.set()
+        self._attempted.set()
+        steps = ", ".join(f"{name} {seconds:.2f}s" for name, seconds in self.steps.items())
+        print(f"RAG engine ready {self.ready_seconds:.2f}s after import ({steps})")
+
+    def status(self):
+        return {
+            "ready": self.ready,
+            "phase": self.phase,
+            "steps": dict(self.steps),
+            "attempts": self.attempts,
+            "error": str(self.error) if self.error is not None else None,
+            "ready_seconds": round(self.ready_seconds, 3) if self.ready_seconds is not None else None,
+            "uptime_seconds": round(time.perf_counter() - self.started, 3),
+        }
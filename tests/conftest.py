@@ -0,0 +1,27 @@
+import os
+import sys
+import threading
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from scripts.stub_model_server import create_server
+
+
+@pytest.fixture
+def stub_server():
+    """The stub model server on a free local port, serving from a background thread."""
+    server = create_server(port=0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    server.base_url = f"http://127.0.0.1:{server.server_address[1]}/v1"
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def stub_embeddings(stub_server):
+    from langchain_nvidia_ai_endpoints import NVIDIAEmbeddings
+    from scripts.config import NVIDIA_EMBEDDING_MODEL_NAME
+    return NVIDIAEmbeddings(model=NVIDIA_EMBEDDING_MODEL_NAME, api_key="stub", base_url=stub_server.base_url, truncate="NONE")
@@ -0,0 +1,65 @@
+import zlib
+import multiprocessing
+import numpy as np
+from scripts.embedding_cache import EmbeddingCache
+
+NAMESPACE = "test-model:passage"
+
+
+def vectors_for(texts, dim=8):
+    # A distinct, recognisable row per text
+    return np.asarray([[zlib.crc32(text.encode()) % 1000 + i for i in range(dim)] for text in texts], dtype=np.float32)
+
+
+def test_reader_started_before_the_store_existed(tmp_path):
+    reader = EmbeddingCache(str(tmp_path), NAMESPACE)
+    writer = EmbeddingCache(str(tmp_path), NAMESPACE, dtype="float16")
+    texts = ["alpha", "beta"]
+    writer.put_many(texts, vectors_for(texts))
+
+    cached = reader.get_many(texts + ["gamma"])
+
+    assert cached[2] is None
+    np.testing.assert_array_equal(np.vstack(cached[:2]), vectors_for(texts))
+    # dtype comes from the store, not the reader's default
+    assert reader.dtype == np.float16
+
+
+def append(directory, worker):
+    cache = EmbeddingCache(directory, NAMESPACE)
+    for batch in range(20):
+        texts = [f"worker {worker} batch {batch} text {i}" for i in range(5)]
+        cache.put_many(texts, vectors_for(texts))
+
+
+def test_concurrent_appends_keep_rows_aligned(tmp_path):
+    processes = [multiprocessing.Process(target=append, args=(str(tmp_path), worker)) for worker in range(4)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+        assert process.exitcode == 0
+
+    texts = [f"worker {worker} batch {batch} text {i}" for worker in range(4) for batch in range(20) for i in range(5)]
+    cache = EmbeddingCache(str(tmp_path), NAMESPACE)
+    assert len(cache) == len(texts)
+    np.testing.assert_array_equal(np.vstack(cache.get_many(texts)), vectors_for(texts))
+
+
+def test_append_after_torn_write(tmp_path):
+    cache = EmbeddingCache(str(tmp_path), NAMESPACE)
+    cache.put_many(["a", "b"], vectors_for(["a", "b"]))
+    # A crash between the two writes: vectors for "x" and half of its key, but no complete key
+    with open(cache.vectors_path, "ab") as f:
+        f.write(vectors_for(["x"]).tobytes())
+    with open(cache.keys_path, "ab") as f:
+        f.write(EmbeddingCache.key("x")[:7])
+
+    writer = EmbeddingCache(str(tmp_path), NAMESPACE)
+    writer.put_many(["c"], vectors_for(["c"]))
+
+    reader = EmbeddingCache(str(tmp_path), NAMESPACE)
+    texts = ["a", "b", "c", "x"]
+    cached = reader.get_many(texts)
+    assert cached[3] is None
+    np.testing.assert_array_equal(np.vstack(cached[:3]), vectors_for(texts[:3]))
@@ -0,0 +1,51 @@
+import os
+import pytest
+from langchain_community.embeddings import FakeEmbeddings
+from langchain_community.vectorstores import FAISS
+from scripts import config
+from scripts.index_store import save_vectorstore, load_index, read_published_index, INDEX_VERSIONS_DIR
+
+EMBEDDINGS = FakeEmbeddings(size=8)
+
+
+def build(texts):
+    return FAISS.from_texts(texts, EMBEDDINGS, metadatas=[{"source": text} for text in texts])
+
+
+def test_each_save_is_a_new_version_directory(tmp_path):
+    index_path = str(tmp_path)
+    first = save_vectorstore(build(["alpha", "beta"]), index_path)
+    first_dir = read_published_index(index_path)[1]
+    first_files = {name: os.path.getmtime(os.path.join(first_dir, name)) for name in os.listdir(first_dir)}
+
+    second = save_vectorstore(build(["alpha", "beta", "gamma"]), index_path)
+
+    version, second_dir = read_published_index(index_path)
+    assert version == second != first
+    assert second_dir == os.path.join(index_path, INDEX_VERSIONS_DIR, second)
+    # A process still serving the first version keeps a complete, unmodified set of files
+    assert {name: os.path.getmtime(os.path.join(first_dir, name)) for name in os.listdir(first_dir)} == first_files
+    assert load_index(first_dir, EMBEDDINGS).index.ntotal == 2
+    assert load_index(index_path, EMBEDDINGS).index.ntotal == 3
+
+
+def test_old_versions_are_removed(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "INDEX_KEEP_VERSIONS", 2)
+    index_path = str(tmp_path)
+    versions = [save_vectorstore(build(["alpha", f"text {i}"]), index_path) for i in range(4)]
+    # An interrupted save leaves a staging directory behind
+    os.makedirs(os.path.join(index_path, INDEX_VERSIONS_DIR, "interrupted.staging"))
+    versions.append(save_vectorstore(build(["alpha", "beta"]), index_path))
+
+    assert sorted(os.listdir(os.path.join(index_path, INDEX_VERSIONS_DIR))) == versions[-2:]
+
+
+def test_mismatched_files_are_rejected(tmp_path):
+    index_path = str(tmp_path)
+    save_vectorstore(build(["alpha", "beta"]), index_path)
+    save_vectorstore(build(["alpha", "beta", "gamma"]), index_path)
+    old_dir, new_dir = sorted(os.path.join(index_path, INDEX_VERSIONS_DIR, name) for name in os.listdir(os.path.join(index_path, INDEX_VERSIONS_DIR)))
+    os.replace(os.path.join(old_dir, "index.faiss"), os.path.join(new_dir, "index.faiss"))
+
+    with pytest.raises(ValueError):
+        load_index(index_path, EMBEDDINGS)
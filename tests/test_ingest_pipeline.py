@@ -0,0 +1,76 @@
+import random
+import numpy as np
+import pytest
+from scripts import config
+from scripts.ingest_pipeline import embed_documents_batched
+from scripts.stub_model_server import hash_embedding
+
+TEXTS = [f"chunk {i} revenue guidance for quarter {i % 4}" for i in range(30)]
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(config, "EMBED_RETRY_BACKOFF_SECONDS", 0.0)
+
+
+def test_batches_are_sized_and_ordered(stub_server, stub_embeddings, tmp_path):
+    vectors = embed_documents_batched(TEXTS, stub_embeddings, batch_size=7, max_workers=3, checkpoint_dir=str(tmp_path))
+
+    assert sorted(stub_server.embedding_batches) == [2, 7, 7, 7, 7]
+    assert vectors.dtype == np.float32
+    np.testing.assert_allclose(vectors, np.asarray([hash_embedding(text) for text in TEXTS]), rtol=1e-5, atol=1e-6)
+
+
+def test_failed_batches_are_retried(stub_server, stub_embeddings, tmp_path, monkeypatch):
+    random.seed(0)
+    stub_server.fail_rate = 0.5
+    monkeypatch.setattr(config, "EMBED_MAX_RETRIES", 20)
+
+    vectors = embed_documents_batched(TEXTS, stub_embeddings, batch_size=5, max_workers=2, checkpoint_dir=str(tmp_path))
+
+    assert len(stub_server.embedding_batches) == 6
+    assert stub_server.request_count > 6
+    np.testing.assert_allclose(vectors, np.asarray([hash_embedding(text) for text in TEXTS]), rtol=1e-5, atol=1e-6)
+
+
+def test_failure_after_retries_is_raised(stub_server, stub_embeddings, tmp_path, monkeypatch):
+    stub_server.fail_rate = 1.0
+    monkeypatch.setattr(config, "EMBED_MAX_RETRIES", 2)
+
+    with pytest.raises(Exception):
+        embed_documents_batched(TEXTS[:5], stub_embeddings, batch_size=5, max_workers=1, checkpoint_dir=str(tmp_path))
+    assert stub_server.request_count == 3
+
+
+class Interrupted(Exception):
+    pass
+
+
+class InterruptAfter:
+    """Embeds through the wrapped model, then fails every call after the first `calls`."""
+
+    def __init__(self, embedding_model, calls):
+        self.embedding_model = embedding_model
+        self.model = embedding_model.model
+        self.calls = calls
+
+    def embed_documents(self, texts):
+        if self.calls <= 0:
+            raise Interrupted("run interrupted")
+        self.calls -= 1
+        return self.embedding_model.embed_documents(texts)
+
+
+def test_interrupted_run_resumes_from_checkpoint(stub_server, stub_embeddings, tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "EMBED_MAX_RETRIES", 0)
+    checkpoint_dir = str(tmp_path)
+
+    with pytest.raises(Interrupted):
+        embed_documents_batched(TEXTS, InterruptAfter(stub_embeddings, 3), batch_size=5, max_workers=1, checkpoint_dir=checkpoint_dir)
+    assert len(stub_server.embedding_batches) == 3
+
+    vectors = embed_documents_batched(TEXTS, stub_embeddings, batch_size=5, max_workers=1, checkpoint_dir=checkpoint_dir)
+
+    # Only the three batches the first run never finished are sent again
+    assert len(stub_server.embedding_batches) == 6
+    np.testing.assert_allclose(vectors, np.asarray([hash_embedding(text) for text in TEXTS]), rtol=1e-5, atol=1e-6)
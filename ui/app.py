@@ -5,8 +5,9 @@ import os
 # --- Setup and Imports ---
 # Add project root to the Python path
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
-from scripts.rag_chain import get_rag_chain
-from scripts.db_manager import init_db, add_user, get_user, create_chat_session, get_chat_sessions, add_chat_message, get_chat_messages, delete_chat_session, clear_chat_messages
+from scripts.warmup import Warmup
+from scripts.db_manager import init_db, add_user, get_user, create_chat_session, get_chat_sessions_page, add_chat_messages, get_chat_messages_page, delete_chat_session, clear_chat_messages
+from scripts.config import CHAT_HISTORY_PAGE_SIZE, CHAT_SESSIONS_PAGE_SIZE
 
 # --- Page Configuration ---
 st.set_page_config(page_title="Enterprise Doc Master", page_icon="🔮", layout="wide")
@@ -16,25 +17,58 @@ init_db()
 
 # --- Helper Functions ---
 @st.cache_resource
+def start_warmup():
+    """Start loading the shared RAG engine in the background, so it loads while the login page is shown."""
+    warmup = Warmup()
+    warmup.start()
+    return warmup
+
 def load_rag_chain():
-    """Load and cache the RAG chain, handling potential errors."""
-    try:
-        return get_rag_chain()
-    except FileNotFoundError as e:
-        st.error(f"Error: {e}. Please run `embed_and_index.py` to create the vector index.")
-        return None
-    except Exception as e:
-        st.error(f"An unexpected error occurred while loading the RAG chain: {e}")
-        return None
+    """Wait for the shared RAG engine, handling potential errors."""
+    warmup = start_warmup()
+    with st.spinner("Loading the knowledge base..."):
+        if warmup.wait():
+            return warmup.engine()
+    if isinstance(warmup.error, FileNotFoundError):
+        st.error(f"Error: {warmup.error}. Please run `embed_and_index.py` to create the vector index.")
+    else:
+        st.error(f"An unexpected error occurred while loading the RAG chain: {warmup.error}")
+    return None
 
 def logout():
     """Clear session state variables to log the user out."""
-    keys_to_delete = ["logged_in", "user_id", "username", "current_session_id", "messages"]
+    keys_to_delete = ["logged_in", "user_id", "username", "current_session_id", "messages", "history_cursor", "visible_messages", "session_pages"]
     for key in keys_to_delete:
         if key in st.session_state:
             del st.session_state[key]
     st.rerun()
 
+def open_session(session_id):
+    """Make session_id current, loading only its newest page of messages."""
+    st.session_state.current_session_id = session_id
+    history, st.session_state.history_cursor = get_chat_messages_page(session_id, CHAT_HISTORY_PAGE_SIZE)
+    st.session_state.messages = [{"role": sender, "content": message} for sender, message, timestamp in history]
+    st.session_state.visible_messages = CHAT_HISTORY_PAGE_SIZE
+
+def load_earlier_messages():
+    """Show one more page of the current session, reading it from the database if not loaded yet."""
+    st.session_state.visible_messages += CHAT_HISTORY_PAGE_SIZE
+    missing = st.session_state.visible_messages - len(st.session_state.messages)
+    if missing > 0 and st.session_state.history_cursor is not None:
+        history, st.session_state.history_cursor = get_chat_messages_page(
+            st.session_state.current_session_id, missing, st.session_state.history_cursor)
+        st.session_state.messages = [{"role": sender, "content": message} for sender, message, timestamp in history] + st.session_state.messages
+
+def load_sessions(user_id, pages):
+    """The user's newest sessions, pages * CHAT_SESSIONS_PAGE_SIZE at most, and whether more exist."""
+    sessions, cursor = get_chat_sessions_page(user_id, CHAT_SESSIONS_PAGE_SIZE)
+    for _ in range(pages - 1):
+        if cursor is None:
+            break
+        page, cursor = get_chat_sessions_page(user_id, CHAT_SESSIONS_PAGE_SIZE, cursor)
+        sessions += page
+    return sessions, cursor is not None
+
 # --- UI Rendering Functions ---
 
 def render_login_page():
@@ -93,11 +127,12 @@ def render_main_app():
         st.header("Chat Sessions")
 
         if st.button("➕ New Chat"):
-            st.session_state.current_session_id = create_chat_session(st.session_state.user_id, None)
-            st.session_state.messages = []
+            open_session(create_chat_session(st.session_state.user_id, None))
             st.rerun()
 
-        sessions = get_chat_sessions(st.session_state.user_id)
+        if "session_pages" not in st.session_state:
+            st.session_state.session_pages = 1
+        sessions, more_sessions = load_sessions(st.session_state.user_id, st.session_state.session_pages)
         if sessions:
             # Create a mapping from a display name to session ID
             session_options = {s[0]: f"Session {s[0]} - {s[2].split(' ')[0]}" for s in sessions}
@@ -107,11 +142,7 @@ def render_main_app():
                 session_id = st.session_state["session_selector"]
                 # Only reload if the session has actually changed
                 if "current_session_id" not in st.session_state or st.session_state.current_session_id != session_id:
-                    st.session_state.current_session_id = session_id
-                    st.session_state.messages = []
-                    history = get_chat_messages(session_id)
-                    for sender, message, timestamp in history:
-                        st.session_state.messages.append({"role": sender, "content": message})
+                    open_session(session_id)
 
             # Use selectbox for session selection
             selected_session_display = st.selectbox(
@@ -121,8 +152,12 @@ def render_main_app():
                 key="session_selector",
                 on_change=on_session_change
             )
+            if more_sessions and st.button("Show older sessions"):
+                st.session_state.session_pages += 1
+                st.rerun()
             # Add a delete session button
             if st.button("Delete Selected Session"): 
+                selected_session_id = selected_session_display
                 if selected_session_id:
                     delete_chat_session(selected_session_id)
                     st.session_state.messages = []
@@ -140,6 +175,7 @@ def render_main_app():
         if st.button("Clear Current Chat"): 
             clear_chat_messages(st.session_state.current_session_id)
             st.session_state.messages = []
+            st.session_state.history_cursor = None
             st.success("Chat history cleared for this session.")
             st.rerun()
 
@@ -151,7 +187,14 @@ def render_main_app():
         if "messages" not in st.session_state:
             st.session_state.messages = []
 
-        for message in st.session_state.messages:
+        if "visible_messages" not in st.session_state:
+            st.session_state.visible_messages = CHAT_HISTORY_PAGE_SIZE
+            st.session_state.history_cursor = None
+        # Only the newest page is rendered on each rerun; older messages load on request
+        if len(st.session_state.messages) > st.session_state.visible_messages or st.session_state.history_cursor is not None:
+            st.button("⬆️ Load earlier messages", on_click=load_earlier_messages)
+
+        for message in st.session_state.messages[-st.session_state.visible_messages:]:
             with st.chat_message(message["role"]):
                 st.markdown(message["content"])
 
@@ -159,28 +202,33 @@ def render_main_app():
         if query := st.chat_input("Ask about the earnings calls..."):
             # Add and display user message
             st.session_state.messages.append({"role": "user", "content": query})
-            add_chat_message(st.session_state.current_session_id, "user", query)
             with st.chat_message("user"):
                 st.markdown(query)
 
-            # Get and display assistant response
+            # Get and display assistant response, token by token
             with st.chat_message("assistant"):
-                with st.spinner("Entity is thinking..."):
-                    try:
-                        result = rag_chain.invoke({"query": query})
-                        full_response = result.get("result", "Sorry, I couldn't find an answer.")
-                    except Exception as e:
-                        full_response = f"An error occurred: {e}"
-                
-                st.markdown(full_response)
+                try:
+                    events = rag_chain.stream(query)
+                    with st.spinner("Entity is thinking..."):
+                        next(events)  # Retrieval and reranking finish before the first token
+                    tokens = (event["text"] for event in events if event["type"] == "token")
+                    full_response = st.write_stream(tokens) or "Sorry, I couldn't find an answer."
+                except Exception as e:
+                    full_response = f"An error occurred: {e}"
+                    st.markdown(full_response)
+
                 st.session_state.messages.append({"role": "assistant", "content": full_response})
-                add_chat_message(st.session_state.current_session_id, "assistant", full_response)
+                # Question and answer are written together, in one transaction
+                add_chat_messages(st.session_state.current_session_id, [("user", query), ("assistant", full_response)])
     else:
         # Welcome message when no session is selected
         st.info("⬅️ Create a new chat or select an existing one from the sidebar to get started!")
 
 
 # --- Main Application Logic ---
+# The engine starts loading on the first page view; render_main_app waits for it
+start_warmup()
+
 if "logged_in" not in st.session_state:
     st.session_state.logged_in = False
 